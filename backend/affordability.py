@@ -0,0 +1,109 @@
+"""
+Wishlist affordability.
+
+Evaluates every wishlist item in one pass against the user's projected daily balance:
+today's balance, plus recurring occurrences, future one-off transactions and active
+payable debts over the horizon. Receivables are left out, as in the client's
+safe-to-spend widget, so the projection stays conservative.
+
+An item is affordable on day d if buying it then keeps the balance at or above the
+buffer on every later day, i.e. the minimum of the balance from d onwards covers the
+cost. That suffix minimum never decreases, so the earliest day for all items at once
+is one `searchsorted`. (NumPy is imported when that runs, not when the app starts.)
+"""
+import calendar
+from datetime import date, timedelta
+import analytics, models, occurrences
+from aggregates import TransactionFilters, flow_totals, overall
+
+DEFAULT_HORIZON_DAYS = 365
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value[:10]) if value else None
+    except ValueError:
+        return None
+
+def current_balance(db, user, today):
+    totals = overall(flow_totals(db, user.id, user.currency, filters=TransactionFilters(end_date=today.isoformat())), user.currency)
+    return (user.current_balance or 0.0) + float(totals.net)
+
+def daily_balances(db, user, today, horizon_days):
+    """Projected end-of-day balance for today and the following horizon_days - 1 days."""
+    import numpy as np
+    end = today + timedelta(days=horizon_days - 1)
+    deltas = np.zeros(horizon_days)
+
+    def book(day, amount):
+        if day <= end:
+            deltas[max((day - today).days, 0)] += amount
+
+    tomorrow = today + timedelta(days=1)
+    for o in occurrences.between(db, user.id, tomorrow, end):
+        book(date.fromisoformat(o["date"]), o["amount"] if o["type"] == "income" else -o["amount"])
+
+    if horizon_days > 1:
+        frame = analytics.frame_for(db, user)
+        deltas[1:] += frame.daily(tomorrow, end, values=frame.signed())
+
+    D = models.Debt
+    payables = db.query(D.amount, D.dueDate).filter(D.user_id == user.id, D.direction == "payable", D.status == "active").all()
+    for amount, due in payables:
+        # Undated or overdue debts are treated as due now
+        book(_parse_date(due) or today, -amount)
+
+    return current_balance(db, user, today) + np.cumsum(deltas)
+
+def safe_to_spend(balances, today):
+    """Conservative daily allowance for the rest of this month, like the client widget."""
+    import numpy as np
+    days_remaining = calendar.monthrange(today.year, today.month)[1] - today.day + 1
+    # Hold back enough for the lowest point before month end, so bills due later stay covered
+    month_min = float(np.minimum.accumulate(balances[:days_remaining])[-1])
+    return max(0.0, min(month_min, float(balances[0]))) / days_remaining, days_remaining
+
+def evaluate(db, user, items, horizon_days=DEFAULT_HORIZON_DAYS, buffer=0.0, sequential=False, today=None):
+    """
+    Earliest affordable date and budget impact for every item. With `sequential`, items
+    are bought in the order given and each must be affordable on top of the earlier ones.
+    """
+    import numpy as np
+    today = today or date.today()
+    balances = daily_balances(db, user, today, horizon_days)
+    suffix_min = np.minimum.accumulate(balances[::-1])[::-1]
+    daily_safe, days_remaining = safe_to_spend(balances, today)
+
+    costs = np.array([item.cost or 0.0 for item in items])
+    needed = (np.cumsum(costs) if sequential else costs) + buffer
+    earliest = np.searchsorted(suffix_min, needed, side="left")
+
+    monthly_income = user.monthly_income or 0.0
+    results = []
+    spent = needed - buffer
+    for item, cost, total, day in zip(items, costs.tolist(), spent.tolist(), earliest.tolist()):
+        affordable = day < horizon_days
+        results.append({
+            "item_id": item.id,
+            "name": item.name,
+            "cost": cost,
+            "status": "affordable_now" if day == 0 else "affordable_later" if affordable else "not_within_horizon",
+            "earliest_date": (today + timedelta(days=day)).isoformat() if affordable else None,
+            "days_to_wait": day if affordable else None,
+            "impact": {
+                "share_of_monthly_income": round(cost / monthly_income, 4) if monthly_income else None,
+                "days_of_safe_spend": round(cost / daily_safe, 1) if daily_safe else None,
+                "safe_daily_after_purchase": round(max(0.0, daily_safe - cost / days_remaining), 2),
+                "lowest_balance_after_purchase": round(float(suffix_min[day]) - total, 2) if affordable else None,
+            },
+        })
+
+    return {
+        "currency": user.currency,
+        "balance": round(float(balances[0]), 2),
+        "safe_daily": round(daily_safe, 2),
+        "days_remaining_in_month": days_remaining,
+        "lowest_projected_balance": round(float(suffix_min[0]), 2),
+        "horizon_days": horizon_days,
+        "sequential": sequential,
+        "items": results,
+    }
@@ -0,0 +1,133 @@
+"""
+Typed ledger aggregation.
+
+Filters and totals over `models.Transaction` are pushed to the database as
+WHERE / SUM / GROUP BY. Sums are read as integer minor units (see money.py), so the
+results are exact, and are returned as `FlowTotals` carrying the currency code.
+Foreign-currency rows are converted into that currency (see fx.py); rows in a currency
+without rates are left out of the sums until its rates are loaded.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, Optional
+from sqlalchemy import Integer, case, func, type_coerce
+import fx, models
+from money import from_minor
+
+@dataclass
+class TransactionFilters:
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None # inclusive
+    categories: Optional[List[str]] = None
+    type: Optional[str] = None
+    necessity: Optional[str] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+
+    def apply(self, query):
+        T = models.Transaction
+        if self.start_date:
+            query = query.filter(T.date >= self.start_date)
+        if self.end_date:
+            # Dates may carry a time component, so compare against the start of the next day
+            try:
+                next_day = (date.fromisoformat(self.end_date[:10]) + timedelta(days=1)).isoformat()
+            except ValueError:
+                raise ValueError("end_date must be YYYY-MM-DD")
+            query = query.filter(T.date < next_day)
+        if self.categories:
+            query = query.filter(T.category.in_(self.categories))
+        if self.type:
+            query = query.filter(T.type == self.type)
+        if self.necessity:
+            query = query.filter(T.necessity == self.necessity)
+        if self.min_amount is not None:
+            query = query.filter(T.amount >= self.min_amount)
+        if self.max_amount is not None:
+            query = query.filter(T.amount <= self.max_amount)
+        return query
+
+@dataclass(frozen=True)
+class FlowTotals:
+    key: Optional[str]
+    count: int
+    income_minor: int
+    expense_minor: int
+    currency: str
+
+    @property
+    def income(self) -> Decimal:
+        return from_minor(self.income_minor)
+
+    @property
+    def expense(self) -> Decimal:
+        return from_minor(self.expense_minor)
+
+    @property
+    def net(self) -> Decimal:
+        return from_minor(self.income_minor - self.expense_minor)
+
+    def as_dict(self):
+        return {"key": self.key, "count": self.count, "income": self.income, "expense": self.expense, "net": self.net}
+
+def _group_key(group):
+    T = models.Transaction
+    keys = {
+        "category": T.category,
+        "type": T.type,
+        "month": func.substr(T.date, 1, 7),
+        "day": func.substr(T.date, 1, 10),
+    }
+    if group not in keys:
+        raise ValueError(f"Cannot group by '{group}'. Use: {', '.join(keys)}")
+    return keys[group]
+
+def flow_totals(db, user_id, currency, group=None, filters=None) -> List[FlowTotals]:
+    """Count, income and expense per group (or one overall row when group is None)."""
+    T = models.Transaction
+    # Sum the stored integers directly instead of converting every row to a float
+    minor = type_coerce(T.amount, Integer)
+    columns = [
+        func.count(T.id),
+        func.coalesce(func.sum(case((T.type == "income", minor), else_=0)), 0),
+        func.coalesce(func.sum(case((T.type == "expense", minor), else_=0)), 0),
+    ]
+    key = _group_key(group) if group else None
+    # Rows in other currencies come back summed per currency and day, to be converted
+    # at that day's rate; for rows in the user's currency both extra keys are NULL
+    foreign_day = case((T.currency.is_(None), None), else_=func.substr(T.date, 1, 10))
+    keys = ([key] if key is not None else []) + [T.currency, foreign_day]
+    query = db.query(*keys, *columns).filter(T.user_id == user_id)
+    query = (filters or TransactionFilters()).apply(query).group_by(*keys)
+    if key is not None:
+        query = query.order_by(key)
+
+    sums, foreign = {}, []
+    for row in query.all():
+        row_key, row_currency, day, count, income, expense = row if key is not None else (None, *row)
+        entry = sums.setdefault(row_key, [0, 0, 0])
+        entry[0] += count
+        if row_currency is None:
+            entry[1] += int(income)
+            entry[2] += int(expense)
+        else:
+            foreign.append((row_key, row_currency, day, int(income), int(expense)))
+    if foreign:
+        row_keys, currencies, days, incomes, expenses = zip(*foreign)
+        converted = fx.convert_minor(incomes + expenses, currencies * 2, days * 2, currency, strict=False).tolist()
+        for i, row_key in enumerate(row_keys):
+            sums[row_key][1] += converted[i]
+            sums[row_key][2] += converted[len(row_keys) + i]
+    if key is None and not sums:
+        sums[None] = [0, 0, 0]
+    return [FlowTotals(row_key, count, income, expense, currency) for row_key, (count, income, expense) in sums.items()]
+
+def overall(totals: List[FlowTotals], currency) -> FlowTotals:
+    return FlowTotals(
+        None,
+        sum(t.count for t in totals),
+        sum(t.income_minor for t in totals),
+        sum(t.expense_minor for t in totals),
+        currency,
+    )
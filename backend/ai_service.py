@@ -1,16 +1,59 @@
-import google.generativeai as genai
 import os
 import json
-from dotenv import load_dotenv
 
-load_dotenv()
+# The Gemini SDK (and google.api_core, grpc, dotenv) take most of the backend's import
+# time, so they are loaded on the first AI call instead of when the app starts.
+MODEL_NAME = 'gemini-2.5-flash'
 
-API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("VITE_GEMINI_API_KEY")
+_api_key = None
+_api_key_loaded = False
+_genai = None
 
-if not API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables.")
-else:
-    genai.configure(api_key=API_KEY)
+
+class AIQuotaExceeded(Exception):
+    """Raised when Gemini rejects a call because the quota is exhausted."""
+
+
+class GenerationFailed(Exception):
+    """Raised instead of the fallback result when the caller asks for failures (see insights.py)."""
+
+
+def get_api_key():
+    global _api_key, _api_key_loaded
+    if not _api_key_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _api_key = os.getenv("GEMINI_API_KEY") or os.getenv("VITE_GEMINI_API_KEY")
+        _api_key_loaded = True
+        if not _api_key:
+            print("Warning: GEMINI_API_KEY not found in environment variables.")
+    return _api_key
+
+
+def get_genai():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        api_key = get_api_key()
+        if api_key:
+            genai.configure(api_key=api_key)
+        _genai = genai
+    return _genai
+
+
+def preload():
+    # Eager mode: pay the SDK import cost at startup instead of on the first request
+    get_genai()
+
+
+def generate_content(contents):
+    from google.api_core.exceptions import ResourceExhausted
+
+    model = get_genai().GenerativeModel(MODEL_NAME)
+    try:
+        return model.generate_content(contents)
+    except ResourceExhausted as e:
+        raise AIQuotaExceeded() from e
 
 DATA_ANALYST_PROMPT = """
 You are an advanced financial parser. I will give you a natural language command.
@@ -89,7 +132,7 @@ IMPORTANT:
 """
 
 async def classify_transaction(text: str):
-    if not API_KEY:
+    if not get_api_key():
         raise Exception("API Key missing")
     
     import datetime
@@ -100,8 +143,7 @@ async def classify_transaction(text: str):
     # Inject today's date into prompt for relative date parsing
     formatted_prompt = DATA_ANALYST_PROMPT.replace("{today_date}", today_str)
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    response = model.generate_content([formatted_prompt, text])
+    response = generate_content([formatted_prompt, text])
     
     try:
         text_response = response.text
@@ -126,11 +168,9 @@ async def classify_transaction(text: str):
         raise Exception("Failed to classify transaction")
 
 async def analyze_purchase(query: str, context: dict):
-    if not API_KEY:
+    if not get_api_key():
         raise Exception("API Key missing")
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
     context_str = json.dumps(context)
     prompt = f"""
     You are a strict financial guard.
@@ -150,22 +190,33 @@ async def analyze_purchase(query: str, context: dict):
     Trade-off: Reduce dining out by ₹200 to stay perfectly on track.
     """
     
-    response = model.generate_content(prompt)
+    response = generate_content(prompt)
     return response.text.strip()
 
-async def generate_spending_alert(transactions: list, balance: float, recurring_plans: list):
-    if not API_KEY:
+CURRENCY_SYMBOLS = {"INR": "₹", "USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥"}
+
+def format_money(amount, currency="INR", decimals=None):
+    symbol = CURRENCY_SYMBOLS.get((currency or "INR").upper(), f"{currency} ")
+    return f"{symbol}{amount:.{decimals}f}" if decimals is not None else f"{symbol}{amount}"
+
+async def generate_spending_alert(transactions: list, balance: float, recurring_plans: list, currency: str = "INR", frame=None, raise_errors=False):
+    # `frame`: the user's columnar transactions (see analytics.py); when given, today's and
+    # upcoming spending are read from it instead of walking `transactions`.
+    # `raise_errors`: raise GenerationFailed instead of returning None when the model call fails
+    if not get_api_key():
         return None
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
     # Filter for today's transactions (assuming transactions have ISO date string)
     # In Python we might need to handle date parsing, but let's assume string matching for MVP parity
     import datetime
     today = datetime.date.today().isoformat()
     
-    todays_transactions = [t for t in transactions if t['date'].startswith(today) and t['type'] == 'expense']
-    spent_today = sum(t['amount'] for t in todays_transactions)
+    if frame is not None:
+        todays = frame.where(start=datetime.date.today(), end=datetime.date.today(), type="expense")
+        has_spending_today, spent_today = bool(todays.any()), frame.total(todays)
+    else:
+        todays_transactions = [t for t in transactions if t['date'].startswith(today) and t['type'] == 'expense']
+        has_spending_today, spent_today = bool(todays_transactions), sum(t['amount'] for t in todays_transactions)
     
     # Calculate daily safe-to-spend (Conservative: Balance - Upcoming Expenses)
     now = datetime.datetime.now()
@@ -176,84 +227,66 @@ async def generate_spending_alert(transactions: list, balance: float, recurring_
     # 1. Recurring Expenses (remaining in month)
     # We must only subtract UPCOMING recurring expenses. 
     # Past ones are assumed to be paid and already reflected in the Balance.
+    import occurrences
+    month_end = datetime.date(now.year, now.month, days_in_month)
     total_recurring = 0
-    for p in recurring_plans:
+    for p in recurring_plans or []:
         if p['type'] != 'expense':
             continue
-            
-        try:
-            expected_date_val = p.get('expectedDate')
-            # Handle "last" or "last-working"
-            if expected_date_val == 'last':
-                expected_day = days_in_month
-            elif expected_date_val == 'last-working':
-                # Simplified: just assume last day for safety in backend or 28th
-                expected_day = days_in_month
-            else:
-                expected_day = int(expected_date_val)
-            
-            # Check end date
-            if p.get('endDate'):
-                end_date = datetime.date.fromisoformat(p['endDate'])
-                # Construct this month's occurrence date
-                current_occurrence = datetime.date(now.year, now.month, expected_day)
-                if current_occurrence > end_date:
-                    continue
-
-            if expected_day > now.day:
-                total_recurring += p['amount']
-        except Exception as e:
-            print(f"Error processing recurring plan {p.get('name')}: {e}")
-            continue
+        upcoming = occurrences.dates_between(p.get('expectedDate'), p.get('endDate'), datetime.date.today() + datetime.timedelta(days=1), month_end, p.get('frequency') or 'monthly')
+        total_recurring += p['amount'] * len(upcoming)
 
     # 2. Future One-off Expenses (from transactions list)
     # We need to check if any transactions are in the future of this month
     future_one_offs = 0
-    for t in transactions:
-        try:
-            t_date = datetime.date.fromisoformat(t['date'])
-            if t['type'] == 'expense' and t_date > datetime.date.today() and t_date.month == now.month:
-                future_one_offs += t['amount']
-        except:
-            pass
+    if frame is not None:
+        future_one_offs = frame.total(frame.where(start=datetime.date.today() + datetime.timedelta(days=1), end=month_end, type="expense"))
+    else:
+        for t in transactions:
+            try:
+                t_date = datetime.date.fromisoformat(t['date'])
+                if t['type'] == 'expense' and t_date > datetime.date.today() and t_date.month == now.month:
+                    future_one_offs += t['amount']
+            except:
+                pass
 
     conservative_balance = balance - total_recurring - future_one_offs
     safe_daily = max(0, conservative_balance / days_remaining)
     
-    if not todays_transactions:
+    if not has_spending_today:
         return None
 
     prompt = f"""
     Context:
-    - Spent Today: ₹{spent_today}
-    - Safe Daily Limit: ₹{safe_daily:.0f}
-    - Balance: ₹{balance}
+    - Spent Today: {format_money(spent_today, currency)}
+    - Safe Daily Limit: {format_money(safe_daily, currency, 0)}
+    - Balance: {format_money(balance, currency)}
     
     You are a strict financial guard.
     Output a SINGLE sentence alert about today's spending.
     NO JSON. NO MARKDOWN.
     
     Example:
-    "You've spent ₹5000 today, which is well above your daily limit of ₹2000."
+    "You've spent {format_money(5000, currency)} today, which is well above your daily limit of {format_money(2000, currency)}."
     "Spending is on track today, keep it up!"
     """
     
     try:
-        response = model.generate_content(prompt)
+        response = generate_content(prompt)
         return response.text.strip()
     except Exception as e:
         print(f"Alert generation failed: {e}")
+        if raise_errors:
+            raise GenerationFailed(str(e)) from e
         return None
 
-async def generate_financial_tips(transactions: list, balance: float):
-    if not API_KEY:
+async def generate_financial_tips(transactions: list, balance: float, currency: str = "INR", raise_errors=False):
+    if not get_api_key():
         raise Exception("API Key missing")
 
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
     recent_transactions = transactions[:10]
     prompt = f"""
-    You are a financial coach. Based on the following recent transactions and balance (₹{balance}), 
+    You are a financial coach. Based on the following recent transactions and balance ({format_money(balance, currency)}), 
     generate 3 short, actionable, and specific financial tips.
     Focus on "variable" spending if possible.
     
@@ -264,16 +297,18 @@ async def generate_financial_tips(transactions: list, balance: float):
     """
     
     try:
-        response = model.generate_content(prompt)
+        response = generate_content(prompt)
         text = response.text
         json_str = text.replace('```json', '').replace('```', '').strip()
         return json.loads(json_str)
     except Exception as e:
         print(f"Error generating tips: {e}")
+        if raise_errors:
+            raise GenerationFailed(str(e)) from e
         return ["Track your daily expenses to identify leaks.", "Try to save 20% of your income.", "Review your subscriptions monthly."]
 
 async def coach_chat(message: str, mode: str, context: dict):
-    if not API_KEY:
+    if not get_api_key():
         raise Exception("API Key missing")
 
     # Specialized prompts
@@ -352,7 +387,8 @@ async def coach_chat(message: str, mode: str, context: dict):
     full_prompt = f"""
     {system_instruction}
     
-    User Context: {json.dumps(context)}
+    User Context: {json.dumps(context, default=str)}
+    (When the context has "relevantRecords", those are only the records relevant to the message; the totals cover all of the user's data.)
     
     User Message: {message}
     """
@@ -360,7 +396,7 @@ async def coach_chat(message: str, mode: str, context: dict):
     # Use REST API directly to support google_search tool reliably
     import requests
     
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={API_KEY}"
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={get_api_key()}"
     
     payload = {
         "contents": [{
@@ -0,0 +1,280 @@
+"""
+Per-user columnar transaction cache.
+
+Insights and forecasts used to walk row-shaped transactions one at a time. Here each
+active user's transactions are held as parallel NumPy columns, sorted by day:
+
+- `amount` (float64, in the user's currency; foreign rows converted with fx.py)
+- `day` (int32 days since 1970-01-01) and `month` (int32 months since 1970-01)
+- `income` and `fixed` flags
+- `category` and `merchant` codes (int32) into label arrays; merchants are keyed by the
+  normalised merchant or description, like the client's subscription finder
+
+A `Frame` answers filters, group-by sums, daily series and trailing window sums with
+bincount / cumsum over those columns. Frames are built on first use and kept in an LRU
+bounded by BUFIN_ANALYTICS_CACHE_MB (default 64) of array memory; a commit in any
+worker that changes a user's transactions (from the transaction routes, batches, imports
+or jobs) drops their frame, and frames with converted rows are rebuilt when new rates are loaded.
+
+`detect_leaks` and `find_subscriptions` are vectorized versions of the client's
+analysis.js, served by /api/analytics. NumPy is imported inside the functions, so it is
+loaded with the first frame rather than at startup.
+"""
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date, timedelta
+import events, fx, models
+from money import MINOR_UNITS, to_minor
+
+CACHE_BYTES = int(float(os.getenv("BUFIN_ANALYTICS_CACHE_MB", "64")) * 1024 * 1024)
+# Rough per-label overhead of a Python string in the label arrays
+LABEL_BYTES = 64
+
+EPOCH = date(1970, 1, 1)
+
+def day_number(day):
+    return (day - EPOCH).days
+
+def month_number(day):
+    return (day.year - 1970) * 12 + day.month - 1
+
+def _encode(values):
+    import numpy as np
+    labels, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return labels, codes.astype(np.int32)
+
+class Frame:
+    def __init__(self, rows, currency):
+        """`rows`: (date, amount, currency, type, necessity, category, merchant, description), ordered by date."""
+        import numpy as np
+        self.currency = currency
+        self.rates = None
+        self.n = len(rows)
+        dates, amounts, currencies, types, necessities, categories, merchants, descriptions = zip(*rows) if rows else ((),) * 8
+        self.amount = np.array(amounts, dtype=np.float64)
+        foreign = [i for i, c in enumerate(currencies) if c]
+        if foreign:
+            # Rebuilt when the rate table changes (see `cache.get`)
+            self.rates = fx.rates()
+            converted = fx.convert_minor(
+                [to_minor(amounts[i]) for i in foreign], [currencies[i] for i in foreign], [dates[i] for i in foreign], currency, strict=False,
+            )
+            self.amount[foreign] = converted / MINOR_UNITS
+        days = np.array([d[:10] for d in dates], dtype="datetime64[D]")
+        self.day = days.astype(np.int32)
+        self.month = days.astype("datetime64[M]").astype(np.int32)
+        self.income = np.array([t == "income" for t in types], dtype=bool)
+        self.fixed = np.array([n == "fixed" for n in necessities], dtype=bool)
+        self.categories, self.category = _encode([c or "Other" for c in categories])
+        names = [(m or d or "") for m, d in zip(merchants, descriptions)]
+        self.merchants, self.merchant = _encode([name.lower().strip() for name in names])
+        # Display names (as typed) for merchants
+        self.merchant_names, self.merchant_name = _encode(names)
+
+    @property
+    def nbytes(self):
+        arrays = (self.amount, self.day, self.month, self.income, self.fixed, self.category, self.merchant, self.merchant_name)
+        labels = len(self.categories) + len(self.merchants) + len(self.merchant_names)
+        return sum(a.nbytes for a in arrays) + labels * LABEL_BYTES
+
+    def where(self, start=None, end=None, type=None, categories=None, variable_only=False, min_amount=None, max_amount=None):
+        """Boolean mask of rows matching every given filter; `start` / `end` are inclusive dates."""
+        import numpy as np
+        mask = np.ones(self.n, dtype=bool)
+        # Rows are sorted by day, so the date range is a slice
+        lo = np.searchsorted(self.day, day_number(start), side="left") if start else 0
+        hi = np.searchsorted(self.day, day_number(end), side="right") if end else self.n
+        mask[:lo] = False
+        mask[hi:] = False
+        if type is not None:
+            mask &= self.income if type == "income" else ~self.income
+        if categories:
+            codes = np.searchsorted(self.categories, categories)
+            known = [code for code, name in zip(codes, categories) if code < len(self.categories) and self.categories[code] == name]
+            mask &= np.isin(self.category, known)
+        if variable_only:
+            mask &= ~self.fixed
+        if min_amount is not None:
+            mask &= self.amount >= min_amount
+        if max_amount is not None:
+            mask &= self.amount <= max_amount
+        return mask
+
+    def signed(self):
+        import numpy as np
+        return np.where(self.income, self.amount, -self.amount)
+
+    def total(self, mask=None):
+        return float(self.amount[mask].sum()) if mask is not None else float(self.amount.sum())
+
+    def group_sum(self, by, mask=None, values=None):
+        """{label: sum of `values` (default amount)} over rows in `mask`, for groups with rows."""
+        import numpy as np
+        values = self.amount if values is None else values
+        mask = np.ones(self.n, dtype=bool) if mask is None else mask
+        if by in ("category", "merchant"):
+            codes, labels = (self.category, self.categories) if by == "category" else (self.merchant, self.merchants)
+            sums = np.bincount(codes[mask], weights=values[mask], minlength=len(labels))
+            counts = np.bincount(codes[mask], minlength=len(labels))
+            return {labels[i]: float(sums[i]) for i in np.flatnonzero(counts)}
+        if by in ("month", "day"):
+            keys = self.month if by == "month" else self.day
+            unique, inverse = np.unique(keys[mask], return_inverse=True)
+            sums = np.bincount(inverse, weights=values[mask], minlength=len(unique))
+            unit = "M" if by == "month" else "D"
+            return {str(np.datetime64(int(key), unit)): float(total) for key, total in zip(unique, sums)}
+        raise ValueError(f"Cannot group by '{by}'. Use: category, merchant, month, day")
+
+    def daily(self, start, end, mask=None, values=None):
+        """Sum of `values` (default amount) per day from `start` to `end` inclusive."""
+        import numpy as np
+        values = self.amount if values is None else values
+        in_range = self.where(start=start, end=end)
+        if mask is not None:
+            in_range &= mask
+        offsets = self.day[in_range] - day_number(start)
+        return np.bincount(offsets, weights=values[in_range], minlength=(end - start).days + 1)
+
+    def window_sums(self, start, end, window, mask=None, values=None):
+        """Trailing `window`-day sums ending on each day from `start` to `end`."""
+        import numpy as np
+        series = self.daily(start - timedelta(days=window - 1), end, mask, values)
+        cumulative = np.concatenate(([0.0], np.cumsum(series)))
+        return cumulative[window:] - cumulative[:-window]
+
+class FrameCache:
+    """LRU of frames by user id, bounded by the frames' array memory."""
+    def __init__(self, budget=CACHE_BYTES):
+        self.budget = budget
+        self._frames = OrderedDict()
+        self._bytes = 0
+        # Bumped on every invalidation, so a frame loaded from data read before one is not kept
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, db, user):
+        with self._lock:
+            frame = self._frames.get(user.id)
+            if frame is not None and frame.currency == user.currency and (frame.rates is None or frame.rates is fx.rates()):
+                self._frames.move_to_end(user.id)
+                return frame
+            generation = self._generations[user.id]
+        frame = _load(db, user)
+        with self._lock:
+            if self._generations[user.id] != generation:
+                return frame
+            self._drop(user.id)
+            self._frames[user.id] = frame
+            self._bytes += frame.nbytes
+            # The newest frame stays even when it alone is over budget
+            while self._bytes > self.budget and len(self._frames) > 1:
+                self._drop(next(iter(self._frames)))
+        return frame
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generations[user_id] += 1
+            self._drop(user_id)
+
+    def _drop(self, user_id):
+        frame = self._frames.pop(user_id, None)
+        if frame is not None:
+            self._bytes -= frame.nbytes
+
+def _load(db, user):
+    T = models.Transaction
+    rows = (
+        db.query(T.date, T.amount, T.currency, T.type, T.necessity, T.category, T.merchant, T.description)
+        .filter(T.user_id == user.id)
+        .order_by(T.date)
+        .all()
+    )
+    return Frame(rows, user.currency)
+
+cache = FrameCache()
+
+@events.listen_everywhere
+def _invalidate(user_id, changes):
+    if any(change.get("resource") == "transactions" for change in changes):
+        cache.invalidate(user_id)
+
+def frame_for(db, user):
+    return cache.get(db, user)
+
+def _top_merchant(frame, mask, category_code):
+    import numpy as np
+    rows = mask & (frame.category == category_code)
+    if not rows.any():
+        return "Unknown"
+    sums = np.bincount(frame.merchant_name[rows], weights=frame.amount[rows], minlength=len(frame.merchant_names))
+    return str(frame.merchant_names[int(np.argmax(sums))]) or "Unknown"
+
+def detect_leaks(frame, today=None):
+    """Variable-spending categories well over their monthly average (or, without history, a large share)."""
+    import numpy as np
+    today = today or date.today()
+    variable = frame.where(type="expense", variable_only=True)
+    current = variable & (frame.month == month_number(today))
+    past = variable & ~current
+
+    size = len(frame.categories)
+    spent = np.bincount(frame.category[current], weights=frame.amount[current], minlength=size)
+    # Average over the months in which the category had spending
+    pairs, inverse = np.unique(np.stack([frame.category[past], frame.month[past]]), axis=1, return_inverse=True)
+    monthly = np.bincount(inverse.ravel(), weights=frame.amount[past], minlength=pairs.shape[1])
+    months = np.bincount(pairs[0], minlength=size)
+    history = np.bincount(pairs[0], weights=monthly, minlength=size)
+    average = np.divide(history, months, out=np.zeros(size), where=months > 0)
+    total_variable = spent.sum()
+
+    leaks = []
+    for code in np.flatnonzero(np.bincount(frame.category[current], minlength=size)):
+        category, amount = str(frame.categories[code]), float(spent[code])
+        if months[code]:
+            avg = float(average[code])
+            if amount > avg * 1.3 and amount - avg > 500:
+                leaks.append({
+                    "category": category,
+                    "amount": amount - avg,
+                    "suggestion": f"Your {category} spending is {round((amount - avg) / avg * 100)}% over average, driven by {_top_merchant(frame, current, code)}.",
+                })
+        elif total_variable > 0 and amount > total_variable * 0.25 and amount > 1000:
+            leaks.append({
+                "category": category,
+                "amount": amount,
+                "suggestion": f"High Spending! {category} is {round(amount / total_variable * 100)}% of your monthly expenses, mainly at {_top_merchant(frame, current, code)}.",
+            })
+    return leaks
+
+def find_subscriptions(frame, plan_names=()):
+    """Merchants paid at least twice that no recurring plan covers yet."""
+    import numpy as np
+    expenses = np.flatnonzero(frame.where(type="expense"))
+    codes = frame.merchant[expenses]
+    size = len(frame.merchants)
+    counts = np.bincount(codes, minlength=size)
+    # Rows are sorted by day: the last index per merchant is its latest payment
+    last = np.full(size, -1)
+    np.maximum.at(last, codes, expenses)
+    first = np.full(size, frame.n)
+    np.minimum.at(first, codes, expenses)
+    spread = np.zeros(size)
+    np.maximum.at(spread, codes, np.abs(frame.amount[expenses] - frame.amount[first[codes]]))
+
+    plans = [name.lower() for name in plan_names if name]
+    candidates = []
+    for code in np.flatnonzero(counts >= 2):
+        name = str(frame.merchants[code])
+        if any(plan in name or name in plan for plan in plans):
+            continue
+        row = int(last[code])
+        fixed = bool(spread[code] < 1)
+        candidates.append({
+            "name": str(frame.merchant_names[frame.merchant_name[row]]),
+            "amount": float(frame.amount[row]),
+            "frequency": "Monthly (Fixed)" if fixed else "Frequent (Variable)",
+            "lastPaid": str(np.datetime64(int(frame.day[row]), "D")),
+            "isVariable": not fixed,
+        })
+    return candidates
@@ -0,0 +1,280 @@
+"""
+Streaming spend statistics and write-time anomaly alerts.
+
+Every variable expense updates, in O(1), three running statistics for its user:
+
+- "category": amount per transaction in the category
+- "merchant": amount per transaction at the merchant (or description)
+- "category_day": total spent in the category per day with spending; a day's total is
+  folded in when the first transaction of a later day arrives
+
+Each keeps a Welford count / mean / M2 (long-run mean and variance) and an
+exponentially weighted mean and variance (recent behaviour, ALPHA per sample). Updates
+are single-statement upserts, so concurrent inserts cannot lose each other's samples.
+
+Before the sample is added, it is scored against the recent (EWMA) baseline. Once a
+statistic has MIN_SAMPLES samples, a value at least Z_THRESHOLD deviations and
+MIN_RATIO times above the baseline is stored in `spending_alerts`. Fixed expenses and
+income are ignored, as in the client's leak detector. Back-dated transactions update the
+per-transaction statistics but not the daily ones, and edits and deletes cannot be
+unwound from running statistics: a commit that updates or deletes a user's transactions
+schedules `rebuild()`, which replays their history, REBUILD_DELAY_SECONDS later (one
+rebuild per user per burst of edits). The migrations rebuild every existing user once.
+"""
+import math
+import threading
+import uuid
+from datetime import datetime
+from sqlalchemy import text
+import events, fx, models
+from database import SessionLocal, shard_session
+
+ALPHA = 0.1
+Z_THRESHOLD = 3.0
+MIN_SAMPLES = 10
+MIN_RATIO = 1.3
+# Deviation floor as a share of the baseline, so very regular spend is not flagged for cents
+MIN_STD_SHARE = 0.05
+REBUILD_DELAY_SECONDS = 5.0
+
+def _fold(value):
+    """SET clause folding `value` (a SQL expression over the old row) into the statistics."""
+    return f"""
+        n = n + 1,
+        mean = mean + ({value} - mean) / (n + 1),
+        m2 = m2 + ({value} - mean) * ({value} - (mean + ({value} - mean) / (n + 1))),
+        ewma = CASE WHEN n = 0 THEN {value} ELSE ewma + {ALPHA} * ({value} - ewma) END,
+        ewvar = CASE WHEN n = 0 THEN 0.0 ELSE (1 - {ALPHA}) * (ewvar + {ALPHA} * ({value} - ewma) * ({value} - ewma)) END"""
+
+SAMPLE_UPSERT = f"""
+    INSERT INTO spending_stats (id, user_id, scope, key, n, mean, m2, ewma, ewvar, lastDay, dayTotal)
+    VALUES (:id, :user_id, :scope, :key, 1, :x, 0.0, :x, 0.0, NULL, 0.0)
+    ON CONFLICT(id) DO UPDATE SET {_fold(':x')}
+"""
+
+# A later day folds the previous day's total in and starts a new one; the same day adds
+# to it; an earlier (back-dated) day leaves the row alone
+DAILY_UPSERT = f"""
+    INSERT INTO spending_stats (id, user_id, scope, key, n, mean, m2, ewma, ewvar, lastDay, dayTotal)
+    VALUES (:id, :user_id, :scope, :key, 0, 0.0, 0.0, 0.0, 0.0, :day, :x)
+    ON CONFLICT(id) DO UPDATE SET
+        n = CASE WHEN :day > lastDay THEN n + 1 ELSE n END,
+        mean = CASE WHEN :day > lastDay THEN mean + (dayTotal - mean) / (n + 1) ELSE mean END,
+        m2 = CASE WHEN :day > lastDay THEN m2 + (dayTotal - mean) * (dayTotal - (mean + (dayTotal - mean) / (n + 1))) ELSE m2 END,
+        ewma = CASE WHEN :day > lastDay THEN (CASE WHEN n = 0 THEN dayTotal ELSE ewma + {ALPHA} * (dayTotal - ewma) END) ELSE ewma END,
+        ewvar = CASE WHEN :day > lastDay THEN (CASE WHEN n = 0 THEN 0.0 ELSE (1 - {ALPHA}) * (ewvar + {ALPHA} * (dayTotal - ewma) * (dayTotal - ewma)) END) ELSE ewvar END,
+        dayTotal = CASE WHEN :day > lastDay THEN :x WHEN :day = lastDay THEN dayTotal + :x ELSE dayTotal END,
+        lastDay = CASE WHEN :day > lastDay THEN :day ELSE lastDay END
+"""
+
+class RunningStat:
+    """Python twin of the SQL fold, for scoring a day about to be folded in and for rebuild()."""
+    def __init__(self, n=0, mean=0.0, m2=0.0, ewma=0.0, ewvar=0.0):
+        self.n, self.mean, self.m2, self.ewma, self.ewvar = n, mean, m2, ewma, ewvar
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.n, row.mean, row.m2, row.ewma, row.ewvar) if row is not None else cls()
+
+    def add(self, value):
+        delta = value - self.mean
+        self.mean += delta / (self.n + 1)
+        self.m2 += delta * (value - self.mean)
+        if self.n == 0:
+            self.ewma, self.ewvar = value, 0.0
+        else:
+            diff = value - self.ewma
+            self.ewvar = (1 - ALPHA) * (self.ewvar + ALPHA * diff * diff)
+            self.ewma += ALPHA * diff
+        self.n += 1
+        return self
+
+def _stat_id(user_id, scope, key):
+    return f"{user_id}:{scope}:{key}"
+
+def _merchant_key(transaction):
+    return (transaction.merchant or transaction.description or "").strip().lower()
+
+def tracked(transaction):
+    return transaction.type == "expense" and transaction.necessity != "fixed" and (transaction.amount or 0) > 0
+
+def score(stat, value):
+    """(z, baseline) of `value` against a statistic's recent baseline, or None while warming up."""
+    if stat.n < MIN_SAMPLES or stat.ewma <= 0:
+        return None
+    std = max(math.sqrt(max(stat.ewvar, 0.0)), stat.ewma * MIN_STD_SHARE)
+    return (value - stat.ewma) / std, stat.ewma
+
+def _is_outlier(scored, value):
+    if scored is None:
+        return False
+    z, baseline = scored
+    return z >= Z_THRESHOLD and value >= baseline * MIN_RATIO
+
+def _message(scope, key, value, baseline):
+    ratio = value / baseline
+    if scope == "category_day":
+        return f"Spent {value:,.0f} on {key} today, {ratio:.1f}x your usual {baseline:,.0f} a day."
+    if scope == "merchant":
+        return f"{value:,.0f} at {key} is {ratio:.1f}x your usual {baseline:,.0f} there."
+    return f"{value:,.0f} on {key} is {ratio:.1f}x your usual {baseline:,.0f} per purchase."
+
+def _home_currency(db, user_id):
+    return db.query(models.User.currency).filter(models.User.id == user_id).scalar()
+
+def _home_amount(row, home):
+    # Statistics are kept in the user's currency; None when a foreign row cannot be converted
+    if not row.currency:
+        return float(row.amount)
+    if not home:
+        return None
+    try:
+        return fx.convert(float(row.amount), row.currency, row.date[:10], home)
+    except fx.MissingRate:
+        return None
+
+def record(db, transaction):
+    """Score and fold a new transaction into the user's statistics; returns alerts raised. Caller commits."""
+    if not tracked(transaction):
+        return []
+    home = _home_currency(db, transaction.user_id) if transaction.currency else None
+    amount = _home_amount(transaction, home)
+    if amount is None:
+        return []
+    user_id, amount, day = transaction.user_id, round(amount, 2), transaction.date[:10]
+    category = transaction.category or "Other"
+    samples = [("category", category), ("merchant", _merchant_key(transaction))]
+    samples = [(scope, key, _stat_id(user_id, scope, key)) for scope, key in samples if key]
+    daily_id = _stat_id(user_id, "category_day", category)
+
+    ids = [stat_id for _, _, stat_id in samples] + [daily_id]
+    params = {f"id{i}": stat_id for i, stat_id in enumerate(ids)}
+    rows = db.execute(
+        text(f"SELECT id, n, mean, m2, ewma, ewvar, lastDay, dayTotal FROM spending_stats WHERE id IN ({', '.join(':' + p for p in params)})"),
+        params,
+    ).all()
+    stats = {row.id: row for row in rows}
+
+    alerts = []
+    for scope, key, stat_id in samples:
+        scored = score(RunningStat.from_row(stats.get(stat_id)), amount)
+        if _is_outlier(scored, amount):
+            alerts.append((scope, key, amount, scored))
+        db.execute(text(SAMPLE_UPSERT), {"id": stat_id, "user_id": user_id, "scope": scope, "key": key, "x": amount})
+
+    daily = stats.get(daily_id)
+    if daily is None or day >= daily.lastDay:
+        # Score today's running total against completed days only
+        baseline = RunningStat.from_row(daily)
+        if daily is not None and day > daily.lastDay:
+            baseline.add(daily.dayTotal)
+        day_total = amount + (daily.dayTotal if daily is not None and day == daily.lastDay else 0.0)
+        scored = score(baseline, day_total)
+        if _is_outlier(scored, day_total) and not _alerted(db, user_id, "category_day", category, day):
+            alerts.append(("category_day", category, day_total, scored))
+    db.execute(text(DAILY_UPSERT), {"id": daily_id, "user_id": user_id, "scope": "category_day", "key": category, "x": amount, "day": day})
+
+    created = []
+    for scope, key, value, (z, baseline) in alerts:
+        alert = models.SpendingAlert(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            transaction_id=transaction.id,
+            date=day,
+            scope=scope,
+            key=key,
+            amount=value,
+            expected=round(baseline, 2),
+            zscore=round(z, 2),
+            message=_message(scope, key, value, baseline),
+            seen=False,
+            createdAt=datetime.utcnow().isoformat(),
+        )
+        db.add(alert)
+        created.append(alert)
+    return created
+
+def _alerted(db, user_id, scope, key, day):
+    A = models.SpendingAlert
+    return db.query(A.id).filter(A.user_id == user_id, A.scope == scope, A.key == key, A.date == day).first() is not None
+
+def rebuild(db, user_id, home=None):
+    """
+    Recompute a user's statistics from their full history (no alerts), in `home` (default:
+    the stored currency). Caller commits.
+    """
+    T = models.Transaction
+    S = models.SpendingStat
+    stats, days = {}, {}
+    rows = (
+        db.query(T.date, T.amount, T.currency, T.category, T.merchant, T.description, T.type, T.necessity)
+        .filter(T.user_id == user_id)
+        .order_by(T.date)
+        .yield_per(1000)
+    )
+    home = home or _home_currency(db, user_id)
+    for row in rows:
+        if not tracked(row):
+            continue
+        amount = _home_amount(row, home)
+        if amount is None:
+            continue
+        category = row.category or "Other"
+        for scope, key in (("category", category), ("merchant", _merchant_key(row))):
+            if key:
+                stats.setdefault((scope, key), RunningStat()).add(amount)
+        day = row.date[:10]
+        stat = stats.setdefault(("category_day", category), RunningStat())
+        last_day, total = days.get(category, (None, 0.0))
+        if last_day == day:
+            days[category] = (day, total + amount)
+        else:
+            if last_day is not None:
+                stat.add(total)
+            days[category] = (day, amount)
+
+    db.query(S).filter(S.user_id == user_id).delete(synchronize_session=False)
+    for (scope, key), stat in stats.items():
+        last_day, total = days.get(key, (None, 0.0)) if scope == "category_day" else (None, 0.0)
+        db.add(S(
+            id=_stat_id(user_id, scope, key), user_id=user_id, scope=scope, key=key,
+            n=stat.n, mean=stat.mean, m2=stat.m2, ewma=stat.ewma, ewvar=stat.ewvar,
+            lastDay=last_day, dayTotal=total,
+        ))
+
+_rebuilds = {}
+_rebuilds_lock = threading.Lock()
+
+def schedule_rebuild(user_id):
+    """Rebuild the user's statistics REBUILD_DELAY_SECONDS from now, unless one is already due."""
+    with _rebuilds_lock:
+        if user_id in _rebuilds:
+            return
+        timer = threading.Timer(REBUILD_DELAY_SECONDS, _run_rebuild, args=(user_id,))
+        timer.daemon = True
+        _rebuilds[user_id] = timer
+    timer.start()
+
+def _run_rebuild(user_id):
+    # Dropped before the replay, so an edit committed during it schedules another
+    with _rebuilds_lock:
+        _rebuilds.pop(user_id, None)
+    directory = SessionLocal()
+    try:
+        shard = directory.query(models.User.shard).filter(models.User.id == user_id).scalar()
+    finally:
+        directory.close()
+    db = shard_session(shard)
+    try:
+        rebuild(db, user_id)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Spending statistics rebuild failed for {user_id}: {e}")
+    finally:
+        db.close()
+
+@events.listen
+def _rebuild_on_change(user_id, changes):
+    if any(change.get("resource") == "transactions" and change.get("op") != "created" for change in changes):
+        schedule_rebuild(user_id)
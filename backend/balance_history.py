@@ -0,0 +1,246 @@
+"""
+Daily balance history.
+
+The balance on a day is the user's opening `current_balance` plus every income minus
+every other transaction up to that day, as the client computes it. Replaying the
+whole ledger for each chart is avoided with monthly checkpoints:
+
+- `balance_checkpoints` holds, per user and month, the running net of all transactions
+  up to the end of that month. Rows are dense from the first month with transactions
+  to the last complete month, and are appended as months complete.
+- On SQLite, triggers on `transactions` add the signed change of every insert, update
+  or delete to the checkpoints of that month and later, so back-dated edits keep them
+  exact without a rebuild.
+- A series starts from the latest checkpoint before the range, and a windowed
+  SUM() OVER (ORDER BY day) over the range itself gives the daily prefix sums. The work
+  is proportional to the range, not the history.
+- Checkpoints and prefix sums cover rows in the user's own currency. Foreign-currency
+  rows (see fx.py) are summed per day and currency and converted at that day's rate on
+  read. Their history before the range comes from `balance_fx_checkpoints`: the same
+  monthly running net, converted, stamped with the user's currency and the version of
+  the rate table used. The triggers delete a user's foreign checkpoints from the month
+  of any foreign row they see change, and checkpoints with another currency or rate
+  version are rebuilt, so loading rates never leaves them stale.
+"""
+from datetime import date, timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+import fx, models
+from money import from_minor, to_minor
+
+# Signed effect of a transactions row (NEW, OLD or the table itself) on the balance
+_SIGNED = "CASE WHEN {row}.type = 'income' THEN {row}.amount ELSE -{row}.amount END"
+
+def _apply(row, sign):
+    return f"""UPDATE balance_checkpoints SET net = net {sign} ({_SIGNED.format(row=row)})
+        WHERE user_id = {row}.user_id AND month >= substr({row}.date, 1, 7) AND {row}.currency IS NULL;
+        DELETE FROM balance_fx_checkpoints
+        WHERE user_id = {row}.user_id AND month >= substr({row}.date, 1, 7) AND {row}.currency IS NOT NULL;"""
+
+TRIGGER_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS balance_checkpoints_ai AFTER INSERT ON transactions BEGIN
+        {_apply('new', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS balance_checkpoints_ad AFTER DELETE ON transactions BEGIN
+        {_apply('old', '-')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS balance_checkpoints_au AFTER UPDATE OF user_id, date, amount, type, currency ON transactions BEGIN
+        {_apply('old', '-')}
+        {_apply('new', '+')}
+    END""",
+]
+
+def create_index(conn):
+    """Create the checkpoint triggers. Checkpoints themselves are built on first use."""
+    if conn.dialect.name != "sqlite":
+        print("Balance checkpoint triggers need SQLite; balance history will scan transactions.")
+        return
+    for statement in TRIGGER_DDL:
+        conn.execute(text(statement))
+    conn.execute(text("DELETE FROM balance_checkpoints"))
+    conn.execute(text("DELETE FROM balance_fx_checkpoints"))
+
+def drop_index(conn):
+    if conn.dialect.name == "sqlite":
+        for name in ("balance_checkpoints_ai", "balance_checkpoints_ad", "balance_checkpoints_au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+def has_index(db):
+    if db.bind.dialect.name != "sqlite":
+        return False
+    return db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'balance_checkpoints_ai'")
+    ).first() is not None
+
+def _month(day):
+    return day.isoformat()[:7]
+
+def _next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+def _month_start(month):
+    return f"{month}-01"
+
+def _last_checkpoint(db, user_id, before_month=None):
+    """(month, net_minor) of the latest checkpoint, optionally only months before `before_month`."""
+    query = "SELECT month, net FROM balance_checkpoints WHERE user_id = :user_id"
+    params = {"user_id": user_id}
+    if before_month:
+        query += " AND month < :before"
+        params["before"] = before_month
+    row = db.execute(text(query + " ORDER BY month DESC LIMIT 1"), params).first()
+    return (row.month, int(row.net)) if row else (None, 0)
+
+def _net_between(db, user_id, start, end):
+    """Net of transactions dated on or after `start` and before `end` (either may be None)."""
+    conditions = ["user_id = :user_id", "currency IS NULL"]
+    params = {"user_id": user_id}
+    if start:
+        conditions.append("date >= :start")
+        params["start"] = start
+    if end:
+        conditions.append("date < :end")
+        params["end"] = end
+    return int(db.execute(
+        text(f"SELECT COALESCE(SUM({_SIGNED.format(row='transactions')}), 0) FROM transactions WHERE {' AND '.join(conditions)}"),
+        params,
+    ).scalar())
+
+def ensure_checkpoints(db, user_id, today=None):
+    """Append checkpoints for months completed since the last one (all of them the first time)."""
+    through = _month((today or date.today()).replace(day=1) - timedelta(days=1))
+    last_month, last_net = _last_checkpoint(db, user_id)
+    if last_month is not None and last_month >= through:
+        return
+
+    start = _month_start(_next_month(last_month)) if last_month else None
+    conditions = "user_id = :user_id AND currency IS NULL AND date < :until" + (" AND date >= :start" if start else "")
+    monthly = db.execute(text(f"""
+        SELECT substr(date, 1, 7) AS month,
+               SUM(SUM({_SIGNED.format(row='transactions')})) OVER (ORDER BY substr(date, 1, 7)) AS running
+        FROM transactions
+        WHERE {conditions}
+        GROUP BY substr(date, 1, 7)
+        ORDER BY month
+    """), {"user_id": user_id, "until": _month_start(_next_month(through)), "start": start}).all()
+    if not monthly and last_month is None:
+        return
+
+    running = {row.month: int(row.running) for row in monthly}
+    month = _next_month(last_month) if last_month else monthly[0].month
+    rows, carried = [], 0
+    while month <= through:
+        carried = running.get(month, carried)
+        rows.append(models.BalanceCheckpoint(id=f"{user_id}:{month}", user_id=user_id, month=month, net=float(from_minor(last_net + carried))))
+        month = _next_month(month)
+    db.add_all(rows)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request appended the same months first
+        db.rollback()
+
+def daily_series(db, user, start, end):
+    """[(day, balance)] for every day in [start, end], balances as Decimal."""
+    foreign_since = None
+    if has_index(db):
+        ensure_checkpoints(db, user.id)
+        month, base = _last_checkpoint(db, user.id, before_month=_month(start))
+        base += _net_between(db, user.id, _month_start(_next_month(month)) if month else None, start.isoformat())
+        ensure_fx_checkpoints(db, user)
+        month, foreign_base = _last_fx_checkpoint(db, user, before_month=_month(start))
+        base += foreign_base
+        foreign_since = _month_start(_next_month(month)) if month else None
+    else:
+        base = _net_between(db, user.id, None, start.isoformat())
+
+    rows = db.execute(text(f"""
+        SELECT substr(date, 1, 10) AS day,
+               SUM(SUM({_SIGNED.format(row='transactions')})) OVER (ORDER BY substr(date, 1, 10)) AS running
+        FROM transactions
+        WHERE user_id = :user_id AND currency IS NULL AND date >= :start AND date < :end
+        GROUP BY substr(date, 1, 10)
+    """), {"user_id": user.id, "start": start.isoformat(), "end": (end + timedelta(days=1)).isoformat()}).all()
+    running = {row.day: int(row.running) for row in rows}
+
+    foreign = _foreign_by_day(db, user, foreign_since, (end + timedelta(days=1)).isoformat())
+    base += sum(net for day, net in foreign.items() if day < start.isoformat())
+
+    opening = to_minor(user.current_balance or 0.0)
+    series, carried, converted, day = [], 0, 0, start
+    while day <= end:
+        carried = running.get(day.isoformat(), carried)
+        converted += foreign.get(day.isoformat(), 0)
+        series.append((day, from_minor(opening + base + carried + converted)))
+        day += timedelta(days=1)
+    return series
+
+def _foreign_rows(db, user_id, since, before):
+    """(day, currency, net) of foreign-currency rows dated in [since, before); `since` may be None."""
+    return db.execute(text(f"""
+        SELECT substr(date, 1, 10) AS day, currency, SUM({_SIGNED.format(row='transactions')}) AS net
+        FROM transactions
+        WHERE user_id = :user_id AND currency IS NOT NULL AND date < :before{" AND date >= :since" if since else ""}
+        GROUP BY substr(date, 1, 10), currency
+    """), {"user_id": user_id, "since": since, "before": before}).all()
+
+def _foreign_by_day(db, user, since, before):
+    """{day: net in the user's currency (minor units)} of foreign-currency rows dated in [since, before)."""
+    rows = _foreign_rows(db, user.id, since, before)
+    if not rows:
+        return {}
+    days, currencies, nets = zip(*rows)
+    by_day = {}
+    for day, net in zip(days, fx.convert_minor(nets, currencies, days, user.currency, strict=False).tolist()):
+        by_day[day] = by_day.get(day, 0) + net
+    return by_day
+
+def _last_fx_checkpoint(db, user, before_month=None):
+    """(month, net_minor) of the latest foreign checkpoint valid for the user's currency and the current rates."""
+    query = "SELECT month, net FROM balance_fx_checkpoints WHERE user_id = :user_id AND currency = :currency AND rates = :rates"
+    params = {"user_id": user.id, "currency": user.currency, "rates": fx.rates().version}
+    if before_month:
+        query += " AND month < :before"
+        params["before"] = before_month
+    row = db.execute(text(query + " ORDER BY month DESC LIMIT 1"), params).first()
+    return (row.month, int(row.net)) if row else (None, 0)
+
+def ensure_fx_checkpoints(db, user, today=None):
+    """Like ensure_checkpoints, for the converted net of foreign-currency rows."""
+    through = _month((today or date.today()).replace(day=1) - timedelta(days=1))
+    version = fx.rates().version
+    latest = db.query(models.BalanceFxCheckpoint).filter(models.BalanceFxCheckpoint.user_id == user.id).order_by(models.BalanceFxCheckpoint.month.desc()).first()
+    if latest is not None and (latest.currency != user.currency or latest.rates != version):
+        # Converted with other rates or into another currency
+        db.query(models.BalanceFxCheckpoint).filter(models.BalanceFxCheckpoint.user_id == user.id).delete(synchronize_session=False)
+        latest = None
+    if latest is not None and latest.month >= through:
+        return
+
+    last_month = latest.month if latest else None
+    last_net = to_minor(latest.net) if latest else 0
+    rows = _foreign_rows(db, user.id, _month_start(_next_month(last_month)) if last_month else None, _month_start(_next_month(through)))
+    if not rows and last_month is None:
+        db.commit()
+        return
+
+    monthly = {}
+    if rows:
+        days, currencies, nets = zip(*rows)
+        for day, net in zip(days, fx.convert_minor(nets, currencies, days, user.currency, strict=False).tolist()):
+            monthly[day[:7]] = monthly.get(day[:7], 0) + net
+    month = _next_month(last_month) if last_month else min(monthly)
+    checkpoints, running = [], last_net
+    while month <= through:
+        running += monthly.get(month, 0)
+        checkpoints.append(models.BalanceFxCheckpoint(
+            id=f"{user.id}:{month}", user_id=user.id, month=month, net=float(from_minor(running)), currency=user.currency, rates=version,
+        ))
+        month = _next_month(month)
+    db.add_all(checkpoints)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request appended the same months first
+        db.rollback()
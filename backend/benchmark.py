@@ -0,0 +1,309 @@
+"""
+End-to-end benchmark suite.
+
+Seeds a throwaway SQLite database with synthetic users (see seed_data.py), then drives
+every router through the ASGI app in-process and reports throughput and latency
+percentiles per scenario.
+
+Usage:
+    python benchmark.py                      # run and print results
+    python benchmark.py --save-baseline      # store results in benchmark_baseline.json
+    python benchmark.py --compare            # fail (exit 1) if a scenario regressed vs the baseline
+
+AI scenarios call Gemini and are skipped unless --include-ai is given.
+Startup scenarios time cold imports and schema setup in fresh interpreters.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p90_ms": round(percentile(values, 90), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+    }
+
+
+class Bench:
+    def __init__(self, client, tokens, rng):
+        self.client = client
+        self.tokens = tokens
+        self.rng = rng
+        # ids created by earlier scenarios, per user token, so update/delete have targets
+        self.created = {}
+
+    def auth(self, token):
+        return {"Authorization": f"Bearer {token}"}
+
+    async def run(self, name, make_request, requests, concurrency):
+        latencies = []
+        errors = 0
+        counter = iter(range(requests))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                token = self.tokens[i % len(self.tokens)]
+                method, path, kwargs = make_request(i, token)
+                start = time.perf_counter()
+                headers = {**self.auth(token), **kwargs.pop("headers", {})}
+                response = await self.client.request(method, path, headers=headers, **kwargs)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+                else:
+                    self.remember(name, token, response)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(latencies, errors, time.perf_counter() - start)
+
+    def remember(self, name, token, response):
+        if name.startswith("create_"):
+            body = response.json()
+            if isinstance(body, dict) and "id" in body:
+                self.created.setdefault((name[len("create_"):], token), []).append(body["id"])
+
+    def pop_created(self, entity, token):
+        ids = self.created.get((entity, token))
+        return ids.pop() if ids else str(uuid.uuid4())
+
+    def peek_created(self, entity, token):
+        ids = self.created.get((entity, token))
+        return self.rng.choice(ids) if ids else str(uuid.uuid4())
+
+
+def transaction_body(rng):
+    return {
+        "amount": round(rng.uniform(50, 3000), 2),
+        "category": rng.choice(["Food", "Transport", "Shopping", "Groceries"]),
+        "description": "Benchmark purchase",
+        "merchant": rng.choice(["Swiggy", "Uber", "Amazon", "DMart"]),
+        "type": "expense",
+        "necessity": "variable",
+        "date": (date.today() - timedelta(days=rng.randint(0, 60))).isoformat(),
+    }
+
+
+def debt_body(rng):
+    return {"personName": rng.choice(["Aarav", "Diya", "Kabir"]), "amount": float(rng.choice([100, 300, 500])),
+            "direction": rng.choice(["receivable", "payable"]), "dueDate": None, "status": "active"}
+
+
+def plan_body(rng):
+    return {"name": "Benchmark Subscription", "amount": float(rng.choice([199, 499, 999])), "type": "expense",
+            "frequency": "monthly", "expectedDate": str(rng.randint(1, 28)), "endDate": None}
+
+
+def scenarios(bench, rng, include_ai):
+    """(name, request factory) pairs, in execution order. Creates run before the updates/deletes that use them."""
+    s = [
+        ("auth_me", lambda i, t: ("GET", "/api/auth/me", {})),
+        ("update_profile", lambda i, t: ("PUT", "/api/auth/me", {"json": {"savings_goal": float(rng.randint(1, 50) * 1000)}})),
+        ("list_transactions", lambda i, t: ("GET", "/api/transactions", {"params": {"limit": 100}})),
+        ("query_transactions", lambda i, t: ("GET", "/api/transactions/query", {"params": {"start_date": (date.today() - timedelta(days=90)).isoformat(), "category": ["Food", "Groceries"], "sort": "-amount", "limit": 50}})),
+        ("transaction_summary", lambda i, t: ("GET", "/api/transactions/summary", {"params": {"group": rng.choice(["month", "category"])}})),
+        ("goal_projections", lambda i, t: ("GET", "/api/goals/projections", {"params": {"paths": 2000}})),
+        ("balance_history", lambda i, t: ("GET", "/api/transactions/balance_history", {"params": {"start_date": (date.today() - timedelta(days=rng.choice([30, 90, 365]))).isoformat()}})),
+        ("list_alerts", lambda i, t: ("GET", "/api/alerts", {"params": {"unseen_only": rng.choice(["true", "false"])}})),
+        ("spending_patterns", lambda i, t: ("GET", "/api/analytics/patterns", {})),
+        ("search_transactions", lambda i, t: ("GET", "/api/transactions/search", {"params": {"q": rng.choice(["swig", "uber", "groceries", "amaz"])}})),
+        ("create_transaction", lambda i, t: ("POST", "/api/transactions", {"json": transaction_body(rng)})),
+        ("update_transaction", lambda i, t: ("PUT", f"/api/transactions/{bench.peek_created('transaction', t)}", {"json": transaction_body(rng)})),
+        ("delete_transaction", lambda i, t: ("DELETE", f"/api/transactions/{bench.pop_created('transaction', t)}", {})),
+        ("list_debts", lambda i, t: ("GET", "/api/debts", {})),
+        ("debt_balances", lambda i, t: ("GET", "/api/debts/balances", {})),
+        ("debt_settlement", lambda i, t: ("POST", "/api/debts/settlement", {"json": {}})),
+        ("create_debt", lambda i, t: ("POST", "/api/debts", {"json": debt_body(rng)})),
+        ("batch_quick_add", lambda i, t: ("POST", "/api/batch", {
+            "json": {"operations": [{"op": "create", "resource": "transactions", "data": transaction_body(rng)}]
+                     + [{"op": "create", "resource": "debts", "data": debt_body(rng)} for _ in range(2)]},
+            "headers": {"Idempotency-Key": str(uuid.uuid4())},
+        })),
+        ("update_debt", lambda i, t: ("PUT", f"/api/debts/{bench.peek_created('debt', t)}", {"json": debt_body(rng)})),
+        ("delete_debt", lambda i, t: ("DELETE", f"/api/debts/{bench.pop_created('debt', t)}", {})),
+        ("list_recurring_plans", lambda i, t: ("GET", "/api/recurring_plans", {})),
+        ("recurring_occurrences", lambda i, t: ("GET", "/api/recurring_plans/occurrences", {"params": {"start": date.today().replace(day=1).isoformat(), "end": (date.today().replace(day=1) + timedelta(days=62)).isoformat()}})),
+        ("create_recurring_plan", lambda i, t: ("POST", "/api/recurring_plans", {"json": plan_body(rng)})),
+        ("update_recurring_plan", lambda i, t: ("PUT", f"/api/recurring_plans/{bench.peek_created('recurring_plan', t)}", {"json": plan_body(rng)})),
+        ("delete_recurring_plan", lambda i, t: ("DELETE", f"/api/recurring_plans/{bench.pop_created('recurring_plan', t)}", {})),
+        ("list_goals", lambda i, t: ("GET", "/api/goals", {})),
+        ("create_goal", lambda i, t: ("POST", "/api/goals", {"json": {"name": "Benchmark Goal", "targetAmount": 50000.0}})),
+        ("update_goal", lambda i, t: ("PUT", f"/api/goals/{bench.peek_created('goal', t)}", {"json": {"currentAmount": float(rng.randint(0, 50000))}})),
+        ("delete_goal", lambda i, t: ("DELETE", f"/api/goals/{bench.pop_created('goal', t)}", {})),
+        ("list_wishlist", lambda i, t: ("GET", "/api/wishlist", {})),
+        ("wishlist_affordability", lambda i, t: ("GET", "/api/wishlist/affordability", {})),
+        ("create_wishlist_item", lambda i, t: ("POST", "/api/wishlist", {"json": {"name": "Benchmark Item", "cost": 4999.0}})),
+        ("delete_wishlist_item", lambda i, t: ("DELETE", f"/api/wishlist/{bench.pop_created('wishlist_item', t)}", {})),
+    ]
+    if include_ai:
+        s += [
+            ("ai_classify", lambda i, t: ("POST", "/api/ai/classify", {"json": {"text": "Lunch 250 at Swiggy"}})),
+            ("ai_tips", lambda i, t: ("POST", "/api/ai/tips", {"json": {"transactions": [], "balance": 10000}})),
+        ]
+    return s
+
+
+async def run_suite(args):
+    import httpx
+    import main, auth_utils, seed_data
+
+    rng = random.Random(args.seed)
+    seed_data.seed(users=args.users, months=args.months, tx_per_month=args.tx_per_month, seed_value=args.seed)
+
+    # Tokens are minted directly: the login scenario below measures bcrypt separately
+    tokens = [auth_utils.create_access_token({"sub": f"user{i}@example.com"}, timedelta(hours=1)) for i in range(args.users)]
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        bench = Bench(client, tokens, rng)
+
+        login_requests = max(1, args.requests // 20)
+        results["login"] = await bench.run(
+            "login",
+            lambda i, t: ("POST", "/api/auth/login", {"json": {"email": f"user{i % args.users}@example.com", "password": seed_data.DEFAULT_PASSWORD}}),
+            login_requests, args.concurrency,
+        )
+        print_row("login", results["login"])
+
+        for name, factory in scenarios(bench, rng, args.include_ai):
+            results[name] = await bench.run(name, factory, args.requests, args.concurrency)
+            print_row(name, results[name])
+    return results
+
+
+# (setup, measured statement) pairs, each timed in a fresh interpreter
+STARTUP_SCENARIOS = {
+    "startup_import_main": ("pass", "import main"),
+    "startup_migrate": ("import migrate_db", "migrate_db.migrate()"),
+    "startup_first_ai_call": ("import main", "import ai_service; ai_service.preload()"),
+}
+
+
+def run_startup(runs):
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, (setup, stmt) in STARTUP_SCENARIOS.items():
+        code = (
+            f"import time\n{setup}\n"
+            f"start = time.perf_counter()\n{stmt}\n"
+            "print((time.perf_counter() - start) * 1000)"
+        )
+        timings = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], cwd=backend_dir,
+                                 capture_output=True, text=True, check=True)
+            timings.append(float(out.stdout.strip().splitlines()[-1]))
+        results[name] = summarize(timings, 0, sum(timings) / 1000)
+        print_row(name, results[name])
+    return results
+
+
+def print_row(name, r):
+    print(f"{name:<24} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>10} {r['p50_ms']:>9} {r['p90_ms']:>9} {r['p99_ms']:>9}")
+
+
+def compare(results, baseline, tolerance, floor_ms):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            # A scenario the baseline predates is unchecked, not passing
+            regressions.append(f"{name}: missing from baseline (re-run with --save-baseline)")
+            continue
+        for key in ("p50_ms", "p90_ms"):
+            limit = previous[key] * (1 + tolerance)
+            if current[key] > limit and current[key] - previous[key] > floor_ms:
+                regressions.append(f"{name}.{key}: {previous[key]} -> {current[key]}")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}.errors: {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="BuFin end-to-end benchmark")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--tx-per-month", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--include-ai", action="store_true", help="Also benchmark the Gemini-backed routes")
+    parser.add_argument("--write-batching", action="store_true", help="Run with BUFIN_WRITE_BATCHING=1 (group commit)")
+    parser.add_argument("--shards", type=int, default=0, help="Spread users over this many extra SQLite shards")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Cold-start samples per startup scenario (0 to skip)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Compare against the stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative latency increase")
+    parser.add_argument("--floor-ms", type=float, default=1.0, help="Ignore regressions smaller than this")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # Must happen before database.py is imported
+    workdir = tempfile.mkdtemp(prefix="bufin-bench-")
+    os.environ["BUFIN_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if args.write_batching:
+        os.environ["BUFIN_WRITE_BATCHING"] = "1"
+    if args.shards:
+        os.environ["BUFIN_SHARDS"] = ",".join(
+            f"shard{i}=sqlite:///{os.path.join(workdir, f'shard{i}.db')}" for i in range(1, args.shards + 1)
+        )
+
+    print(f"{'scenario':<24} {'reqs':>6} {'errs':>5} {'req/s':>10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    results = run_startup(args.startup_runs) if args.startup_runs else {}
+    results.update(asyncio.run(run_suite(args)))
+
+    report = {
+        "config": {k: getattr(args, k) for k in ("users", "months", "tx_per_month", "requests", "concurrency", "seed")},
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+        if regressions:
+            print("Regressions vs baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions vs baseline.")
@@ -1,13 +1,61 @@
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.util import find_tables
+import sharding
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./bufin.db"
+# Override with BUFIN_DATABASE_URL to point the app (or the benchmarks) at another database
+SQLALCHEMY_DATABASE_URL = os.getenv("BUFIN_DATABASE_URL", "sqlite:///./bufin.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _create_engine(url):
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, connect_args=connect_args)
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+
+# Extra shards (see sharding.py); with none configured everything stays in one database
+SHARD_URLS = sharding.parse_shards(os.getenv("BUFIN_SHARDS", ""))
+ring = sharding.HashRing([sharding.DEFAULT_SHARD, *SHARD_URLS])
+_engines = {sharding.DEFAULT_SHARD: engine}
+
+# Tables that only exist in the primary database
+DIRECTORY_TABLES = {"users", "jobs", "fx_rates"}
+
+def get_engine(shard):
+    if shard not in _engines:
+        if shard not in SHARD_URLS:
+            raise KeyError(f"Unknown shard '{shard}'")
+        _engines[shard] = _create_engine(SHARD_URLS[shard])
+    return _engines[shard]
+
+def on_primary(shard):
+    """Whether the shard's tables are in the primary database."""
+    return not shard or get_engine(shard) is engine
+
+def all_engines():
+    return {shard: get_engine(shard) for shard in ring.shards}
+
+class RoutingSession(Session):
+    """
+    Session that sends per-user tables to the shard in `info["shard"]` (set by
+    get_current_user) and directory tables to the primary database. One session can
+    hold connections to both, but they commit one after the other, not atomically:
+    a write that must change both sides together commits them separately, in an order
+    it can undo (see routers/auth.py, _commit_profile).
+    """
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        shard = self.info.get("shard")
+        if not shard or shard == sharding.DEFAULT_SHARD:
+            return engine
+        if mapper is not None and getattr(mapper, "persist_selectable", None) is not None:
+            if mapper.persist_selectable.name in DIRECTORY_TABLES:
+                return engine
+        elif clause is not None and any(getattr(t, "name", None) in DIRECTORY_TABLES for t in find_tables(clause, include_crud=True)):
+            return engine
+        return get_engine(shard)
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
@@ -17,3 +65,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def shard_session(shard, **kw):
+    """Session for work outside a request, bound to one user's shard."""
+    return SessionLocal(info={"shard": shard}, **kw)
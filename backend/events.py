@@ -0,0 +1,236 @@
+"""
+Change notifications pushed to connected clients.
+
+Every committed insert, update or delete of a user-owned row in PUBLISHED is turned
+into a small event and delivered to that user's open WebSockets (/api/events):
+
+    {"resource": "transactions", "op": "created", "id": "...", "data": {...row...}}
+
+The user's own row is published as the "profile" resource (without the password hash),
+so profile, balance and currency changes reach their other tabs too.
+
+Events are collected from the ORM flush of any session made by SessionLocal, so the
+routers, the write batcher and background jobs publish without extra calls, and are
+only sent once the transaction commits. Bulk `query().update()/delete()` statements
+carry no rows; they publish `"op": "invalidated"` for the resource (to the user the
+session was opened for), and clients refetch it. A client that falls too far behind
+receives `"op": "resync"` and should refetch everything.
+
+Delivery goes through a backend. The default delivers within this process, which is
+enough for a single worker. With several workers set BUFIN_EVENTS_URL to a Redis URL
+(needs the optional `redis` package): each worker publishes to a channel and
+delivers what it reads from it to its own subscribers.
+
+In-process listeners (`listen`) run in the worker that committed. Listeners that drop
+per-process caches register with `listen_everywhere` and also run, through the backend,
+in every other worker when it receives the events.
+"""
+import asyncio
+import json
+import os
+import threading
+import uuid
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect
+from database import SessionLocal
+
+# Table -> resource name in events. Derived tables (statistics, checkpoints,
+# occurrences) are not published; clients derive or refetch them.
+PUBLISHED = {
+    "transactions": "transactions",
+    "recurring_plans": "recurring_plans",
+    "debts": "debts",
+    "wishlist": "wishlist",
+    "goals": "goals",
+    "spending_alerts": "alerts",
+    "jobs": "jobs",
+    "ai_insights": "insights",
+    "users": "profile",
+}
+# Tables whose owner is not in `user_id`, and columns never sent to clients
+OWNER_COLUMNS = {"users": "id"}
+HIDDEN_COLUMNS = {"users": {"hashed_password", "shard"}}
+QUEUE_SIZE = 256
+CHANNEL = "bufin:events"
+
+class Broker:
+    """Subscribers of this process, keyed by user id. Safe to publish to from any thread."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, []).append(entry)
+        return entry
+
+    def unsubscribe(self, user_id, entry):
+        with self._lock:
+            entries = self._subscribers.get(user_id, [])
+            if entry in entries:
+                entries.remove(entry)
+            if not entries:
+                self._subscribers.pop(user_id, None)
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def deliver(self, user_id, events):
+        with self._lock:
+            entries = list(self._subscribers.get(user_id, ()))
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(_put, queue, events)
+            except RuntimeError:
+                # Loop already closed; the subscriber is going away
+                pass
+
+def _put(queue, events):
+    for item in events:
+        if queue.full():
+            # Too far behind for diffs to be useful
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"op": "resync"})
+            return
+        queue.put_nowait(item)
+
+class LocalBackend:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, user_id, events):
+        if self.broker.has_subscribers(user_id):
+            self.broker.deliver(user_id, jsonable_encoder(events))
+
+class RedisBackend:
+    """Fans events out to every worker through a Redis pub/sub channel."""
+    def __init__(self, broker, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("BUFIN_EVENTS_URL requires the redis package to be installed")
+        self.broker = broker
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._thread = None
+
+    def start(self):
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{CHANNEL: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._pubsub.close()
+            self._thread = None
+
+    def publish(self, user_id, events):
+        self._client.publish(CHANNEL, json.dumps(jsonable_encoder({"user_id": user_id, "events": events, "origin": ORIGIN})))
+
+    def _on_message(self, message):
+        payload = json.loads(message["data"])
+        if payload.get("origin") != ORIGIN:
+            # Our own commits already ran the listeners
+            _notify(_remote_listeners, payload["user_id"], payload["events"])
+        self.broker.deliver(payload["user_id"], payload["events"])
+
+broker = Broker()
+_listeners = []
+_remote_listeners = []
+# Identifies this process's messages on the shared channel
+ORIGIN = uuid.uuid4().hex
+
+def listen(fn):
+    """Also call `fn(user_id, events)` in this process after each commit that changed the user's data."""
+    _listeners.append(fn)
+    return fn
+
+def listen_everywhere(fn):
+    """Like `listen`, and also call `fn` for commits made by other workers (with a shared backend)."""
+    _remote_listeners.append(fn)
+    return listen(fn)
+
+def _notify(listeners, user_id, events):
+    # The write already committed; a failing listener only delays a refresh, and must
+    # not keep the others from running
+    for listener in listeners:
+        try:
+            listener(user_id, events)
+        except Exception as e:
+            print(f"Event listener {getattr(listener, '__qualname__', listener)} failed: {e}")
+
+def _create_backend():
+    url = os.getenv("BUFIN_EVENTS_URL", "")
+    return RedisBackend(broker, url) if url else LocalBackend(broker)
+
+backend = _create_backend()
+
+def publish(user_id, events):
+    if user_id and events:
+        backend.publish(user_id, events)
+
+def _row(state):
+    # Only what is already loaded: no SQL may be emitted from flush / commit hooks
+    hidden = HIDDEN_COLUMNS.get(state.mapper.persist_selectable.name, ())
+    return {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict and attr.key not in hidden}
+
+def _pending(session):
+    return session.info.setdefault("pending_events", [])
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect(session, flush_context):
+    pending = _pending(session)
+    for op, objects in (("created", session.new), ("updated", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            state = inspect(obj)
+            table = state.mapper.persist_selectable.name
+            resource = PUBLISHED.get(table)
+            if resource is None or (op == "updated" and not session.is_modified(obj)):
+                continue
+            row = _row(state)
+            event_ = {"resource": resource, "op": op, "id": row.get("id")}
+            if op != "deleted":
+                event_["data"] = row
+            pending.append((row.get(OWNER_COLUMNS.get(table, "user_id")), event_))
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _collect_bulk(state):
+    if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    resource = PUBLISHED.get(state.bind_mapper.persist_selectable.name)
+    user_id = state.session.info.get("user_id")
+    if not resource or not user_id:
+        return
+    result = state.invoke_statement()
+    if result.rowcount:
+        _pending(state.session).append((user_id, {"resource": resource, "op": "invalidated"}))
+    return result
+
+@event.listens_for(SessionLocal, "after_commit")
+def _flush_events(session):
+    by_user = {}
+    for user_id, event_ in session.info.pop("pending_events", []):
+        events = by_user.setdefault(user_id, [])
+        if event_["op"] != "invalidated" or event_ not in events:
+            events.append(event_)
+    for user_id, events in by_user.items():
+        _notify(_listeners, user_id, events)
+        try:
+            publish(user_id, events)
+        except Exception as e:
+            # A lost notification only delays a refresh
+            print(f"Failed to publish events: {e}")
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_events(session):
+    session.info.pop("pending_events", None)
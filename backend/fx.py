@@ -0,0 +1,202 @@
+"""
+Exchange rates and currency conversion.
+
+A transaction's `currency` is NULL when it is in the user's own currency (almost all of
+them) and an ISO code otherwise. Totals and balances are reported in the user's
+currency: rows in that currency are summed in SQL as before, and the other rows are
+summed per currency and day in the same query and converted here in one vectorized
+step, so a mixed-currency dashboard runs the same queries as a single-currency one.
+
+Rates are stored in `fx_rates` (primary database), one row per currency and day: how
+many units of the currency one unit of BASE (BUFIN_FX_BASE, default USD) bought that
+day. Load them from a CSV file with `date,currency,rate` columns, either with
+`python fx.py rates.csv` or by setting BUFIN_FX_RATES_FILE, which is loaded at startup.
+A conversion on a day uses the latest rate on or before it (the earliest rate for
+earlier days).
+
+Each process keeps the whole table in memory as sorted NumPy arrays per currency and
+re-reads it after CACHE_SECONDS, or at once after loading a file in this process.
+NumPy is only imported once rates are first used, keeping it off the startup path.
+"""
+import csv
+import hashlib
+import os
+import sys
+import threading
+import time
+from datetime import date
+from sqlalchemy import Float, Integer, cast, func, literal, text, type_coerce
+import models
+from money import from_minor, to_minor
+from database import engine
+
+BASE = os.getenv("BUFIN_FX_BASE", "USD").upper()
+RATES_FILE = os.getenv("BUFIN_FX_RATES_FILE", "")
+CACHE_SECONDS = 300
+
+UPSERT = """
+INSERT INTO fx_rates (id, currency, date, rate) VALUES (:id, :currency, :date, :rate)
+ON CONFLICT(id) DO UPDATE SET rate = excluded.rate
+"""
+
+class MissingRate(ValueError):
+    pass
+
+def normalize(currency, home):
+    """Stored form of a transaction currency: None for the user's own, else the ISO code."""
+    if not currency:
+        return None
+    code = currency.strip().upper()
+    home = (home or "").upper()
+    if code == home:
+        return None
+    table = rates()
+    for needed in (code, home):
+        # Both ends, or the row could not be converted for totals later
+        if not table.knows(needed):
+            raise MissingRate(f"No exchange rates for {needed or 'your currency'}")
+    return code
+
+# Amounts kept in the user's currency besides transactions, converted when it changes
+# (debt_balances follow the debts through their triggers)
+HOME_AMOUNTS = [
+    (models.RecurringPlan, ["amount"]),
+    (models.RecurringOccurrence, ["amount"]),
+    (models.Debt, ["amount"]),
+    (models.WishlistItem, ["cost"]),
+    (models.Goal, ["targetAmount", "currentAmount"]),
+]
+
+def change_home_currency(db, user, currency, today=None):
+    """
+    Switch a user's currency. Rows stored as NULL were in the old currency and are
+    stamped with it, rows already in the new one become NULL, and the user's balance,
+    income, savings goal, plans, debts, wishlist and goals are converted at today's
+    rate. Without rates for both currencies the amounts are relabelled as before, unless
+    there are foreign-currency rows, which could then no longer be totalled (MissingRate).
+    Returns whether anything was converted. Caller commits (and rebuilds statistics).
+    """
+    import numpy as np
+    old, new = (user.currency or "").upper(), currency.strip().upper()
+    if old == new:
+        return False
+    table, T = rates(), models.Transaction
+    if not (table.knows(old) and table.knows(new)):
+        if db.query(T.id).filter(T.user_id == user.id, T.currency.isnot(None)).first() is not None:
+            missing = new if not table.knows(new) else old or "your currency"
+            raise MissingRate(f"No exchange rates for {missing}")
+        user.currency = new
+        return False
+
+    db.query(T).filter(T.user_id == user.id, T.currency.is_(None)).update({T.currency: old}, synchronize_session=False)
+    db.query(T).filter(T.user_id == user.id, T.currency == new).update({T.currency: None}, synchronize_session=False)
+    day = np.array([(today or date.today()).isoformat()], dtype="datetime64[D]")
+    factor = float(table.per_base(new, day)[0] / table.per_base(old, day)[0])
+    for name in ("current_balance", "monthly_income", "savings_goal"):
+        value = getattr(user, name)
+        if value:
+            setattr(user, name, round(value * factor, 2))
+    for model, columns in HOME_AMOUNTS:
+        # On the stored minor units; a plain `* factor` would bind the factor as Money
+        values = {getattr(model, c): cast(func.round(type_coerce(getattr(model, c), Integer) * literal(factor, Float)), Integer) for c in columns}
+        db.query(model).filter(model.user_id == user.id).update(values, synchronize_session=False)
+    user.currency = new
+    return True
+
+class RateTable:
+    def __init__(self, rows):
+        # Identifies the rates, for results stored after converting with them
+        import numpy as np
+        self.version = hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest()[:16]
+        by_currency = {}
+        for currency, day, rate in rows:
+            by_currency.setdefault(currency, ([], []))
+            by_currency[currency][0].append(day[:10])
+            by_currency[currency][1].append(rate)
+        # Rows arrive ordered by currency and date
+        self._series = {
+            currency: (np.array(days, dtype="datetime64[D]"), np.array(values, dtype=np.float64))
+            for currency, (days, values) in by_currency.items()
+        }
+
+    def knows(self, currency):
+        return currency == BASE or currency in self._series
+
+    def per_base(self, currency, days):
+        """Units of `currency` per unit of BASE on each of `days` (datetime64[D] array)."""
+        import numpy as np
+        if currency == BASE:
+            return np.ones(len(days))
+        if currency not in self._series:
+            raise MissingRate(f"No exchange rates for {currency}")
+        known_days, values = self._series[currency]
+        index = np.searchsorted(known_days, days, side="right") - 1
+        return values[np.maximum(index, 0)]
+
+_table = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+def rates():
+    global _table, _loaded_at
+    with _lock:
+        if _table is None or time.monotonic() - _loaded_at > CACHE_SECONDS:
+            with engine.connect() as conn:
+                rows = conn.execute(text("SELECT currency, date, rate FROM fx_rates ORDER BY currency, date")).all()
+            _table, _loaded_at = RateTable(rows), time.monotonic()
+        return _table
+
+def invalidate():
+    global _table
+    with _lock:
+        _table = None
+
+def convert_minor(amounts, currencies, days, to, strict=True):
+    """
+    Convert integer minor-unit `amounts` in `currencies` on `days` (parallel sequences)
+    to `to`, rounded to whole minor units. Returns an int64 array. Rows without rates
+    for their currency or for `to` raise MissingRate, or with strict=False convert to 0
+    (left out of totals until the rates are loaded).
+    """
+    import numpy as np
+    amounts = np.asarray(amounts, dtype=np.float64)
+    currencies = np.asarray(currencies, dtype=object)
+    days = np.array([d[:10] for d in days], dtype="datetime64[D]")
+    table = rates()
+    result = np.zeros(len(amounts), dtype=np.float64)
+    to = (to or "").upper()
+    if not strict and not table.knows(to):
+        return result.astype(np.int64)
+    target = table.per_base(to, days)
+    for currency in set(currencies.tolist()):
+        if not strict and not table.knows(currency):
+            continue
+        mask = currencies == currency
+        result[mask] = amounts[mask] * target[mask] / table.per_base(currency, days[mask])
+    return np.rint(result).astype(np.int64)
+
+def convert(amount, currency, day, to):
+    """One major-unit amount, for per-row callers."""
+    if not currency or currency == to:
+        return amount
+    return float(from_minor(convert_minor([to_minor(amount)], [currency], [day], to)[0]))
+
+def load_file(path, bind=None):
+    """Upsert the rates in a `date,currency,rate` CSV file; returns the number of rows."""
+    rows = []
+    with open(path, newline="") as f:
+        for line in csv.DictReader(f):
+            day = date.fromisoformat(line["date"].strip()[:10]).isoformat()
+            currency = line["currency"].strip().upper()
+            rows.append({"id": f"{currency}:{day}", "currency": currency, "date": day, "rate": float(line["rate"])})
+    if rows:
+        with (bind or engine).begin() as conn:
+            conn.execute(text(UPSERT), rows)
+    invalidate()
+    return len(rows)
+
+if __name__ == "__main__":
+    import migrate_db
+    migrate_db.migrate()
+    for path in sys.argv[1:]:
+        print(f"Loaded {load_file(path)} rates from {path}")
@@ -0,0 +1,346 @@
+"""
+Precomputed AI alerts and tips.
+
+The dashboard's spending alert and tips used to call Gemini while the user waited,
+although they change at most a few times a day. They are now computed in the
+background from the user's own data and stored in `ai_insights`; GET /api/ai/alert and
+GET /api/ai/tips serve the stored result and only schedule a refresh when it is
+missing or older than its TTL.
+
+An in-process scheduler runs the refreshes:
+
+- every night, during the off-peak window starting at BUFIN_INSIGHTS_HOUR (default 3,
+  local time) and lasting BUFIN_INSIGHTS_WINDOW_MINUTES (default 120), for users who
+  asked for insights in the last ACTIVE_DAYS days, spread over the window by jitter;
+- DEBOUNCE_SECONDS (plus jitter) after a committed change to a user's transactions or
+  recurring plans, so a burst of edits causes one refresh;
+- when a request finds the stored result stale.
+
+At most BUFIN_INSIGHTS_CONCURRENCY (default 2) refreshes call the model at once. Each
+worker process schedules its own users' refreshes; stored results are shared. A refresh
+whose model call fails keeps the previous result (still reported stale) and is retried
+after RETRY_SECONDS.
+
+Reads never write: when a request's `lastRequestedAt` needs updating, the scheduler
+writes it in the background, batched every TOUCH_FLUSH_SECONDS.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import ai_service, analytics, balance_history, events, fx, models
+from database import SessionLocal, all_engines, shard_session
+from money import from_minor, to_minor
+
+KINDS = ("alert", "tips")
+TTL = {"alert": timedelta(hours=3), "tips": timedelta(hours=24)}
+# Resources whose changes make the insights outdated
+INPUT_RESOURCES = {"transactions", "recurring_plans"}
+OFF_PEAK_HOUR = int(os.getenv("BUFIN_INSIGHTS_HOUR", "3"))
+OFF_PEAK_WINDOW = timedelta(minutes=int(os.getenv("BUFIN_INSIGHTS_WINDOW_MINUTES", "120")))
+CONCURRENCY = int(os.getenv("BUFIN_INSIGHTS_CONCURRENCY", "2"))
+DEBOUNCE_SECONDS = 60
+CHANGE_JITTER_SECONDS = 30
+ACTIVE_DAYS = 7
+RETRY_SECONDS = 15 * 60
+# lastRequestedAt is only rewritten when older than this
+TOUCH_INTERVAL = timedelta(hours=1)
+TOUCH_FLUSH_SECONDS = 30
+RECENT_TRANSACTIONS = 200
+
+def _insight_id(user_id, kind):
+    return f"{user_id}:{kind}"
+
+def is_stale(insight, now=None):
+    if insight is None or insight.computedAt is None:
+        return True
+    return (now or datetime.utcnow()) - datetime.fromisoformat(insight.computedAt) > TTL[insight.kind]
+
+def _inputs(db, user):
+    """The payload the client used to send to /ai/alert and /ai/tips, built from stored data."""
+    T = models.Transaction
+    rows = (
+        db.query(T)
+        .filter(T.user_id == user.id)
+        .order_by(T.date.desc())
+        .limit(RECENT_TRANSACTIONS)
+        .all()
+    )
+    transactions = [
+        {"date": t.date, "amount": t.amount, "type": t.type, "category": t.category,
+         "description": t.description, "merchant": t.merchant, "necessity": t.necessity}
+        for t in rows
+    ]
+    # The prompts add amounts up, so foreign-currency rows are given in the user's currency too
+    foreign = [(i, t) for i, t in enumerate(rows) if t.currency and fx.rates().knows(t.currency)]
+    if foreign and fx.rates().knows(user.currency):
+        converted = fx.convert_minor([to_minor(t.amount) for _, t in foreign], [t.currency for _, t in foreign], [t.date for _, t in foreign], user.currency)
+        for (i, t), minor in zip(foreign, converted.tolist()):
+            transactions[i].update(amount=float(from_minor(minor)), originalAmount=t.amount, originalCurrency=t.currency)
+    for transaction, t in zip(transactions, rows):
+        if t.currency and "originalCurrency" not in transaction:
+            # No rates to convert it with: keep it labelled rather than failing the refresh
+            transaction["currency"] = t.currency
+    plans = [
+        {"name": p.name, "amount": p.amount, "type": p.type, "frequency": p.frequency,
+         "expectedDate": p.expectedDate, "endDate": p.endDate}
+        for p in db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == user.id)
+    ]
+    today = date.today()
+    balance = float(balance_history.daily_series(db, user, today, today)[0][1])
+    return transactions, balance, plans
+
+async def _generate(kind, transactions, balance, plans, currency, frame):
+    if kind == "alert":
+        return await ai_service.generate_spending_alert(transactions, balance, plans, currency, frame=frame, raise_errors=True)
+    return await ai_service.generate_financial_tips(transactions, balance, currency, raise_errors=True)
+
+def _shard_of(user_id):
+    db = SessionLocal()
+    try:
+        return db.query(models.User.shard).filter(models.User.id == user_id).scalar()
+    finally:
+        db.close()
+
+def _get_or_add(db, user_id, kind):
+    insight = db.query(models.AIInsight).filter(models.AIInsight.id == _insight_id(user_id, kind)).first()
+    if insight is None:
+        insight = models.AIInsight(id=_insight_id(user_id, kind), user_id=user_id, kind=kind)
+        db.add(insight)
+    return insight
+
+def refresh(user_id, kind):
+    """Recompute and store one insight. Runs on a scheduler worker thread."""
+    if not ai_service.get_api_key():
+        return
+    shard = _shard_of(user_id)
+    if shard is None:
+        # Account deleted since the refresh was scheduled
+        return
+
+    db = shard_session(shard)
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        transactions, balance, plans = _inputs(db, user)
+        frame = analytics.frame_for(db, user)
+        try:
+            content = asyncio.run(_generate(kind, transactions, balance, plans, user.currency, frame))
+        except ai_service.GenerationFailed:
+            # Keep serving the previous result rather than storing a failure as fresh
+            scheduler.retry(user_id, kind)
+            return
+        insight = _get_or_add(db, user_id, kind)
+        insight.content = json.dumps(content)
+        insight.computedAt = datetime.utcnow().isoformat()
+        db.commit()
+    finally:
+        db.close()
+
+def read(db, user, kind):
+    """(insight, refresh scheduled) for a request, without writing; schedules a refresh when stale."""
+    insight = db.query(models.AIInsight).filter(models.AIInsight.id == _insight_id(user.id, kind)).first()
+    now = datetime.utcnow()
+    if insight is None or insight.lastRequestedAt is None or now - datetime.fromisoformat(insight.lastRequestedAt) > TOUCH_INTERVAL:
+        scheduler.touch(user.id, kind, now.isoformat())
+    if insight is None:
+        # Not stored yet; nothing is added to the request's session
+        insight = models.AIInsight(id=_insight_id(user.id, kind), user_id=user.id, kind=kind)
+    if is_stale(insight, now):
+        scheduler.request(user.id, kind)
+    return insight, scheduler.is_pending(user.id, kind)
+
+def _store_touches(touched):
+    """Write lastRequestedAt for {(user_id, kind): time}, creating missing rows."""
+    by_shard = {}
+    for (user_id, kind), when in touched.items():
+        shard = _shard_of(user_id)
+        if shard is not None:
+            by_shard.setdefault(shard, []).append((user_id, kind, when))
+    for shard, rows in by_shard.items():
+        db = shard_session(shard)
+        try:
+            for user_id, kind, when in rows:
+                _get_or_add(db, user_id, kind).lastRequestedAt = when
+            db.commit()
+        finally:
+            db.close()
+
+def _active_users():
+    cutoff = (datetime.utcnow() - timedelta(days=ACTIVE_DAYS)).isoformat()
+    users = set()
+    for shard in all_engines():
+        db = shard_session(shard)
+        try:
+            A = models.AIInsight
+            users.update(user_id for (user_id,) in db.query(A.user_id).filter(A.lastRequestedAt >= cutoff).distinct())
+        finally:
+            db.close()
+    return users
+
+def _next_off_peak(now=None):
+    now = now or datetime.now()
+    start = now.replace(hour=OFF_PEAK_HOUR, minute=0, second=0, microsecond=0)
+    return start if start > now else start + timedelta(days=1)
+
+class Scheduler:
+    """Due-time queue of (user, kind) refreshes, drained by a capped thread pool."""
+    SWEEP = ("", "sweep")
+    TOUCH = ("", "touch")
+
+    def __init__(self, concurrency=CONCURRENCY):
+        self.concurrency = concurrency
+        self._heap = []
+        self._due = {}
+        self._touched = {}
+        # Refreshes handed to the pool, and the earliest time a failed one may run again
+        self._running = set()
+        self._not_before = {}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._executor = None
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="insights")
+            self._thread = threading.Thread(target=self._run, name="insights-scheduler", daemon=True)
+            self._thread.start()
+        self._push(self.SWEEP, time.time() + (_next_off_peak() - datetime.now()).total_seconds())
+
+    def stop(self):
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._flush_touches()
+
+    def schedule(self, user_id, kind, delay=0.0, jitter=0.0):
+        self._push((user_id, kind), time.time() + delay + random.uniform(0, jitter))
+
+    def request(self, user_id, kind):
+        """Refresh a stale insight a request found, unless one is pending or waiting out a retry."""
+        key = (user_id, kind)
+        with self._cond:
+            if key in self._due or key in self._running:
+                return
+            due = max(time.time(), self._not_before.get(key, 0.0))
+        self._push(key, due)
+
+    def retry(self, user_id, kind):
+        """Schedule a failed refresh again after RETRY_SECONDS; stale reads meanwhile wait too."""
+        due = time.time() + RETRY_SECONDS
+        with self._cond:
+            self._not_before[(user_id, kind)] = due
+        self._push((user_id, kind), due)
+
+    def touch(self, user_id, kind, when):
+        """Record a request for the insight; stored by the scheduler thread, not the request."""
+        with self._cond:
+            self._touched[(user_id, kind)] = when
+        self._push(self.TOUCH, time.time() + TOUCH_FLUSH_SECONDS)
+
+    def is_pending(self, user_id, kind):
+        with self._cond:
+            return (user_id, kind) in self._due or (user_id, kind) in self._running
+
+    def on_change(self, user_id, changes):
+        if any(change.get("resource") in INPUT_RESOURCES for change in changes):
+            for kind in KINDS:
+                self.schedule(user_id, kind, delay=DEBOUNCE_SECONDS, jitter=CHANGE_JITTER_SECONDS)
+
+    def _push(self, key, due):
+        with self._cond:
+            # An earlier refresh already covers a later request for the same insight
+            if key in self._due and self._due[key] <= due:
+                return
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, next(self._order), key))
+            self._cond.notify()
+
+    def _pop_due(self):
+        with self._cond:
+            while not self._stopping:
+                if self._heap and self._heap[0][0] <= time.time():
+                    due, _, key = heapq.heappop(self._heap)
+                    if self._due.get(key) != due:
+                        # Superseded by an earlier schedule
+                        continue
+                    del self._due[key]
+                    if key not in (self.SWEEP, self.TOUCH):
+                        self._running.add(key)
+                    return key
+                timeout = self._heap[0][0] - time.time() if self._heap else None
+                self._cond.wait(timeout)
+            return None
+
+    def _run(self):
+        while True:
+            key = self._pop_due()
+            if key is None:
+                return
+            if key == self.SWEEP:
+                self._sweep()
+                continue
+            if key == self.TOUCH:
+                self._flush_touches()
+                continue
+            # Blocks the scheduler, not the callers, while the pool is full
+            self._slots.acquire()
+            try:
+                self._executor.submit(self._refresh, *key)
+            except RuntimeError:
+                self._slots.release()
+                self._done(key)
+                return
+
+    def _sweep(self):
+        window = OFF_PEAK_WINDOW.total_seconds()
+        try:
+            users = _active_users()
+        except Exception as e:
+            print(f"Insights sweep failed: {e}")
+            users = ()
+        for user_id in users:
+            for kind in KINDS:
+                self.schedule(user_id, kind, jitter=window)
+        self._push(self.SWEEP, time.time() + (_next_off_peak() - datetime.now()).total_seconds())
+
+    def _flush_touches(self):
+        with self._cond:
+            touched, self._touched = self._touched, {}
+        try:
+            _store_touches(touched)
+        except Exception as e:
+            print(f"Failed to store insight requests: {e}")
+
+    def _refresh(self, user_id, kind):
+        try:
+            refresh(user_id, kind)
+        except Exception as e:
+            print(f"Insight refresh failed for {user_id} ({kind}): {e}")
+        finally:
+            self._done((user_id, kind))
+            self._slots.release()
+
+    def _done(self, key):
+        with self._cond:
+            self._running.discard(key)
+            if self._not_before.get(key, 0.0) <= time.time():
+                self._not_before.pop(key, None)
+
+scheduler = Scheduler()
+events.listen(scheduler.on_change)
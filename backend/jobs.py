@@ -0,0 +1,227 @@
+"""
+In-process background jobs.
+
+Heavy per-user work (account deletion, exports, rebuilds, imports) is enqueued as a
+persistent `models.Job` row and executed by a small pool of worker threads, so the
+request can return 202 immediately. Clients poll `/api/jobs/{id}` for progress and
+can request cancellation; handlers call `ctx.check_cancelled()` between steps, and
+`ctx.commit_to_finish()` before a step that must not be left half done.
+
+Jobs left queued or running when the process stopped are picked up again on start().
+"""
+import json
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime
+from sqlalchemy import func, or_
+import models
+from database import SessionLocal, shard_session
+
+HANDLERS = {}
+
+def handler(kind):
+    """Register `fn(ctx)` as the handler for jobs of this kind."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+class JobCancelled(Exception):
+    pass
+
+# Progress recorded by `JobContext.commit_to_finish`, before any real progress
+STARTED_PROGRESS = 0.001
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+class JobContext:
+    def __init__(self, job_id, user_id, params, session_factory):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.params = params
+        self.session_factory = session_factory
+
+    def _session(self):
+        # Owned by the job's user, so bulk updates are published to them (see events.py)
+        return self.session_factory(info={"user_id": self.user_id})
+
+    def _update(self, **fields):
+        db = self._session()
+        try:
+            # Through the ORM, so clients get the updated row in the job's event
+            job = db.get(models.Job, self.job_id)
+            for name, value in fields.items():
+                setattr(job, name, value)
+            db.commit()
+        finally:
+            db.close()
+
+    def user_session(self):
+        """Session on the job owner's shard, for handlers that touch their data."""
+        db = self.session_factory()
+        try:
+            shard = db.query(models.User.shard).filter(models.User.id == self.user_id).scalar()
+        finally:
+            db.close()
+        return shard_session(shard)
+
+    def progress(self, fraction, message=None):
+        self._update(progress=max(0.0, min(1.0, fraction)), message=message)
+
+    def commit_to_finish(self, message=None):
+        """
+        Claim the point of no return: atomically record progress unless a cancel was
+        requested first (then JobCancelled). Cancels that require no progress yet
+        (`JobQueue.cancel(..., before_progress=True)`) are refused from here on.
+        """
+        db = self._session()
+        try:
+            J = models.Job
+            # A job resumed after a restart may be past the point already
+            claimed = (
+                db.query(J)
+                .filter(J.id == self.job_id, or_(J.cancelRequested.is_(False), J.progress > 0))
+                .update({"progress": func.max(J.progress, STARTED_PROGRESS), "message": message}, synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        if not claimed:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        db = self.session_factory()
+        try:
+            cancelled = db.query(models.Job.cancelRequested).filter(models.Job.id == self.job_id).scalar()
+        finally:
+            db.close()
+        if cancelled:
+            raise JobCancelled()
+
+class JobQueue:
+    def __init__(self, session_factory=SessionLocal, workers=2):
+        self.session_factory = session_factory
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._resume()
+
+    def stop(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def enqueue(self, kind, user_id, params=None):
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        db = self.session_factory()
+        try:
+            job = models.Job(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                kind=kind,
+                params=json.dumps(params or {}),
+                status="queued",
+                progress=0.0,
+                cancelRequested=False,
+                createdAt=_now(),
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+        self.start()
+        self._queue.put(job.id)
+        return job
+
+    def cancel(self, db, job, before_progress=False):
+        """
+        Cancel a queued job outright; a running job stops at its next checkpoint. With
+        `before_progress`, only while the job has recorded no progress. Returns the job,
+        or None when it could no longer be cancelled.
+        """
+        J = models.Job
+        pending = db.query(J).filter(J.id == job.id, J.status.in_(["queued", "running"]))
+        if before_progress:
+            pending = pending.filter(J.progress == 0)
+        # Conditional updates, so a worker claiming the job at the same time either
+        # sees the cancel or makes this match nothing
+        cancelled = pending.filter(J.status == "queued").update(
+            {"status": "cancelled", "finishedAt": _now(), "cancelRequested": True}, synchronize_session=False,
+        ) or pending.update({"cancelRequested": True}, synchronize_session=False)
+        db.commit()
+        if not cancelled:
+            return None
+        db.refresh(job)
+        return job
+
+    def _resume(self):
+        db = self.session_factory()
+        try:
+            pending = db.query(models.Job).filter(models.Job.status.in_(["queued", "running"])).order_by(models.Job.createdAt).all()
+            for job in pending:
+                job.status = "queued"
+            db.commit()
+            ids = [job.id for job in pending]
+        finally:
+            db.close()
+        for job_id in ids:
+            self._queue.put(job_id)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._execute(job_id)
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+
+    def _execute(self, job_id):
+        db = self.session_factory()
+        try:
+            # The owner receives the claim's event
+            db.info["user_id"] = db.query(models.Job.user_id).filter(models.Job.id == job_id).scalar()
+            # Claim atomically so a job queued twice (e.g. resumed on start) runs once
+            claimed = db.query(models.Job).filter(models.Job.id == job_id, models.Job.status == "queued").update({"status": "running", "startedAt": _now()}, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return
+            job = db.query(models.Job).filter(models.Job.id == job_id).first()
+            ctx = JobContext(job.id, job.user_id, json.loads(job.params or "{}"), self.session_factory)
+            kind = job.kind
+        finally:
+            db.close()
+
+        fields = {}
+        try:
+            result = HANDLERS[kind](ctx)
+            fields.update(status="succeeded", progress=1.0, result=json.dumps(result) if result is not None else None)
+        except JobCancelled:
+            fields.update(status="cancelled", message="Cancelled")
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {e}")
+            fields.update(status="failed", error=str(e))
+        fields["finishedAt"] = _now()
+        ctx._update(**fields)
+
+job_queue = JobQueue(workers=int(os.getenv("BUFIN_JOB_WORKERS", "2")))
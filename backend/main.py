@@ -1,18 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+import os
+from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from typing import List
-import models, schemas, auth_utils
-from database import SessionLocal, engine, get_db
-import uuid
-from datetime import timedelta
-from routers import auth, goals, transactions, recurring, debts, ai
+import ai_service, events, fx, insights, migrate_db, profiler, write_batcher
+from jobs import job_queue
+from routers import auth, goals, transactions, recurring, debts, ai, jobs, export, alerts, batch, admin, analytics, events as event_stream
 
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema work runs once per worker start instead of at import time.
+    # Set BUFIN_AUTO_MIGRATE=0 when migrations are applied by `python migrate_db.py`.
+    if os.getenv("BUFIN_AUTO_MIGRATE", "1") == "1":
+        migrate_db.migrate()
+    if fx.RATES_FILE:
+        fx.load_file(fx.RATES_FILE)
+    # The AI stack is imported lazily on the first AI call unless eager mode is requested
+    if os.getenv("BUFIN_PRELOAD_AI", "0") == "1":
+        ai_service.preload()
+    # Resume jobs that were queued or running when the previous worker stopped
+    job_queue.start()
+    events.backend.start()
+    if os.getenv("BUFIN_INSIGHTS_SCHEDULER", "1") == "1":
+        insights.scheduler.start()
+    yield
+    insights.scheduler.stop()
+    job_queue.stop()
+    write_batcher.batcher.stop()
+    events.backend.stop()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS Middleware
 app.add_middleware(
@@ -23,19 +40,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request profiling (see profiler.py); not installed unless configured
+if profiler.enabled:
+    app.add_middleware(profiler.ProfilerMiddleware)
+
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(goals.router, prefix="/api", tags=["goals"])
 app.include_router(transactions.router, prefix="/api", tags=["transactions"])
 app.include_router(recurring.router, prefix="/api", tags=["recurring"])
 app.include_router(debts.router, prefix="/api", tags=["debts"])
 app.include_router(ai.router, prefix="/api", tags=["ai"])
+app.include_router(jobs.router, prefix="/api", tags=["jobs"])
+app.include_router(export.router, prefix="/api", tags=["export"])
+app.include_router(alerts.router, prefix="/api", tags=["alerts"])
+app.include_router(analytics.router, prefix="/api", tags=["analytics"])
+app.include_router(batch.router, prefix="/api", tags=["batch"])
+app.include_router(event_stream.router, prefix="/api", tags=["events"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
 
-from google.api_core.exceptions import ResourceExhausted
-
-@app.exception_handler(ResourceExhausted)
+@app.exception_handler(ai_service.AIQuotaExceeded)
 async def resource_exhausted_handler(request, exc):
     return JSONResponse(
         status_code=429,
         content={"detail": "AI Quota Exceeded. Please try again later."},
     )
-
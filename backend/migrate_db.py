@@ -1,13 +1,186 @@
-import sqlite3
+"""
+Explicit schema setup and migrations.
 
-conn = sqlite3.connect('bufin.db')
-cursor = conn.cursor()
+Run `python migrate_db.py` before starting workers in production (and set
+BUFIN_AUTO_MIGRATE=0), or let the app run it once from its lifespan hook.
+"""
+from sqlalchemy import Column, Integer, MetaData, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql import visitors
+import models, anomalies, balance_history, netting, search
+from database import Base, all_engines
 
-try:
-    cursor.execute("ALTER TABLE recurring_plans ADD COLUMN endDate VARCHAR")
-    print("Successfully added endDate column.")
-except Exception as e:
-    print(f"Error (might already exist): {e}")
+def add_recurring_end_date(conn):
+    columns = [c["name"] for c in inspect(conn).get_columns("recurring_plans")]
+    if "endDate" not in columns:
+        conn.execute(text("ALTER TABLE recurring_plans ADD COLUMN endDate VARCHAR"))
 
-conn.commit()
-conn.close()
+def create_transaction_search_index(conn):
+    search.create_index(conn)
+
+def create_missing_indexes(conn):
+    # create_all only indexes tables it creates; older databases need them added
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+        for index in table.indexes:
+            # Indexes on columns added by a later migration are created by that migration,
+            # including those in a partial index's WHERE
+            where = index.dialect_options["sqlite"]["where"]
+            columns = list(index.columns) + ([e for e in visitors.iterate(where) if isinstance(e, Column)] if where is not None else [])
+            if all(column.name in existing for column in columns):
+                index.create(conn, checkfirst=True)
+
+# Float columns that now hold integer minor units (see money.py)
+MONEY_COLUMNS = {
+    "transactions": ["amount"],
+    "recurring_plans": ["amount"],
+    "debts": ["amount"],
+    "wishlist": ["cost"],
+    "goals": ["targetAmount", "currentAmount"],
+    "users": ["monthly_income", "current_balance", "savings_goal"],
+}
+
+def convert_amounts_to_minor_units(conn):
+    for table, columns in MONEY_COLUMNS.items():
+        for column in columns:
+            conn.execute(text(
+                f'UPDATE {table} SET "{column}" = CAST(ROUND("{column}" * 100) AS INTEGER) WHERE "{column}" IS NOT NULL'
+            ))
+
+def rebuild_money_columns_as_integer(conn):
+    # The conversion above left the values whole but the columns declared FLOAT, so
+    # SQLite kept REAL affinity. SQLite cannot change a column's type in place; use its
+    # table rebuild recipe: create the new table, copy, drop the old one, rename, then
+    # recreate the old table's indexes and triggers. (Foreign key enforcement is off on
+    # the app's connections, so dropping `users` does not touch rows referring to it.)
+    if conn.dialect.name != "sqlite":
+        return
+    for name, columns in MONEY_COLUMNS.items():
+        if not inspect(conn).has_table(name):
+            continue
+        existing = {c["name"]: c["type"] for c in inspect(conn).get_columns(name)}
+        if all(isinstance(existing.get(column), Integer) for column in columns):
+            continue
+        schema = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE tbl_name = :t AND type IN ('index', 'trigger') AND sql IS NOT NULL"),
+            {"t": name},
+        ).scalars().all()
+        table = Base.metadata.tables[name]
+        # A copy of the schema, so the new table's foreign keys resolve
+        metadata = MetaData()
+        for other in Base.metadata.sorted_tables:
+            other.to_metadata(metadata)
+        conn.execute(CreateTable(table.to_metadata(metadata, name=f"new_{name}")))
+        # Columns a later migration adds are created empty and skipped by that migration
+        shared = [c.name for c in table.columns if c.name in existing]
+        names = ", ".join(f'"{c}"' for c in shared)
+        values = ", ".join(f'CAST("{c}" AS INTEGER)' if c in columns else f'"{c}"' for c in shared)
+        # Rowids are kept: the search index refers to transactions by rowid
+        conn.execute(text(f"INSERT INTO new_{name} (rowid, {names}) SELECT rowid, {values} FROM {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        conn.execute(text(f"ALTER TABLE new_{name} RENAME TO {name}"))
+        for sql in schema:
+            conn.execute(text(sql))
+    problems = conn.execute(text("PRAGMA foreign_key_check")).all()
+    if problems:
+        print(f"Warning: {len(problems)} rows refer to missing parent rows")
+
+def create_debt_balance_index(conn):
+    # The triggers now read debts.counterparty, which a later step adds
+    add_debt_counterparty(conn)
+
+def add_user_shard(conn):
+    columns = [c["name"] for c in inspect(conn).get_columns("users")]
+    if "shard" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN shard VARCHAR"))
+    conn.execute(text("UPDATE users SET shard = 'default' WHERE shard IS NULL"))
+
+def create_balance_checkpoint_index(conn):
+    balance_history.create_index(conn)
+
+def add_transaction_currency(conn):
+    columns = [c["name"] for c in inspect(conn).get_columns("transactions")]
+    if "currency" not in columns:
+        conn.execute(text("ALTER TABLE transactions ADD COLUMN currency VARCHAR"))
+    create_missing_indexes(conn)
+    # The checkpoint triggers now leave foreign-currency rows to fx.py
+    balance_history.drop_index(conn)
+    balance_history.create_index(conn)
+
+def add_user_deletion_requested_at(conn):
+    columns = [c["name"] for c in inspect(conn).get_columns("users")]
+    if "deletion_requested_at" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN deletion_requested_at VARCHAR"))
+
+def rematerialize_recurring_occurrences(conn):
+    # Weekly and yearly plans were expanded as monthly; windows are rebuilt on next read
+    conn.execute(text("DELETE FROM recurring_occurrences"))
+    conn.execute(text("DELETE FROM occurrence_windows"))
+
+def create_balance_fx_checkpoints(conn):
+    # The checkpoint triggers now also invalidate converted foreign checkpoints
+    balance_history.drop_index(conn)
+    balance_history.create_index(conn)
+
+def rebuild_spending_stats(conn):
+    # Statistics built so far never unwound edits and deletes
+    db = Session(bind=conn)
+    try:
+        for user_id in conn.execute(text("SELECT DISTINCT user_id FROM transactions")).scalars().all():
+            anomalies.rebuild(db, user_id)
+        db.flush()
+    finally:
+        db.close()
+
+def add_debt_counterparty(conn):
+    # Balances were keyed with SQLite's ASCII-only lower(trim()); key every debt in Python
+    columns = [c["name"] for c in inspect(conn).get_columns("debts")]
+    if "counterparty" not in columns:
+        conn.execute(text("ALTER TABLE debts ADD COLUMN counterparty VARCHAR"))
+    rows = conn.execute(text("SELECT id, personName FROM debts")).all()
+    if rows:
+        conn.execute(text("UPDATE debts SET counterparty = :key WHERE id = :id"),
+                     [{"id": id, "key": models.counterparty_key(name)} for id, name in rows])
+    netting.drop_index(conn)
+    netting.create_index(conn)
+
+# Applied in order; the index of the last applied step is stored in schema_version
+MIGRATIONS = [
+    add_recurring_end_date,
+    create_transaction_search_index,
+    create_missing_indexes,
+    convert_amounts_to_minor_units,
+    create_debt_balance_index,
+    add_user_shard,
+    create_balance_checkpoint_index,
+    add_transaction_currency,
+    add_user_deletion_requested_at,
+    rebuild_money_columns_as_integer,
+    rematerialize_recurring_occurrences,
+    create_balance_fx_checkpoints,
+    rebuild_spending_stats,
+    add_debt_counterparty,
+]
+
+def migrate(bind=None):
+    """Bring one database (or, by default, the primary and every shard) up to date."""
+    if bind is None:
+        for shard_engine in all_engines().values():
+            migrate(shard_engine)
+        return
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        version = conn.execute(text("SELECT version FROM schema_version")).scalar()
+        if version is None:
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (0)"))
+            version = 0
+        for step in MIGRATIONS[version:]:
+            print(f"Applying migration: {step.__name__}")
+            step(conn)
+        conn.execute(text("UPDATE schema_version SET version = :v"), {"v": len(MIGRATIONS)})
+
+if __name__ == "__main__":
+    migrate()
+    print("Database schema is up to date.")
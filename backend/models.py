@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Index
+from sqlalchemy.orm import relationship, validates
 from database import Base
+from money import Money
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -8,60 +9,213 @@ class Transaction(Base):
     id = Column(String, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.id"))
     date = Column(String)
-    amount = Column(Float)
+    amount = Column(Money)
     category = Column(String)
     description = Column(String)
     merchant = Column(String)
     type = Column(String) # 'income' or 'expense'
     necessity = Column(String) # 'fixed' or 'variable'
     remarks = Column(String, nullable=True)
+    currency = Column(String, nullable=True) # ISO code; NULL when in the user's currency (see fx.py)
+
+    # Every ledger query filters on user_id, then on a date range and optionally category/type
+    __table_args__ = (
+        Index("ix_transactions_user_date", "user_id", "date"),
+        Index("ix_transactions_user_category_date", "user_id", "category", "date"),
+        Index("ix_transactions_user_type_date", "user_id", "type", "date"),
+        # Keeps the lookup of foreign-currency rows free for single-currency users
+        Index("ix_transactions_user_foreign_date", "user_id", "date", sqlite_where=currency.isnot(None)),
+    )
+
+class BalanceCheckpoint(Base):
+    """Running net of a user's transactions up to the end of a month (see balance_history.py)."""
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (
+        Index("ix_balance_checkpoints_user_month", "user_id", "month"),
+    )
+
+    id = Column(String, primary_key=True) # "<user_id>:<YYYY-MM>"
+    user_id = Column(String, ForeignKey("users.id"))
+    month = Column(String) # YYYY-MM
+    net = Column(Money, default=0.0)
+
+class BalanceFxCheckpoint(Base):
+    """Running net of a user's foreign-currency transactions, converted, up to the end of a month (see balance_history.py)."""
+    __tablename__ = "balance_fx_checkpoints"
+    __table_args__ = (
+        Index("ix_balance_fx_checkpoints_user_month", "user_id", "month"),
+    )
+
+    id = Column(String, primary_key=True) # "<user_id>:<YYYY-MM>"
+    user_id = Column(String, ForeignKey("users.id"))
+    month = Column(String) # YYYY-MM
+    net = Column(Money, default=0.0)
+    currency = Column(String) # The user's currency `net` is in
+    rates = Column(String) # fx.RateTable.version it was converted with
 
 class RecurringPlan(Base):
     __tablename__ = "recurring_plans"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
     name = Column(String)
-    amount = Column(Float)
+    amount = Column(Money)
     type = Column(String)
     frequency = Column(String)
     expectedDate = Column(String)
     endDate = Column(String, nullable=True)
 
+class RecurringOccurrence(Base):
+    """One materialized occurrence of a recurring plan (see occurrences.py)."""
+    __tablename__ = "recurring_occurrences"
+    __table_args__ = (
+        Index("ix_recurring_occurrences_user_date", "user_id", "date"),
+    )
+
+    id = Column(String, primary_key=True) # "<plan_id>:<date>"
+    user_id = Column(String, ForeignKey("users.id"))
+    plan_id = Column(String, ForeignKey("recurring_plans.id"), index=True)
+    date = Column(String) # YYYY-MM-DD
+    name = Column(String)
+    amount = Column(Money)
+    type = Column(String)
+
+class OccurrenceWindow(Base):
+    """Date range currently materialized in recurring_occurrences for a user."""
+    __tablename__ = "occurrence_windows"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    startDate = Column(String)
+    endDate = Column(String)
+
+def counterparty_key(name):
+    """Key grouping debts with one person: the name trimmed and lower-cased (Unicode-aware)."""
+    return (name or "").strip().lower()
+
 class Debt(Base):
     __tablename__ = "debts"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
     personName = Column(String)
-    amount = Column(Float)
+    counterparty = Column(String) # normalised personName, set with it (see netting.py)
+    amount = Column(Money)
     direction = Column(String) # 'payable' or 'receivable'
     dueDate = Column(String, nullable=True)
     status = Column(String, default='active')
 
+    @validates("personName")
+    def _set_counterparty(self, key, name):
+        self.counterparty = counterparty_key(name)
+        return name
+
+class DebtBalance(Base):
+    """Net open balance with one counterparty, maintained by triggers on `debts` (see netting.py)."""
+    __tablename__ = "debt_balances"
+
+    id = Column(String, primary_key=True) # "<user_id>:<normalised counterparty name>"
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    counterparty = Column(String) # lower-cased, trimmed personName
+    personName = Column(String)
+    balance = Column(Money, default=0.0) # positive: they owe the user; negative: the user owes them
+    openCount = Column(Integer, default=0)
+
+class SpendingStat(Base):
+    """Running statistics of one spend series for a user (see anomalies.py)."""
+    __tablename__ = "spending_stats"
+
+    id = Column(String, primary_key=True) # "<user_id>:<scope>:<key>"
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    scope = Column(String) # 'category', 'merchant' or 'category_day'
+    key = Column(String)
+    n = Column(Integer, default=0)
+    mean = Column(Float, default=0.0)
+    m2 = Column(Float, default=0.0) # Welford sum of squared deviations
+    ewma = Column(Float, default=0.0)
+    ewvar = Column(Float, default=0.0)
+    lastDay = Column(String, nullable=True) # category_day only: day being accumulated
+    dayTotal = Column(Float, default=0.0)
+
+class SpendingAlert(Base):
+    """Unusual spend flagged when a transaction was written."""
+    __tablename__ = "spending_alerts"
+    __table_args__ = (
+        Index("ix_spending_alerts_user_created", "user_id", "createdAt"),
+    )
+
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"))
+    transaction_id = Column(String, ForeignKey("transactions.id"), nullable=True)
+    date = Column(String) # YYYY-MM-DD of the transaction
+    scope = Column(String)
+    key = Column(String)
+    amount = Column(Money)
+    expected = Column(Float)
+    zscore = Column(Float)
+    message = Column(String)
+    seen = Column(Boolean, default=False)
+    createdAt = Column(String)
+
 class WishlistItem(Base):
     __tablename__ = "wishlist"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
     name = Column(String)
-    cost = Column(Float)
+    cost = Column(Money)
     addedAt = Column(String)
 
 class Goal(Base):
     __tablename__ = "goals"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
     name = Column(String)
-    targetAmount = Column(Float)
-    currentAmount = Column(Float, default=0.0)
+    targetAmount = Column(Money)
+    currentAmount = Column(Money, default=0.0)
     targetDate = Column(String, nullable=True)
     icon = Column(String, default="PiggyBank")
     fundingSource = Column(String, default="manual")
     type = Column(String, default="savings") # 'savings' or 'investment'
     projectedReturnRate = Column(Float, default=0.0) # For investment goals
 
+class AIInsight(Base):
+    """Precomputed AI output for a user (see insights.py)."""
+    __tablename__ = "ai_insights"
+
+    id = Column(String, primary_key=True) # "<user_id>:<kind>"
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    kind = Column(String) # 'alert' or 'tips'
+    content = Column(String, nullable=True) # JSON string
+    computedAt = Column(String, nullable=True)
+    lastRequestedAt = Column(String, nullable=True) # users who asked recently get the off-peak refresh
+
+class IdempotencyKey(Base):
+    """Stored outcome of a keyed /batch request, replayed when the key is retried."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_user_created", "user_id", "createdAt"),
+    )
+
+    id = Column(String, primary_key=True) # "<user_id>:<key>"
+    user_id = Column(String, ForeignKey("users.id"))
+    key = Column(String)
+    requestHash = Column(String) # sha256 of the canonical request body
+    response = Column(String) # JSON string
+    createdAt = Column(String)
+
+class FxRate(Base):
+    # Exchange rates, loaded from a file (see fx.py); lives in the primary database
+    __tablename__ = "fx_rates"
+    __table_args__ = (
+        Index("ix_fx_rates_currency_date", "currency", "date"),
+    )
+
+    id = Column(String, primary_key=True) # "<currency>:<YYYY-MM-DD>"
+    currency = Column(String)
+    date = Column(String)
+    rate = Column(Float) # units of the currency per unit of fx.BASE
+
 class User(Base):
     __tablename__ = "users"
 
@@ -72,10 +226,29 @@ class User(Base):
     
     # Profile Data
     currency = Column(String, default="INR")
-    monthly_income = Column(Float, default=0.0)
-    current_balance = Column(Float, default=0.0)
-    savings_goal = Column(Float, default=0.0)
+    monthly_income = Column(Money, default=0.0)
+    current_balance = Column(Money, default=0.0)
+    savings_goal = Column(Money, default=0.0)
     financial_literacy = Column(String, default="beginner") # beginner, intermediate, advanced
     risk_tolerance = Column(String, default="low") # low, medium, high
     goals = Column(String, default="[]") # JSON string of goals
+    shard = Column(String, default="default") # Database holding this user's data (see sharding.py)
+    deletion_requested_at = Column(String, nullable=True) # Set once account deletion is queued; the account is locked from then on
+
 
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, index=True) # No FK: the record outlives the user on account deletion
+    kind = Column(String)
+    params = Column(String, default="{}") # JSON string
+    status = Column(String, default="queued") # queued, running, succeeded, failed, cancelled
+    progress = Column(Float, default=0.0) # 0.0 - 1.0
+    message = Column(String, nullable=True)
+    result = Column(String, nullable=True) # JSON string
+    error = Column(String, nullable=True)
+    cancelRequested = Column(Boolean, default=False)
+    createdAt = Column(String)
+    startedAt = Column(String, nullable=True)
+    finishedAt = Column(String, nullable=True)
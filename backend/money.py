@@ -0,0 +1,37 @@
+"""
+Exact money storage.
+
+Amounts are stored as integers in minor units (paise, cents), so sums computed by
+the database are exact and application code never re-adds floats to avoid drift.
+The API keeps exchanging major-unit numbers; the `Money` column type converts at
+the boundary. Every currency is stored at the same scale (two decimal places),
+which keeps rows of different currencies directly comparable in SQL.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.types import TypeDecorator, Integer
+
+MINOR_UNITS = 100
+
+def to_minor(amount):
+    if amount is None:
+        return None
+    # str() first so 0.1 becomes Decimal("0.1"), not its binary approximation
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor(minor):
+    if minor is None:
+        return None
+    return Decimal(int(minor)) / MINOR_UNITS
+
+class Money(TypeDecorator):
+    """Integer minor units in the database, major-unit floats in Python."""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_minor(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return float(from_minor(value))
@@ -0,0 +1,208 @@
+"""
+Debt netting and settlement.
+
+Split expenses leave many small `debts` rows per person. `debt_balances` keeps one
+running net balance per (user, counterparty), so reading what someone owes is a
+primary-key lookup instead of a scan over every debt. On SQLite the balances are
+maintained by triggers on `debts`, like the search index (search.py), so routers,
+the write batcher and bulk deletes all keep them current. Only active debts count.
+
+Settlement takes the net position of everyone in a group and pays the largest
+debtor into the largest creditor until all are square (greedy min-cash-flow),
+which needs at most n - 1 transfers for n people.
+"""
+import heapq
+from sqlalchemy import Integer, case, func, text, type_coerce
+import models
+from money import from_minor, to_minor
+
+# The current user in settlement results; the empty key cannot clash with a counterparty.
+# A counterparty shown with the same name is told apart (see `_labels`)
+SELF = ""
+SELF_NAME = "me"
+
+# Signed contribution of a debts row (NEW or OLD) to its counterparty's balance
+_SIGNED = "CASE {row}.direction WHEN 'receivable' THEN {row}.amount ELSE -{row}.amount END"
+# Keys come from debts.counterparty, set in Python (models.counterparty_key) whenever
+# personName is, so SQL and Python group names the same way
+_KEY = "{row}.user_id || ':' || {row}.counterparty"
+_ACTIVE = "COALESCE({row}.status, 'active') = 'active'"
+
+def _add(row):
+    return f"""INSERT INTO debt_balances (id, user_id, counterparty, personName, balance, openCount)
+        VALUES ({_KEY.format(row=row)}, {row}.user_id, {row}.counterparty, trim({row}.personName), {_SIGNED.format(row=row)}, 1)
+        ON CONFLICT(id) DO UPDATE SET balance = balance + excluded.balance, openCount = openCount + 1;"""
+
+def _remove(row):
+    return f"""UPDATE debt_balances SET balance = balance - ({_SIGNED.format(row=row)}), openCount = openCount - 1
+        WHERE id = {_KEY.format(row=row)};"""
+
+TRIGGER_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS debt_balances_ai AFTER INSERT ON debts WHEN {_ACTIVE.format(row='new')} BEGIN
+        {_add('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS debt_balances_ad AFTER DELETE ON debts WHEN {_ACTIVE.format(row='old')} BEGIN
+        {_remove('old')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS debt_balances_au_old AFTER UPDATE ON debts WHEN {_ACTIVE.format(row='old')} BEGIN
+        {_remove('old')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS debt_balances_au_new AFTER UPDATE ON debts WHEN {_ACTIVE.format(row='new')} BEGIN
+        {_add('new')}
+    END""",
+]
+
+def create_index(conn):
+    """Create the balance triggers and rebuild balances from existing debts. Safe to re-run."""
+    if conn.dialect.name != "sqlite":
+        print("Debt balance triggers need SQLite; balances will be computed from debts.")
+        return
+    for statement in TRIGGER_DDL:
+        conn.execute(text(statement))
+    conn.execute(text("DELETE FROM debt_balances"))
+    conn.execute(text(f"""
+        INSERT INTO debt_balances (id, user_id, counterparty, personName, balance, openCount)
+        SELECT {_KEY.format(row='debts')}, user_id, counterparty, min(trim(personName)),
+               sum({_SIGNED.format(row='debts')}), count(*)
+        FROM debts WHERE {_ACTIVE.format(row='debts')}
+        GROUP BY user_id, counterparty
+    """))
+
+def drop_index(conn):
+    if conn.dialect.name == "sqlite":
+        for name in ("debt_balances_ai", "debt_balances_ad", "debt_balances_au_old", "debt_balances_au_new"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+def has_index(db):
+    if db.bind.dialect.name != "sqlite":
+        return False
+    return db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'debt_balances_ai'")
+    ).first() is not None
+
+normalise = models.counterparty_key
+
+def balances(db, user_id):
+    """Open balances per counterparty, as `(counterparty, personName, balance_minor, openCount)`."""
+    if has_index(db):
+        B = models.DebtBalance
+        rows = (
+            db.query(B.counterparty, B.personName, type_coerce(B.balance, Integer), B.openCount)
+            .filter(B.user_id == user_id, B.openCount > 0)
+            .order_by(B.counterparty)
+            .all()
+        )
+    else:
+        D = models.Debt
+        minor = type_coerce(D.amount, Integer)
+        key = D.counterparty
+        rows = (
+            db.query(key, func.min(func.trim(D.personName)), func.sum(case((D.direction == "receivable", minor), else_=-minor)), func.count(D.id))
+            .filter(D.user_id == user_id, func.coalesce(D.status, "active") == "active")
+            .group_by(key)
+            .order_by(key)
+            .all()
+        )
+    return [(counterparty, name, int(balance or 0), count) for counterparty, name, balance, count in rows]
+
+def balance_with(db, user_id, person):
+    """Net balance with one counterparty in minor units (0 when nothing is open)."""
+    if not has_index(db):
+        counterparty = normalise(person)
+        return next((b for c, _, b, _ in balances(db, user_id) if c == counterparty), 0)
+    balance = db.query(type_coerce(models.DebtBalance.balance, Integer)).filter(
+        models.DebtBalance.id == f"{user_id}:{normalise(person)}",
+        models.DebtBalance.openCount > 0,
+    ).scalar()
+    return int(balance or 0)
+
+def min_cash_flow(net):
+    """
+    Transfers `(debtor, creditor, amount)` that settle every net position.
+
+    `net` maps a person to what they are owed (positive) or owe (negative), in minor
+    units, and must sum to zero. Exactly opposite positions are paired first, then the
+    largest debtor pays the largest creditor until everyone is square.
+    """
+    transfers = []
+    creditors, debtors = [], []
+    waiting = {}
+    for person, amount in sorted(net.items()):
+        if amount == 0:
+            continue
+        match = waiting.get(-amount)
+        if match:
+            other = match.pop()
+            debtor, creditor = (person, other) if amount < 0 else (other, person)
+            transfers.append((debtor, creditor, abs(amount)))
+        else:
+            waiting.setdefault(amount, []).append(person)
+    for amount, people in waiting.items():
+        for person in people:
+            heapq.heappush(creditors if amount > 0 else debtors, (-abs(amount), person))
+
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debit, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debit)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debit > amount:
+            heapq.heappush(debtors, (debit + amount, debtor))
+    return transfers
+
+def _labels(names):
+    """Display names by key, made unique: the user keeps SELF_NAME, clashing counterparties get a suffix."""
+    labels, used = {SELF: SELF_NAME}, {SELF_NAME}
+    for person, name in sorted(names.items()):
+        if person == SELF:
+            continue
+        label, n = name, 2
+        while label in used:
+            label, n = f"{name} ({n})", n + 1
+        labels[person] = label
+        used.add(label)
+    return labels
+
+def settle(db, user_id, members=None, edges=()):
+    """
+    Minimal transfers for the user and their counterparties. `members` limits which
+    counterparties are included; `edges` are debts between other members of the group
+    as `(debtor, creditor, amount)` in major units, with the user named "me".
+    """
+    wanted = {normalise(m) for m in members} if members else None
+    names = {SELF: SELF_NAME}
+    net = {SELF: 0}
+
+    def move(debtor, creditor, minor):
+        net[debtor] = net.get(debtor, 0) - minor
+        net[creditor] = net.get(creditor, 0) + minor
+
+    for counterparty, name, balance, _ in balances(db, user_id):
+        if wanted is not None and counterparty not in wanted:
+            continue
+        names.setdefault(counterparty, name)
+        # A positive balance means the counterparty owes the user
+        move(counterparty, SELF, balance)
+
+    def key(name):
+        # Edges refer to the user as "me"
+        name = normalise(name)
+        return SELF if name == SELF_NAME else name
+
+    for debtor, creditor, amount in edges:
+        debtor_key, creditor_key = key(debtor), key(creditor)
+        names.setdefault(debtor_key, debtor.strip())
+        names.setdefault(creditor_key, creditor.strip())
+        move(debtor_key, creditor_key, to_minor(amount))
+
+    transfers = min_cash_flow(net)
+    names = _labels(names)
+    return {
+        "net": {names[p]: float(from_minor(v)) for p, v in net.items()},
+        "transfers": [
+            {"debtor": names[d], "creditor": names[c], "amount": float(from_minor(a))}
+            for d, c, a in transfers
+        ],
+    }
@@ -0,0 +1,201 @@
+"""
+Materialized recurring-plan occurrences.
+
+A plan repeats by its `frequency` until its optional `endDate`:
+
+- monthly (the default): `expectedDate` is a day of the month ("1".."31", clamped to
+  short months), "last" or "last-working" (the last Monday-Friday of the month)
+- weekly: `expectedDate` is a weekday, by name ("monday", "mon") or number (1 = Monday
+  .. 7 = Sunday; larger numbers wrap), or an ISO date whose weekday is used
+- yearly: `expectedDate` is "MM-DD" or an ISO date (month and day); a bare monthly
+  value ("15", "last") falls in January
+
+Occurrences are stored in `recurring_occurrences` for a rolling window around today
+(OCCURRENCE_MONTHS_BACK before the current month to OCCURRENCE_MONTHS_AHEAD after it),
+so calendar and forecast views are a range scan on (user_id, date). A plan's rows are
+rewritten whenever the plan changes; the window rolls forward lazily on the next read.
+Ranges outside the window are expanded on the fly with the same rules.
+"""
+import calendar
+import os
+from datetime import date, timedelta
+from sqlalchemy.exc import IntegrityError
+import models
+
+OCCURRENCE_MONTHS_BACK = int(os.getenv("BUFIN_OCCURRENCE_MONTHS_BACK", "3"))
+OCCURRENCE_MONTHS_AHEAD = int(os.getenv("BUFIN_OCCURRENCE_MONTHS_AHEAD", "12"))
+
+def _shift_month(year, month, months):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+def occurrence_day(year, month, expected_date):
+    """Day of the month a plan falls on, or None if expectedDate is not understood."""
+    days_in_month = calendar.monthrange(year, month)[1]
+    if expected_date == "last":
+        return days_in_month
+    if expected_date == "last-working":
+        day = days_in_month
+        while date(year, month, day).weekday() >= 5:
+            day -= 1
+        return day
+    try:
+        return min(max(int(expected_date), 1), days_in_month)
+    except (TypeError, ValueError):
+        return None
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value[:10]) if value else None
+    except ValueError:
+        return None
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+def weekday(expected_date):
+    """Weekday (0 = Monday) a weekly plan falls on, or None if not understood."""
+    value = (expected_date or "").strip().lower()
+    for number, name in enumerate(WEEKDAYS):
+        if value in (name, name[:3]):
+            return number
+    if value.isdigit():
+        return (max(int(value), 1) - 1) % 7
+    day = _parse_date(value)
+    return day.weekday() if day else None
+
+def _yearly_date(year, expected_date):
+    value = (expected_date or "").strip()
+    month, day_of_month = 1, value
+    parts = value.split("-")
+    if len(parts) in (2, 3) and all(part.isdigit() for part in parts):
+        month, day_of_month = int(parts[-2]), parts[-1]
+        if not 1 <= month <= 12:
+            return None
+    day = occurrence_day(year, month, day_of_month)
+    return date(year, month, day) if day is not None else None
+
+def dates_between(expected_date, end_date, start, end, frequency="monthly"):
+    """Occurrence dates of a plan within [start, end], both inclusive."""
+    last = _parse_date(end_date)
+    if last is not None:
+        end = min(end, last)
+    if frequency == "weekly":
+        day = weekday(expected_date)
+        if day is None or start > end:
+            return []
+        first = start + timedelta(days=(day - start.weekday()) % 7)
+        return [first + timedelta(weeks=i) for i in range((end - first).days // 7 + 1)] if first <= end else []
+    if frequency == "yearly":
+        dates = (_yearly_date(year, expected_date) for year in range(start.year, end.year + 1))
+        return [d for d in dates if d is not None and start <= d <= end]
+    dates = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        day = occurrence_day(year, month, expected_date)
+        if day is not None:
+            occurrence = date(year, month, day)
+            if start <= occurrence <= end:
+                dates.append(occurrence)
+        year, month = _shift_month(year, month, 1)
+    return dates
+
+def window(today=None):
+    """First and last day of the materialized window."""
+    today = today or date.today()
+    first = date(*_shift_month(today.year, today.month, -OCCURRENCE_MONTHS_BACK), 1)
+    year, month = _shift_month(today.year, today.month, OCCURRENCE_MONTHS_AHEAD)
+    return first, date(year, month, calendar.monthrange(year, month)[1])
+
+def _rows(plan, start, end):
+    return [
+        models.RecurringOccurrence(
+            id=f"{plan.id}:{d.isoformat()}",
+            user_id=plan.user_id,
+            plan_id=plan.id,
+            date=d.isoformat(),
+            name=plan.name,
+            amount=plan.amount,
+            type=plan.type,
+        )
+        for d in dates_between(plan.expectedDate, plan.endDate, start, end, plan.frequency)
+    ]
+
+def _stored_window(db, user_id):
+    return db.query(models.OccurrenceWindow).filter(models.OccurrenceWindow.user_id == user_id).first()
+
+def refresh_plan(db, plan):
+    """Rewrite one plan's occurrences inside the user's window. Caller commits."""
+    remove_plan(db, plan.id)
+    stored = _stored_window(db, plan.user_id)
+    if stored is not None:
+        db.add_all(_rows(plan, date.fromisoformat(stored.startDate), date.fromisoformat(stored.endDate)))
+
+def remove_plan(db, plan_id):
+    db.query(models.RecurringOccurrence).filter(models.RecurringOccurrence.plan_id == plan_id).delete(synchronize_session=False)
+
+def add_plan(db, plan):
+    """Insert a plan together with its occurrences (used directly by the write batcher)."""
+    db.add(plan)
+    refresh_plan(db, plan)
+    return plan
+
+def ensure_window(db, user_id, today=None):
+    """Roll the user's materialized window forward to the current one, touching only the months that changed."""
+    start, end = window(today)
+    stored = _stored_window(db, user_id)
+    if stored is not None and stored.startDate == start.isoformat() and stored.endDate == end.isoformat():
+        return start, end
+
+    O = models.RecurringOccurrence
+    plans = db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == user_id).all()
+    if stored is None:
+        stored = models.OccurrenceWindow(user_id=user_id)
+        db.add(stored)
+        missing = [(start, end)]
+    else:
+        old_start, old_end = date.fromisoformat(stored.startDate), date.fromisoformat(stored.endDate)
+        db.query(O).filter(O.user_id == user_id, (O.date < start.isoformat()) | (O.date > end.isoformat())).delete(synchronize_session=False)
+        missing = []
+        if start < old_start:
+            missing.append((start, min(end, old_start - timedelta(days=1))))
+        if end > old_end:
+            missing.append((max(start, old_end + timedelta(days=1)), end))
+        if old_end < start or old_start > end:
+            missing = [(start, end)]
+    for plan in plans:
+        for range_start, range_end in missing:
+            db.add_all(_rows(plan, range_start, range_end))
+    stored.startDate, stored.endDate = start.isoformat(), end.isoformat()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request built the same window first
+        db.rollback()
+    return start, end
+
+def between(db, user_id, start, end):
+    """Occurrences of all the user's plans within [start, end], ordered by date."""
+    window_start, window_end = ensure_window(db, user_id)
+    O = models.RecurringOccurrence
+    results = []
+    if start <= window_end and end >= window_start:
+        rows = (
+            db.query(O.plan_id, O.date, O.name, O.amount, O.type)
+            .filter(O.user_id == user_id, O.date >= max(start, window_start).isoformat(), O.date <= min(end, window_end).isoformat())
+            .all()
+        )
+        results.extend(dict(row._mapping) for row in rows)
+    if start < window_start or end > window_end:
+        # Outside the window: expand the plans directly
+        outside = []
+        if start < window_start:
+            outside.append((start, min(end, window_start - timedelta(days=1))))
+        if end > window_end:
+            outside.append((max(start, window_end + timedelta(days=1)), end))
+        plans = db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == user_id).all()
+        for plan in plans:
+            for range_start, range_end in outside:
+                for d in dates_between(plan.expectedDate, plan.endDate, range_start, range_end, plan.frequency):
+                    results.append({"plan_id": plan.id, "date": d.isoformat(), "name": plan.name, "amount": plan.amount, "type": plan.type})
+    results.sort(key=lambda o: (o["date"], o["name"] or ""))
+    return results
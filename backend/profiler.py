@@ -0,0 +1,238 @@
+"""
+Opt-in sampling profiler for live requests.
+
+A request is profiled when it carries `X-Profile-Token: <BUFIN_PROFILE_TOKEN>`, or at
+random with probability BUFIN_PROFILE_SAMPLE_RATE (e.g. 0.01). While at least one
+profiled request is in flight, a background thread wakes every
+BUFIN_PROFILE_INTERVAL_MS (default 5 ms) and records the stack of each thread running a
+profiled route: the threadpool thread of a sync endpoint, or the event loop for async
+code. When none of them is on a CPU stack, the request is waiting on an await (the LLM
+call, for instance) and the chain of suspended coroutines is recorded instead, under
+an "[awaiting]" leaf, so the profile covers wall time rather than only CPU time.
+
+Samples are aggregated in memory per route, keyed by endpoint (`routers.auth.login`),
+as folded stacks (`frame;frame;frame count`), the input format of flamegraph.pl and
+speedscope, and are served by the /api/admin/profiles endpoints. A thread is attributed
+to a route when its stack contains the endpoint or one of its dependencies (e.g.
+get_current_user), so concurrent unprofiled requests to the same route may add samples
+to it; that does not change the route's profile, only its sample count.
+
+The token is required: the profiles can only be read with it, so a sample rate set
+without one is ignored (with a warning) and nothing runs.
+"""
+import asyncio
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+TOKEN = os.getenv("BUFIN_PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.getenv("BUFIN_PROFILE_SAMPLE_RATE", "0"))
+INTERVAL = float(os.getenv("BUFIN_PROFILE_INTERVAL_MS", "5")) / 1000
+HEADER = "x-profile-token"
+# Distinct stacks kept per route; rarer ones beyond this are counted under "[other]"
+MAX_STACKS = 5000
+MAX_DEPTH = 128
+
+if SAMPLE_RATE > 0 and not TOKEN:
+    print("BUFIN_PROFILE_SAMPLE_RATE is ignored: set BUFIN_PROFILE_TOKEN to enable profiling and read the profiles.")
+    SAMPLE_RATE = 0.0
+
+enabled = bool(TOKEN)
+
+def _label(code):
+    filename = code.co_filename.replace("\\", "/")
+    # Keep paths short: package-relative for libraries, file name for the app
+    marker = "site-packages/"
+    filename = filename.split(marker, 1)[1] if marker in filename else filename.rsplit("/", 1)[-1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+def _dependency_codes(dependant, codes):
+    if dependant.call is not None and hasattr(dependant.call, "__code__"):
+        codes.add(dependant.call.__code__)
+    for dependency in dependant.dependencies:
+        _dependency_codes(dependency, codes)
+    return codes
+
+class RouteProfile:
+    def __init__(self):
+        self.requests = 0
+        self.wall_seconds = 0.0
+        self.samples = 0
+        self.stacks = Counter()
+
+    def add(self, stack):
+        self.samples += 1
+        if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+            stack = "[other]"
+        self.stacks[stack] += 1
+
+class _Active:
+    """A profiled request in flight."""
+    def __init__(self, scope, task):
+        self.scope = scope
+        self.task = task
+        self._codes = None
+
+    @property
+    def route(self):
+        # Endpoint names are unique and, unlike route.path, do not depend on how the
+        # router's prefix is applied
+        endpoint = self.scope.get("endpoint")
+        if endpoint is None:
+            return None
+        return f"{endpoint.__module__}.{endpoint.__name__}"
+
+    @property
+    def codes(self):
+        if self._codes is None:
+            route = self.scope.get("route")
+            dependant = getattr(route, "dependant", None)
+            if dependant is None:
+                # Not routed yet
+                return ()
+            self._codes = _dependency_codes(dependant, set())
+        return self._codes
+
+class Profiler:
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.routes = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self, scope):
+        active = _Active(scope, asyncio.current_task())
+        with self._lock:
+            self._active.add(active)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+        return active
+
+    def end(self, active, wall_seconds):
+        with self._lock:
+            self._active.discard(active)
+            route = self._route(active.route or active.scope.get("path", "?"))
+            route.requests += 1
+            route.wall_seconds += wall_seconds
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                path: {
+                    "requests": route.requests,
+                    "mean_ms": round(route.wall_seconds * 1000 / route.requests, 2) if route.requests else None,
+                    "samples": route.samples,
+                    "sampled_ms": round(route.samples * self.interval * 1000, 1),
+                    "top": [{"stack": stack, "samples": count} for stack, count in route.stacks.most_common(5)],
+                }
+                for path, route in self.routes.items()
+            }
+
+    def folded(self, path=None):
+        """Folded stacks, each rooted at its route, for flamegraph.pl / speedscope."""
+        with self._lock:
+            lines = [
+                f"{route_path};{stack} {count}"
+                for route_path, route in self.routes.items() if path is None or route_path == path
+                for stack, count in route.stacks.items()
+            ]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def _route(self, path):
+        if path not in self.routes:
+            self.routes[path] = RouteProfile()
+        return self.routes[path]
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active)
+            frames = sys._current_frames()
+            frames.pop(own, None)
+            claimed = set()
+            samples = []
+            for request in active:
+                codes = request.codes
+                stack = None
+                for thread_id, frame in frames.items():
+                    if thread_id in claimed:
+                        continue
+                    stack = _thread_stack(frame, codes)
+                    if stack is not None:
+                        claimed.add(thread_id)
+                        break
+                if stack is None:
+                    stack = _awaiting_stack(request.task)
+                if stack is not None and request.route:
+                    samples.append((request.route, stack))
+            with self._lock:
+                for path, stack in samples:
+                    self._route(path).add(stack)
+
+def _thread_stack(frame, codes):
+    """Folded stack from the outermost frame of `codes` down to `frame`, or None if none is on it."""
+    if not codes:
+        return None
+    labels, root = [], None
+    while frame is not None and len(labels) < MAX_DEPTH * 4:
+        labels.append(_label(frame.f_code))
+        if frame.f_code in codes:
+            root = len(labels)
+        frame = frame.f_back
+    if root is None:
+        return None
+    return ";".join(reversed(labels[:root][-MAX_DEPTH:]))
+
+def _awaiting_stack(task):
+    """Chain of suspended coroutine frames of `task`, with an "[awaiting]" leaf."""
+    if task is None or task.done():
+        return None
+    labels = []
+    coro = task.get_coro()
+    while coro is not None and len(labels) < MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            labels.append(_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return ";".join(labels + ["[awaiting]"]) if labels else None
+
+profiler = Profiler()
+
+def _wants_profile(scope):
+    if scope["path"].startswith("/api/admin/"):
+        return False
+    if TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == HEADER.encode():
+                return secrets.compare_digest(value, TOKEN.encode())
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+class ProfilerMiddleware:
+    """Plain ASGI middleware, so the request runs in the task that is being watched."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            return await self.app(scope, receive, send)
+        active = profiler.begin(scope)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end(active, time.perf_counter() - start)
@@ -0,0 +1,174 @@
+"""
+Goal projection engine.
+
+Projects every goal of a user at once with NumPy:
+
+- a deterministic compound-growth path per goal (expected monthly return, no volatility)
+- a batched Monte Carlo simulation of lognormal monthly returns for investment goals,
+  shaped (goals, paths) and stepped a year of months at a time
+
+Contributions come from the user's free cash flow: recurring income minus recurring
+expenses for each future month, counting each plan's occurrences in that month by its
+frequency (see occurrences.py; plans that end free up cash later), of which the
+user's savings goal (or 20% by default) is set aside and split across unfinished
+goals in proportion to what each still needs.
+
+NumPy is imported by the functions themselves: the routers import this module at
+startup, and most processes never project a goal.
+"""
+import calendar
+from datetime import date, timedelta
+import occurrences
+
+DEFAULT_SAVINGS_RATE = 0.2
+# Annual volatility of investment returns by the user's risk tolerance
+VOLATILITY = {"low": 0.08, "medium": 0.15, "high": 0.22}
+MONTHS_PER_YEAR = 12
+
+def add_months(start, months):
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def months_between(start, end):
+    return (end.year - start.year) * 12 + (end.month - start.month) + (1 if end.day > start.day else 0)
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value[:10]) if value else None
+    except ValueError:
+        return None
+
+def contribution_schedule(user, recurring_plans, horizon, today):
+    """Monthly amount available for goals over the next `horizon` months, shape (horizon,)."""
+    import numpy as np
+    income = np.zeros(horizon)
+    expense = np.zeros(horizon)
+    first = today.replace(day=1)
+    last = add_months(first, horizon) - timedelta(days=1)
+    for plan in recurring_plans:
+        dates = occurrences.dates_between(plan.expectedDate, plan.endDate, first, last, plan.frequency)
+        months = np.array([(d.year - first.year) * 12 + d.month - first.month for d in dates], dtype=np.int64)
+        target = income if plan.type == "income" else expense
+        target += (plan.amount or 0.0) * np.bincount(months, minlength=horizon)[:horizon]
+
+    # No recurring income on file: fall back to the income from the profile
+    if not income.any():
+        income[:] = user.monthly_income or 0.0
+    free_cash_flow = np.maximum(income - expense, 0.0)
+
+    if user.savings_goal:
+        return np.minimum(free_cash_flow, user.savings_goal)
+    return free_cash_flow * DEFAULT_SAVINGS_RATE
+
+def _allocation(goals):
+    import numpy as np
+    remaining = np.array([max((g.targetAmount or 0.0) - (g.currentAmount or 0.0), 0.0) for g in goals])
+    total = remaining.sum()
+    return remaining / total if total > 0 else np.zeros(len(goals))
+
+def _monthly_return(goal):
+    annual = (goal.projectedReturnRate or 0.0) / 100.0 if goal.type == "investment" else 0.0
+    return (1.0 + annual) ** (1.0 / MONTHS_PER_YEAR) - 1.0
+
+def deterministic_paths(start, target, contributions, monthly_returns):
+    """Balances for each goal and month, shape (goals, horizon), plus first month each target is met."""
+    import numpy as np
+    horizon = contributions.shape[1]
+    growth = np.cumprod(np.broadcast_to((1.0 + monthly_returns)[:, None], (len(start), horizon)), axis=1)
+    # B_m = G_m * (B_0 + sum_{k<=m} c_k / G_k)
+    balances = growth * (start[:, None] + np.cumsum(contributions / growth, axis=1))
+    reached = balances >= target[:, None]
+    hit = np.where(reached.any(axis=1), reached.argmax(axis=1) + 1, -1)
+    hit[start >= target] = 0
+    return balances, hit
+
+def monte_carlo(start, target, contributions, monthly_returns, volatility, paths, rng, block=MONTHS_PER_YEAR):
+    """
+    First month each simulated path reaches its target, shape (goals, paths); -1 if never
+    within the horizon. Returns are lognormal with the given monthly mean and annual volatility.
+    """
+    import numpy as np
+    goals, horizon = contributions.shape
+    sigma = volatility / np.sqrt(MONTHS_PER_YEAR)
+    mu = np.log1p(monthly_returns) - 0.5 * sigma ** 2
+
+    balance = np.repeat(start[:, None], paths, axis=1)
+    hit = np.where(balance >= target[:, None], 0, -1)
+    for block_start in range(0, horizon, block):
+        if (hit >= 0).all():
+            break
+        months = min(block, horizon - block_start)
+        shocks = rng.standard_normal((goals, paths, months))
+        growth = np.exp(mu[:, None, None] + sigma[:, None, None] * shocks)
+        c = contributions[:, block_start:block_start + months]
+        # Same closed form as the deterministic path, within the block
+        cum_growth = np.cumprod(growth, axis=2)
+        balances = cum_growth * (balance[:, :, None] + np.cumsum(c[:, None, :] / cum_growth, axis=2))
+        reached = (balances >= target[:, None, None]) & (hit < 0)[:, :, None]
+        first = reached.argmax(axis=2)
+        newly = reached.any(axis=2)
+        hit[newly] = block_start + first[newly] + 1
+        balance = balances[:, :, -1]
+    return hit
+
+def project_goals(user, goals, recurring_plans, paths=2000, horizon_months=360, seed=None, today=None):
+    import numpy as np
+    today = today or date.today()
+    if not goals:
+        return {"monthly_contribution": 0.0, "goals": []}
+
+    schedule = contribution_schedule(user, recurring_plans, horizon_months, today)
+    weights = _allocation(goals)
+    contributions = weights[:, None] * schedule[None, :]
+    start = np.array([g.currentAmount or 0.0 for g in goals])
+    target = np.array([g.targetAmount or 0.0 for g in goals])
+    monthly_returns = np.array([_monthly_return(g) for g in goals])
+
+    balances, expected_hit = deterministic_paths(start, target, contributions, monthly_returns)
+
+    investment = np.array([g.type == "investment" for g in goals])
+    simulated = {}
+    if investment.any() and paths > 0:
+        idx = np.flatnonzero(investment)
+        volatility = np.full(len(idx), VOLATILITY.get(user.risk_tolerance, VOLATILITY["low"]))
+        hits = monte_carlo(start[idx], target[idx], contributions[idx], monthly_returns[idx], volatility, paths,
+                           np.random.default_rng(seed))
+        simulated = dict(zip(idx.tolist(), hits))
+
+    results = []
+    for i, goal in enumerate(goals):
+        due = _parse_date(goal.targetDate)
+        months_to_due = months_between(today, due) if due else None
+        months = int(expected_hit[i])
+        end = months if months >= 0 else horizon_months
+        result = {
+            "goal_id": goal.id,
+            "name": goal.name,
+            "type": goal.type,
+            "monthly_contribution": round(float(contributions[i, 0]), 2),
+            "deterministic": {
+                "months_to_complete": months if months >= 0 else None,
+                "completion_date": add_months(today, months).isoformat() if months >= 0 else None,
+                "on_track": months >= 0 and (months_to_due is None or months <= months_to_due),
+                "path": np.round(balances[i, :max(end, 1)], 2).tolist(),
+            },
+            "monte_carlo": None,
+        }
+        if i in simulated:
+            hits = simulated[i]
+            completed = hits[hits >= 0]
+            percentiles = {}
+            for pct in (10, 50, 90):
+                # Paths that never finish count as later than any finished one
+                value = np.percentile(np.where(hits >= 0, hits, np.inf), pct, method="higher")
+                percentiles[f"p{pct}"] = add_months(today, int(value)).isoformat() if np.isfinite(value) else None
+            result["monte_carlo"] = {
+                "paths": int(hits.size),
+                "completion_dates": percentiles,
+                "probability_by_target_date": float(np.mean((hits >= 0) & (hits <= months_to_due))) if months_to_due is not None else None,
+                "probability_within_horizon": float(completed.size / hits.size),
+            }
+        results.append(result)
+
+    return {"monthly_contribution": round(float(schedule[0]), 2), "horizon_months": horizon_months, "goals": results}
@@ -0,0 +1,76 @@
+"""
+Move users onto the shard the hash ring assigns them.
+
+After adding a shard to BUFIN_SHARDS, run:
+
+    python rebalance_shards.py --dry-run   # show current and target placement
+    python rebalance_shards.py             # move the users whose shard changed
+
+Each user is copied to the new shard in one transaction, then the directory
+(`users.shard`) is switched, then their rows are removed from the old shard. A move
+interrupted part-way is safe to re-run. Run it while the app is stopped or in a
+quiet period: writes a user makes to the old shard during their own move are lost.
+"""
+import argparse
+from collections import Counter
+from sqlalchemy import select, update
+import migrate_db, models
+from database import SessionLocal, engine, get_engine, ring
+from routers.auth import USER_DATA_MODELS
+
+COPY_CHUNK_SIZE = 1000
+# Rebuilt on the target shard (by triggers, or lazily for checkpoints) rather than copied
+DERIVED_MODELS = {models.DebtBalance, models.BalanceCheckpoint, models.BalanceFxCheckpoint}
+
+def _tables():
+    # USER_DATA_MODELS lists children first; copy parents first
+    return [m.__table__ for m in reversed(USER_DATA_MODELS)]
+
+def move_user(user_id, source, target):
+    tables = _tables()
+    copied = [t for t in tables if t not in {m.__table__ for m in DERIVED_MODELS}]
+    with get_engine(target).begin() as out:
+        # Leftovers from an interrupted move
+        for table in reversed(tables):
+            out.execute(table.delete().where(table.c.user_id == user_id))
+        with get_engine(source).connect() as conn:
+            for table in copied:
+                result = conn.execution_options(yield_per=COPY_CHUNK_SIZE).execute(select(table).where(table.c.user_id == user_id))
+                for chunk in result.partitions():
+                    out.execute(table.insert(), [dict(row._mapping) for row in chunk])
+
+    with engine.begin() as conn:
+        conn.execute(update(models.User.__table__).where(models.User.id == user_id).values(shard=target))
+
+    with get_engine(source).begin() as conn:
+        for table in reversed(tables):
+            conn.execute(table.delete().where(table.c.user_id == user_id))
+
+def plan():
+    db = SessionLocal()
+    try:
+        users = db.query(models.User.id, models.User.shard).all()
+    finally:
+        db.close()
+    return [(user_id, shard, ring.shard_for(user_id)) for user_id, shard in users]
+
+def main():
+    parser = argparse.ArgumentParser(description="Move BuFin users onto their consistent-hash shard")
+    parser.add_argument("--dry-run", action="store_true", help="Only report where users are and where they would go")
+    args = parser.parse_args()
+
+    migrate_db.migrate()
+    placement = plan()
+    moves = [(user_id, source, target) for user_id, source, target in placement if source != target]
+    print(f"Shards: {', '.join(ring.shards)}")
+    print(f"Current: {dict(Counter(source for _, source, _ in placement))}")
+    print(f"Target:  {dict(Counter(target for _, _, target in placement))}")
+    print(f"{len(moves)} of {len(placement)} users to move")
+    if args.dry_run:
+        return
+    for i, (user_id, source, target) in enumerate(moves, 1):
+        move_user(user_id, source, target)
+        print(f"[{i}/{len(moves)}] {user_id}: {source} -> {target}")
+
+if __name__ == "__main__":
+    main()
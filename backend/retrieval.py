@@ -0,0 +1,288 @@
+"""
+Relevance index for the coach chat's context.
+
+Instead of pasting everything the client sends into the prompt, each coach message
+gets a small context: a summary with exact totals (from aggregates.py) plus the
+records most relevant to the question, within a token budget.
+
+Records are the user's transactions (the most recent MAX_TRANSACTIONS), recurring
+plans, goals and debts. Each becomes a short document (description, merchant,
+category, remarks; plan / goal names; counterparties) in a per-user BM25 index, built
+on first use, kept in an in-process LRU of MAX_USERS users and dropped when a commit
+in any worker changes any of those records (via the event hooks).
+
+A message is turned into search terms plus structured filters: a date range ("last
+month", "in March", "May 2026", "last 10 days"), an amount bound ("over 500") and the kinds of
+record it is about ("subscriptions", "owe", "goal"). Records outside the filters are
+skipped; the rest are ranked by BM25, a boost for the kinds asked about and a small
+recency boost, and added until TOP_K records or the token budget are reached. A
+question that matches nothing ("how am I doing?") gets recent transactions and the
+user's plans, goals and debts instead.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from datetime import date, timedelta
+import aggregates, balance_history, events, models
+
+MAX_TRANSACTIONS = 5000
+MAX_USERS = 128
+TOP_K = 25
+TOKEN_BUDGET = int(os.getenv("BUFIN_COACH_CONTEXT_TOKENS", "1500"))
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+KIND_BOOST = 1.0
+RECENCY_BOOST = 0.5
+RECENCY_DAYS = 90
+INDEXED_RESOURCES = {"transactions", "recurring_plans", "goals", "debts"}
+
+KIND_HINTS = {
+    "transactions": {"spent", "spend", "spending", "bought", "buy", "paid", "purchase", "transaction", "expense", "income", "earned"},
+    "recurring_plans": {"subscription", "recurring", "bill", "rent", "emi", "monthly", "plan"},
+    "goals": {"goal", "save", "saving", "target", "jar", "invest", "investment"},
+    "debts": {"debt", "owe", "lent", "lend", "borrow", "borrowed", "loan", "repay", "owed"},
+}
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for", "from", "how", "i", "in", "is", "it",
+    "me", "much", "my", "of", "on", "or", "should", "so", "than", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "will", "with", "you", "your", "did", "have", "has", "am", "any",
+}
+
+def _stem(token):
+    # Enough to match "subscriptions" with "subscription" and "groceries" with "grocery"
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text):
+    return [_stem(t) for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if t not in STOPWORDS]
+
+class Index:
+    """BM25 over one user's records. `records` are (kind, record dict, date or None, text)."""
+    def __init__(self, records):
+        self.records = records
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for i, (_, _, _, text) in enumerate(records):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def scores(self, terms):
+        scores = defaultdict(float)
+        n = len(self.records)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = tf + K1 * (1 - B + B * self.lengths[i] / (self.average_length or 1))
+                scores[i] += idf * tf * (K1 + 1) / norm
+        return scores
+
+def _compact(record):
+    return {key: value for key, value in record.items() if value not in (None, "")}
+
+def _load(db, user_id):
+    T = models.Transaction
+    records = []
+    for t in db.query(T).filter(T.user_id == user_id).order_by(T.date.desc()).limit(MAX_TRANSACTIONS):
+        record = _compact({"date": t.date[:10], "amount": t.amount, "type": t.type, "category": t.category,
+                           "description": t.description, "merchant": t.merchant, "remarks": t.remarks, "currency": t.currency})
+        text = " ".join(filter(None, [t.description, t.merchant, t.category, t.remarks, t.type, t.necessity]))
+        records.append(("transactions", record, t.date[:10], text))
+    for p in db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == user_id):
+        record = _compact({"name": p.name, "amount": p.amount, "type": p.type, "frequency": p.frequency,
+                           "expectedDate": p.expectedDate, "endDate": p.endDate})
+        records.append(("recurring_plans", record, None, " ".join(filter(None, [p.name, p.type, p.frequency, "recurring"]))))
+    for g in db.query(models.Goal).filter(models.Goal.user_id == user_id):
+        record = _compact({"name": g.name, "targetAmount": g.targetAmount, "currentAmount": g.currentAmount,
+                           "targetDate": g.targetDate, "type": g.type})
+        records.append(("goals", record, None, " ".join(filter(None, [g.name, g.type, "goal"]))))
+    for d in db.query(models.Debt).filter(models.Debt.user_id == user_id):
+        record = _compact({"personName": d.personName, "amount": d.amount, "direction": d.direction,
+                           "dueDate": d.dueDate, "status": d.status})
+        records.append(("debts", record, None, " ".join(filter(None, [d.personName, d.direction, d.status, "debt"]))))
+    return Index(records)
+
+_cache = OrderedDict()
+# Bumped on every invalidation, so an index built from data read before one is not kept
+_generations = defaultdict(int)
+_lock = threading.Lock()
+
+def index_for(db, user_id):
+    with _lock:
+        if user_id in _cache:
+            _cache.move_to_end(user_id)
+            return _cache[user_id]
+        generation = _generations[user_id]
+    index = _load(db, user_id)
+    with _lock:
+        if _generations[user_id] == generation:
+            _cache[user_id] = index
+            while len(_cache) > MAX_USERS:
+                _cache.popitem(last=False)
+    return index
+
+@events.listen_everywhere
+def _invalidate(user_id, changes):
+    if any(change.get("resource") in INDEXED_RESOURCES for change in changes):
+        with _lock:
+            _generations[user_id] += 1
+            _cache.pop(user_id, None)
+
+def _month_range(year, month):
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return start, end
+
+def parse_filters(message, today=None):
+    """(start, end, min_amount, max_amount, kinds) read from a chat message; unset parts are None."""
+    today = today or date.today()
+    text = message.lower()
+
+    def said(phrase):
+        # Whole words, so "this weekend" is not "this week"
+        return re.search(rf"\b{phrase}\b", text)
+
+    start = end = None
+    if said("today"):
+        start = end = today
+    elif said("yesterday"):
+        start = end = today - timedelta(days=1)
+    elif said("this week"):
+        start, end = today - timedelta(days=today.weekday()), today
+    elif said("last week"):
+        end = today - timedelta(days=today.weekday() + 1)
+        start = end - timedelta(days=6)
+    elif said("this month"):
+        start, end = today.replace(day=1), today
+    elif said("last month"):
+        end = today.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    else:
+        days = said(r"last (\d+) days")
+        if days:
+            start, end = today - timedelta(days=int(days.group(1))), today
+        else:
+            for number, name in enumerate(MONTHS, 1):
+                names = name if name == "may" else f"{name}|{name[:3]}"
+                month = said(rf"({names})(?:\s+(\d{{4}}))?")
+                # "may" is usually the verb: only a month after "in", "of", ... or before a year
+                if month and name == "may" and not month.group(2) and not said(rf"(?:in|during|of|for|since|from|last) {name}"):
+                    month = None
+                if month:
+                    # The given year, else the most recent such month: this year or last
+                    year = int(month.group(2)) if month.group(2) else today.year if number <= today.month else today.year - 1
+                    start, end = _month_range(year, number)
+                    break
+
+    amount = r"(?:rs\.?|inr|₹)?\s*([\d,]+(?:\.\d+)?)\s*(k)?"
+    def _amount(match):
+        value = float(match.group(1).replace(",", ""))
+        return value * 1000 if match.group(2) else value
+    minimum = re.search(rf"(?:over|above|more than|greater than|at least)\s*{amount}", text)
+    maximum = re.search(rf"(?:under|below|less than|at most)\s*{amount}", text)
+
+    words = set(tokenize(text)) | set(re.findall(r"[a-z]+", text))
+    kinds = {kind for kind, hints in KIND_HINTS.items() if words & hints}
+    return start, end, _amount(minimum) if minimum else None, _amount(maximum) if maximum else None, kinds
+
+def _amount_of(record):
+    return record.get("amount", record.get("targetAmount"))
+
+def _passes(kind, record, day, start, end, minimum, maximum):
+    if (start or end) and kind == "transactions":
+        if start and day < start.isoformat():
+            return False
+        if end and day > end.isoformat():
+            return False
+    value = _amount_of(record)
+    if minimum is not None and (value is None or value < minimum):
+        return False
+    if maximum is not None and (value is None or value > maximum):
+        return False
+    return True
+
+def _tokens(obj):
+    return len(json.dumps(obj, default=str)) // 4 + 1
+
+def select(index, message, top_k=TOP_K, budget=TOKEN_BUDGET, today=None):
+    """The records to show for `message`, most relevant first, as {kind: [records]}."""
+    today = today or date.today()
+    start, end, minimum, maximum, kinds = parse_filters(message, today)
+    filtered = bool(start or end or minimum is not None or maximum is not None)
+    text_scores = index.scores(tokenize(message))
+    recent_cutoff = (today - timedelta(days=RECENCY_DAYS)).isoformat()
+
+    ranked = []
+    for i, (kind, record, day, _) in enumerate(index.records):
+        if not _passes(kind, record, day, start, end, minimum, maximum):
+            continue
+        score = text_scores.get(i, 0.0)
+        if kind in kinds:
+            score += KIND_BOOST
+        if score <= 0 and not filtered:
+            continue
+        if day and day >= recent_cutoff:
+            score += RECENCY_BOOST * (1 - (today - date.fromisoformat(day)).days / RECENCY_DAYS)
+        ranked.append((score, i))
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    order = [i for _, i in ranked]
+    if not order and not filtered:
+        # Nothing specific asked: plans, goals and debts (few, always useful), then recent spending
+        order = [i for i, r in enumerate(index.records) if r[0] != "transactions"]
+        order += [i for i, r in enumerate(index.records) if r[0] == "transactions"]
+
+    selected, used = defaultdict(list), 0
+    for i in order[:top_k * 4]:
+        kind, record, _, _ = index.records[i]
+        cost = _tokens(record)
+        if used + cost > budget:
+            continue
+        selected[kind].append(record)
+        used += cost
+        if sum(len(records) for records in selected.values()) >= top_k:
+            break
+    return dict(selected), (start, end)
+
+def _totals(db, user, start, end):
+    filters = aggregates.TransactionFilters(start_date=start.isoformat(), end_date=end.isoformat())
+    by_category = aggregates.flow_totals(db, user.id, user.currency, group="category", filters=filters)
+    total = aggregates.overall(by_category, user.currency)
+    top = sorted(by_category, key=lambda c: c.expense_minor, reverse=True)[:5]
+    return {
+        "from": start.isoformat(), "to": end.isoformat(),
+        "income": float(total.income), "expense": float(total.expense),
+        "topExpenseCategories": {c.key: float(c.expense) for c in top if c.expense_minor},
+    }
+
+def build_context(db, user, message, today=None):
+    """Prompt context for one coach message: profile, exact totals and the relevant records."""
+    today = today or date.today()
+    records, (start, end) = select(index_for(db, user.id), message, today=today)
+    context = {
+        "profile": _compact({
+            "currency": user.currency,
+            "balance": float(balance_history.daily_series(db, user, today, today)[0][1]),
+            "monthlyIncome": user.monthly_income,
+            "savingsGoal": user.savings_goal,
+            "financialLiteracy": user.financial_literacy,
+            "riskTolerance": user.risk_tolerance,
+        }),
+        "thisMonth": _totals(db, user, today.replace(day=1), today),
+        "relevantRecords": records,
+    }
+    if start or end:
+        context["askedPeriod"] = _totals(db, user, start or date(1970, 1, 1), end or today)
+    return context
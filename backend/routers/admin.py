@@ -0,0 +1,32 @@
+import secrets
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import profiler
+
+router = APIRouter()
+
+def _require_admin(token):
+    # Hidden entirely unless an admin token is configured
+    if not profiler.TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not secrets.compare_digest(token, profiler.TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@router.get("/admin/profiles")
+def read_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Per-route request counts, mean latency and hottest stacks."""
+    _require_admin(x_profile_token)
+    return {"enabled": profiler.enabled, "interval_ms": profiler.INTERVAL * 1000, "sample_rate": profiler.SAMPLE_RATE, "routes": profiler.profiler.snapshot()}
+
+@router.get("/admin/profiles/folded", response_class=PlainTextResponse)
+def read_folded_profiles(route: Optional[str] = None, x_profile_token: Optional[str] = Header(None)):
+    """Folded stacks (`flamegraph.pl` / speedscope input), optionally for one route."""
+    _require_admin(x_profile_token)
+    return profiler.profiler.folded(route)
+
+@router.delete("/admin/profiles")
+def reset_profiles(x_profile_token: Optional[str] = Header(None)):
+    _require_admin(x_profile_token)
+    profiler.profiler.reset()
+    return {"ok": True}
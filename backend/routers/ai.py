@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
-import ai_service
-from google.api_core.exceptions import ResourceExhausted
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+import json
+import ai_service, insights, models, retrieval, schemas
+from database import get_db
+from .auth import get_current_user, get_optional_user
 
 router = APIRouter()
 
@@ -22,30 +26,54 @@ async def analyze_purchase(request: dict):
         raise HTTPException(status_code=400, detail="Query and Context are required")
     return await ai_service.analyze_purchase(query, context)
 
+def _stored_insight(kind, db, user):
+    if not ai_service.get_api_key():
+        raise HTTPException(status_code=503, detail="AI insights are not configured")
+    insight, refreshing = insights.read(db, user, kind)
+    return {
+        "kind": kind,
+        "content": json.loads(insight.content) if insight.content is not None else None,
+        "computedAt": insight.computedAt,
+        "stale": insights.is_stale(insight),
+        "refreshing": refreshing,
+    }
+
+@router.get("/ai/alert", response_model=schemas.AIInsight)
+def read_alert(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Precomputed in the background (see insights.py); never waits on the model
+    return _stored_insight("alert", db, current_user)
+
+@router.get("/ai/tips", response_model=schemas.AIInsight)
+def read_tips(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return _stored_insight("tips", db, current_user)
+
 @router.post("/ai/alert")
 async def generate_alert(request: dict):
     # Expects {"transactions": [...], "balance": 100, "recurringPlans": [...]}
     transactions = request.get("transactions")
     balance = request.get("balance")
     recurring_plans = request.get("recurringPlans")
-    return await ai_service.generate_spending_alert(transactions, balance, recurring_plans)
+    return await ai_service.generate_spending_alert(transactions, balance, recurring_plans, request.get("currency") or "INR")
 
 @router.post("/ai/tips")
 async def generate_tips(request: dict):
     # Expects {"transactions": [...], "balance": 100}
     transactions = request.get("transactions")
     balance = request.get("balance")
-    return await ai_service.generate_financial_tips(transactions, balance)
+    return await ai_service.generate_financial_tips(transactions, balance, request.get("currency") or "INR")
 
 @router.post("/coach/chat")
-async def coach_chat(request: dict):
+async def coach_chat(request: dict, db: Session = Depends(get_db), current_user: models.User = Depends(get_optional_user)):
     # Expects {"message": "...", "mode": "...", "context": {...}}
     message = request.get("message")
     mode = request.get("mode")
     context = request.get("context")
     if not message or not mode:
         raise HTTPException(status_code=400, detail="Message and Mode are required")
+    if current_user is not None:
+        # Signed in: send the records relevant to the message rather than what the client picked
+        context = await run_in_threadpool(retrieval.build_context, db, current_user, message)
     return await ai_service.coach_chat(message, mode, context)
 
 # Note: Exception handlers are usually registered on the app, not the router.
-# We will leave the exception handler in main.py or register it there.
+# ai_service raises AIQuotaExceeded, which main.py turns into a 429.
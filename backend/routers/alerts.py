@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+import models, schemas
+from database import get_db
+from .auth import get_current_user
+
+router = APIRouter()
+
+@router.get("/alerts", response_model=List[schemas.SpendingAlert])
+def read_alerts(unseen_only: bool = False, limit: int = 50, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Served from ix_spending_alerts_user_created, cheap enough for the dashboard to poll
+    A = models.SpendingAlert
+    query = db.query(A).filter(A.user_id == current_user.id)
+    if unseen_only:
+        query = query.filter(A.seen == False)
+    return query.order_by(A.createdAt.desc()).limit(min(limit, 200)).all()
+
+@router.post("/alerts/seen")
+def mark_all_alerts_seen(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    A = models.SpendingAlert
+    updated = db.query(A).filter(A.user_id == current_user.id, A.seen == False).update({A.seen: True}, synchronize_session=False)
+    db.commit()
+    return {"updated": updated}
+
+@router.post("/alerts/{alert_id}/seen", response_model=schemas.SpendingAlert)
+def mark_alert_seen(alert_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    alert = db.query(models.SpendingAlert).filter(models.SpendingAlert.id == alert_id, models.SpendingAlert.user_id == current_user.id).first()
+    if not alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    alert.seen = True
+    db.commit()
+    db.refresh(alert)
+    return alert
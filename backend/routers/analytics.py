@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+import analytics, models, schemas
+from database import get_db
+from .auth import get_current_user
+
+router = APIRouter()
+
+@router.get("/analytics/patterns", response_model=schemas.SpendingPatterns)
+def read_spending_patterns(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Same rules as the client's analysis.js, over the cached columnar frame
+    frame = analytics.frame_for(db, current_user)
+    plans = [name for (name,) in db.query(models.RecurringPlan.name).filter(models.RecurringPlan.user_id == current_user.id)]
+    return {
+        "currency": current_user.currency,
+        "leaks": analytics.detect_leaks(frame),
+        "subscriptions": analytics.find_subscriptions(frame, plans),
+    }
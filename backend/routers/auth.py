@@ -1,33 +1,61 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import Optional
 import uuid
-import models, schemas, auth_utils
-from database import get_db
+import models, schemas, auth_utils, anomalies, fx, jobs
+from database import SessionLocal, get_db, on_primary, ring
 
 router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def user_from_token(token: str, db: Session, allow_locked: bool = False):
+    """
+    The user a bearer token belongs to, or None if it is invalid or the account is
+    locked for deletion (unless `allow_locked`, for following the deletion job).
+    """
     try:
         payload = auth_utils.jwt.decode(token, auth_utils.SECRET_KEY, algorithms=[auth_utils.ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            return None
         token_data = schemas.TokenData(email=email)
     except auth_utils.JWTError:
-        raise credentials_exception
-        
+        return None
     user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    if user is not None and user.deletion_requested_at and not allow_locked:
+        return None
+    return user
+
+def _authenticate(token, db, allow_locked=False):
+    user = user_from_token(token, db, allow_locked)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Route the rest of this request's queries to the user's shard
+    db.info["shard"] = user.shard
+    db.info["user_id"] = user.id
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return _authenticate(token, db)
+
+async def get_job_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Like get_current_user, but also accepts an account locked for deletion so its job can be followed."""
+    return _authenticate(token, db, allow_locked=True)
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme), db: Session = Depends(get_db)):
+    """The signed-in user, or None for anonymous requests and invalid tokens."""
+    user = user_from_token(token, db) if token else None
+    if user is not None:
+        db.info["shard"] = user.shard
+        db.info["user_id"] = user.id
     return user
 
 @router.post("/signup", response_model=schemas.Token)
@@ -37,11 +65,13 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     hashed_password = auth_utils.get_password_hash(user.password)
+    user_id = str(uuid.uuid4())
     db_user = models.User(
-        id=str(uuid.uuid4()),
+        id=user_id,
         email=user.email,
         hashed_password=hashed_password,
-        full_name=user.full_name
+        full_name=user.full_name,
+        shard=ring.shard_for(user_id)
     )
     db.add(db_user)
     db.commit()
@@ -62,6 +92,8 @@ def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if db_user.deletion_requested_at:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account is being deleted")
     
     access_token_expires = timedelta(minutes=auth_utils.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth_utils.create_access_token(
@@ -75,11 +107,24 @@ def read_users_me(current_user: models.User = Depends(get_current_user)):
 
 @router.put("/me", response_model=schemas.User)
 def update_user_me(user_update: schemas.UserUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Converted data is written through its own session when the user's shard is not the
+    # primary database (see _commit_profile)
+    data = db
+    previous = {name: getattr(current_user, name) for name in PROFILE_MONEY_FIELDS}
     # Update fields
     if user_update.full_name is not None:
         current_user.full_name = user_update.full_name
     if user_update.currency is not None:
-        current_user.currency = user_update.currency
+        if not on_primary(db.info.get("shard")):
+            data = SessionLocal(info=dict(db.info))
+        try:
+            converted = fx.change_home_currency(data, current_user, user_update.currency)
+        except fx.MissingRate as e:
+            _close(db, data)
+            raise HTTPException(status_code=400, detail=f"{e}; cannot change currency while transactions in other currencies exist")
+        if converted:
+            # Statistics are kept in the user's currency
+            anomalies.rebuild(data, current_user.id, home=current_user.currency)
     if user_update.monthly_income is not None:
         current_user.monthly_income = user_update.monthly_income
     if user_update.current_balance is not None:
@@ -91,10 +136,42 @@ def update_user_me(user_update: schemas.UserUpdate, db: Session = Depends(get_db
     if user_update.risk_tolerance is not None:
         current_user.risk_tolerance = user_update.risk_tolerance
     
-    db.commit()
+    _commit_profile(db, data, current_user, previous)
     db.refresh(current_user)
     return current_user
 
+# Profile fields a currency change converts, with the currency itself
+PROFILE_MONEY_FIELDS = ("currency", "current_balance", "monthly_income", "savings_goal")
+
+def _close(db, data):
+    if data is not db:
+        data.rollback()
+        data.close()
+
+def _commit_profile(db, data, user, previous):
+    """
+    Commit a profile update whose converted data lives in `data`. Two databases cannot
+    commit atomically, so the user's row goes first: if the shard then fails, the row's
+    old values are known exactly and are put back, leaving both sides unconverted.
+    """
+    if data is db:
+        db.commit()
+        return
+    try:
+        db.commit()
+    except Exception:
+        _close(db, data)
+        raise
+    try:
+        data.commit()
+    except Exception:
+        _close(db, data)
+        for name, value in previous.items():
+            setattr(user, name, value)
+        db.commit()
+        raise HTTPException(status_code=503, detail="Could not change currency; please try again")
+    data.close()
+
 @router.post("/change-password")
 def change_password(passwords: schemas.UserChangePassword, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     if not auth_utils.verify_password(passwords.old_password, current_user.hashed_password):
@@ -104,15 +181,60 @@ def change_password(passwords: schemas.UserChangePassword, db: Session = Depends
     db.commit()
     return {"message": "Password updated successfully"}
 
-@router.delete("/me")
+# Per-user tables removed on account deletion, children before the user row
+USER_DATA_MODELS = [models.AIInsight, models.IdempotencyKey, models.BalanceCheckpoint, models.BalanceFxCheckpoint, models.SpendingAlert, models.SpendingStat, models.Transaction, models.RecurringOccurrence, models.OccurrenceWindow, models.RecurringPlan, models.Debt, models.WishlistItem, models.Goal, models.DebtBalance]
+DELETE_CHUNK_SIZE = 1000
+
+def _delete_chunk(db, model, user_id):
+    key = model.__mapper__.primary_key[0]
+    ids = [row[0] for row in db.query(key).filter(model.user_id == user_id).limit(DELETE_CHUNK_SIZE).all()]
+    if ids:
+        db.query(model).filter(key.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+    return len(ids)
+
+@jobs.handler("delete_account")
+def delete_account_job(ctx):
+    """
+    The account was locked when this job was queued. Cancelling unlocks it, but only
+    until the job commits to finishing, right before the first rows go: after that it
+    always runs to the end (and the cancel route refuses), so a cancel can never leave
+    a live account with part of its data deleted.
+    """
+    db = ctx.user_session()
+    try:
+        totals = {m: db.query(m.user_id).filter(m.user_id == ctx.user_id).count() for m in USER_DATA_MODELS}
+        total = sum(totals.values()) or 1
+        deleted = dict.fromkeys(USER_DATA_MODELS, 0)
+        try:
+            ctx.commit_to_finish("Deleting account data")
+        except jobs.JobCancelled:
+            db.query(models.User).filter(models.User.id == ctx.user_id).update({"deletion_requested_at": None}, synchronize_session=False)
+            db.commit()
+            raise
+        for model in USER_DATA_MODELS:
+            # Small chunks keep the write lock short so other users' requests interleave
+            while True:
+                n = _delete_chunk(db, model, ctx.user_id)
+                if not n:
+                    break
+                deleted[model] += n
+                ctx.progress(sum(deleted.values()) / total, f"Deleting {model.__tablename__}")
+        # Requests authenticated before the lock may still have written rows; sweep again
+        # right before the user row goes so nothing is left orphaned
+        for model in USER_DATA_MODELS:
+            deleted[model] += db.query(model).filter(model.user_id == ctx.user_id).delete(synchronize_session=False)
+        db.commit()
+        db.query(models.User).filter(models.User.id == ctx.user_id).delete(synchronize_session=False)
+        db.commit()
+        return {"deleted": {m.__tablename__: n for m, n in deleted.items()}}
+    finally:
+        db.close()
+
+@router.delete("/me", status_code=status.HTTP_202_ACCEPTED)
 def delete_account(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Manually delete related data since we don't have cascade set up in models (safer for now)
-    db.query(models.Transaction).filter(models.Transaction.user_id == current_user.id).delete()
-    db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == current_user.id).delete()
-    db.query(models.Debt).filter(models.Debt.user_id == current_user.id).delete()
-    db.query(models.WishlistItem).filter(models.WishlistItem.user_id == current_user.id).delete()
-    
-    # Delete user
-    db.delete(current_user)
+    # Lock first: from here on the account's token and password are refused
+    current_user.deletion_requested_at = datetime.utcnow().isoformat()
     db.commit()
-    return {"message": "Account deleted successfully"}
+    job = jobs.job_queue.enqueue("delete_account", current_user.id)
+    return {"message": "Account deletion started", "job_id": job.id, "status": job.status}
@@ -0,0 +1,146 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Optional
+from collections import namedtuple
+from datetime import datetime, timedelta
+import hashlib
+import json
+import uuid
+import models, occurrences, schemas
+from database import get_db
+from .auth import get_current_user
+from .goals import GoalCreate, GoalUpdate, GoalResponse, WishlistItemCreate, WishlistItemResponse
+from . import transactions
+
+router = APIRouter()
+
+MAX_OPERATIONS = 100
+# Retries after this long are treated as new requests
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+# `create` / `update` validate `data`; the hooks add the same side effects as the
+# single-resource routes (occurrences, anomaly statistics, alerts)
+Resource = namedtuple("Resource", "model create update response partial on_create on_update on_delete")
+
+def _add(db, obj):
+    db.add(obj)
+
+def _pass(db, obj):
+    pass
+
+def _delete(db, obj):
+    db.delete(obj)
+
+def _delete_plan(db, plan):
+    occurrences.remove_plan(db, plan.id)
+    db.delete(plan)
+
+def _stamp_wishlist_item(db, item):
+    item.addedAt = datetime.utcnow().isoformat()
+    db.add(item)
+
+RESOURCES = {
+    "transactions": Resource(models.Transaction, schemas.TransactionCreate, schemas.TransactionCreate, schemas.Transaction, False, transactions._create, transactions._set_currency, transactions._remove),
+    "debts": Resource(models.Debt, schemas.DebtCreate, schemas.DebtCreate, schemas.Debt, False, _add, _pass, _delete),
+    "recurring_plans": Resource(models.RecurringPlan, schemas.RecurringPlanCreate, schemas.RecurringPlanCreate, schemas.RecurringPlan, False, occurrences.add_plan, occurrences.refresh_plan, _delete_plan),
+    "goals": Resource(models.Goal, GoalCreate, GoalUpdate, GoalResponse, True, _add, _pass, _delete),
+    "wishlist": Resource(models.WishlistItem, WishlistItemCreate, WishlistItemCreate, WishlistItemResponse, False, _stamp_wishlist_item, _pass, _delete),
+}
+
+def _request_hash(request):
+    return hashlib.sha256(json.dumps(request.dict(), sort_keys=True, default=str).encode()).hexdigest()
+
+def _stored(db, key_id):
+    return db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id == key_id).first()
+
+def _replay(stored, request_hash, response):
+    if stored.requestHash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    response.headers["Idempotent-Replayed"] = "true"
+    return {**json.loads(stored.response), "replayed": True}
+
+def _validate(schema, data, index):
+    try:
+        return schema(**(data or {}))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail={"index": index, "errors": e.errors()})
+
+def _apply(db, user_id, index, operation):
+    resource = RESOURCES.get(operation.resource)
+    if resource is None:
+        raise HTTPException(status_code=400, detail={"index": index, "error": f"Unknown resource '{operation.resource}'. Use: {', '.join(RESOURCES)}"})
+    model = resource.model
+
+    if operation.op == "create":
+        fields = _validate(resource.create, operation.data, index).dict()
+        obj = model(**{**fields, "id": operation.id or fields.get("id") or str(uuid.uuid4())}, user_id=user_id)
+        resource.on_create(db, obj)
+    elif operation.op in ("update", "delete"):
+        if not operation.id:
+            raise HTTPException(status_code=400, detail={"index": index, "error": f"'{operation.op}' needs an id"})
+        obj = db.query(model).filter(model.id == operation.id, model.user_id == user_id).first()
+        if obj is None:
+            raise HTTPException(status_code=404, detail={"index": index, "error": f"{operation.resource} '{operation.id}' not found"})
+        if operation.op == "delete":
+            resource.on_delete(db, obj)
+            db.flush()
+            return {"op": "delete", "resource": operation.resource, "id": operation.id, "data": None}
+        fields = _validate(resource.update, operation.data, index).dict(exclude_unset=resource.partial)
+        for key, value in fields.items():
+            if key != "id":
+                setattr(obj, key, value)
+        resource.on_update(db, obj)
+    else:
+        raise HTTPException(status_code=400, detail={"index": index, "error": f"Unknown op '{operation.op}'. Use: create, update, delete"})
+
+    # Later operations in the batch may refer to this row
+    db.flush()
+    return {"op": operation.op, "resource": operation.resource, "id": obj.id, "data": {name: getattr(obj, name) for name in resource.response.__fields__}}
+
+@router.post("/batch", response_model=schemas.BatchResult)
+def apply_batch(
+    request: schemas.BatchRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Apply create / update / delete operations in order, all in one transaction."""
+    if len(request.operations) > MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"A batch is limited to {MAX_OPERATIONS} operations")
+
+    request_hash = key_id = None
+    if idempotency_key:
+        request_hash = _request_hash(request)
+        key_id = f"{current_user.id}:{idempotency_key}"
+        K = models.IdempotencyKey
+        cutoff = (datetime.utcnow() - IDEMPOTENCY_TTL).isoformat()
+        db.query(K).filter(K.user_id == current_user.id, K.createdAt < cutoff).delete(synchronize_session=False)
+        stored = _stored(db, key_id)
+        if stored is not None:
+            return _replay(stored, request_hash, response)
+
+    # Any error raised below leaves the session uncommitted, so nothing is applied
+    try:
+        results = [_apply(db, current_user.id, i, operation) for i, operation in enumerate(request.operations)]
+        result = {"results": results, "replayed": False}
+        if key_id:
+            db.add(models.IdempotencyKey(
+                id=key_id,
+                user_id=current_user.id,
+                key=idempotency_key,
+                requestHash=request_hash,
+                response=json.dumps(result, default=str),
+                createdAt=datetime.utcnow().isoformat(),
+            ))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # A concurrent retry with the same key committed first, or a create reused an existing id
+        stored = _stored(db, key_id) if key_id else None
+        if stored is None:
+            raise HTTPException(status_code=409, detail="Batch conflicts with existing data")
+        return _replay(stored, request_hash, response)
+    return result
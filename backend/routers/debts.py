@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-import models, schemas
+import models, netting, schemas, write_batcher
 from database import get_db
 from .auth import get_current_user
 import uuid
@@ -12,11 +12,29 @@ router = APIRouter()
 def read_debts(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     return db.query(models.Debt).filter(models.Debt.user_id == current_user.id).all()
 
+@router.get("/debts/balances", response_model=List[schemas.DebtBalance])
+def read_debt_balances(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return [
+        {"counterparty": counterparty, "personName": name, "balance": float(netting.from_minor(balance)), "openCount": count}
+        for counterparty, name, balance, count in netting.balances(db, current_user.id)
+    ]
+
+@router.get("/debts/balances/{person}")
+def read_debt_balance(person: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return {"counterparty": netting.normalise(person), "balance": float(netting.from_minor(netting.balance_with(db, current_user.id, person)))}
+
+@router.post("/debts/settlement", response_model=schemas.Settlement)
+def settle_debts(request: schemas.SettlementRequest, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    edges = [(e.debtor, e.creditor, e.amount) for e in request.edges]
+    return {"currency": current_user.currency, **netting.settle(db, current_user.id, request.members, edges)}
+
 @router.post("/debts", response_model=schemas.Debt)
 def create_debt(debt: schemas.DebtCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_debt = models.Debt(**debt.dict(), user_id=current_user.id)
     if not db_debt.id:
         db_debt.id = str(uuid.uuid4())
+    if write_batcher.enabled:
+        return write_batcher.batcher.add(db_debt, current_user.shard)
     db.add(db_debt)
     db.commit()
     db.refresh(db_debt)
@@ -0,0 +1,46 @@
+import asyncio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+import events
+from database import SessionLocal
+from .auth import user_from_token
+
+router = APIRouter()
+
+# Keeps idle connections from being dropped by proxies
+PING_SECONDS = 30
+
+@router.websocket("/events")
+async def stream_events(websocket: WebSocket, token: str = ""):
+    # Browsers cannot set headers on a WebSocket, so the bearer token comes as ?token=
+    db = SessionLocal()
+    try:
+        user = user_from_token(token, db)
+        user_id = user.id if user else None
+    finally:
+        db.close()
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    entry = events.broker.subscribe(user_id)
+    _, queue = entry
+    # The client sends nothing; reading only notices it going away
+    closed = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({get, closed}, timeout=PING_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            if closed in done:
+                get.cancel()
+                break
+            if get in done:
+                await websocket.send_json(get.result())
+            else:
+                get.cancel()
+                await websocket.send_json({"op": "ping"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        events.broker.unsubscribe(user_id, entry)
@@ -0,0 +1,157 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, Boolean, Float, Integer
+import csv
+import io
+import json
+import models
+from money import Money
+from database import shard_session
+from .auth import get_current_user
+
+router = APIRouter()
+
+# Rows are pulled from a server-side cursor in chunks of this size, so memory
+# stays flat no matter how long the user's history is
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_ENTITIES = {
+    "transactions": models.Transaction,
+    "debts": models.Debt,
+    "recurring_plans": models.RecurringPlan,
+    "goals": models.Goal,
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _columns(model):
+    # user_id is implied by the caller
+    return [c for c in model.__table__.columns if c.name != "user_id"]
+
+def _iter_chunks(model, user_id, shard):
+    """Yield lists of row tuples for one entity, EXPORT_CHUNK_SIZE at a time."""
+    columns = _columns(model)
+    db = shard_session(shard)
+    try:
+        stmt = (
+            select(*columns)
+            .where(model.user_id == user_id)
+            .order_by(model.id)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        for partition in db.execute(stmt).partitions():
+            yield partition
+    finally:
+        db.close()
+
+def _ndjson(entities, user_id, shard):
+    for name in entities:
+        model = EXPORT_ENTITIES[name]
+        names = [c.name for c in _columns(model)]
+        for chunk in _iter_chunks(model, user_id, shard):
+            lines = [json.dumps({"entity": name, **dict(zip(names, row))}) for row in chunk]
+            yield "\n".join(lines) + "\n"
+
+def _csv(name, user_id, shard):
+    model = EXPORT_ENTITIES[name]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c.name for c in _columns(model)])
+    for chunk in _iter_chunks(model, user_id, shard):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after every row group."""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _arrow_schema(pa, model):
+    def arrow_type(column):
+        if isinstance(column.type, Boolean):
+            return pa.bool_()
+        if isinstance(column.type, Money):
+            return pa.float64()
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        if isinstance(column.type, Float):
+            return pa.float64()
+        return pa.string()
+    return pa.schema([(c.name, arrow_type(c)) for c in _columns(model)])
+
+def _parquet(pa, pq, name, user_id, shard):
+    model = EXPORT_ENTITIES[name]
+    schema = _arrow_schema(pa, model)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in _iter_chunks(model, user_id, shard):
+            # One row group per chunk; transpose row tuples into columns
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays([pa.array(col, type=f.type) for col, f in zip(columns, schema)], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+@router.get("/export")
+def export_data(format: str = "ndjson", entities: str = None, current_user: models.User = Depends(get_current_user)):
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(MEDIA_TYPES)}")
+
+    if entities:
+        selected = [e.strip() for e in entities.split(",") if e.strip()]
+    else:
+        selected = list(EXPORT_ENTITIES) if format == "ndjson" else ["transactions"]
+    unknown = [e for e in selected if e not in EXPORT_ENTITIES]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown entities: {', '.join(unknown)}. Use: {', '.join(EXPORT_ENTITIES)}")
+    if format != "ndjson" and len(selected) != 1:
+        raise HTTPException(status_code=400, detail="CSV and Parquet exports take a single entity")
+
+    user_id, shard = current_user.id, current_user.shard
+    if format == "ndjson":
+        body = _ndjson(selected, user_id, shard)
+        filename = "bufin-export.ndjson"
+    elif format == "csv":
+        body = _csv(selected[0], user_id, shard)
+        filename = f"bufin-{selected[0]}.csv"
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed")
+        body = _parquet(pa, pq, selected[0], user_id, shard)
+        filename = f"bufin-{selected[0]}.parquet"
+
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
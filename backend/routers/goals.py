@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from database import get_db
-import models
+import models, projections, affordability, ai_service
 from .auth import get_current_user
 import uuid
 from datetime import datetime
@@ -70,6 +70,17 @@ def create_goal(goal: GoalCreate, db: Session = Depends(get_db), current_user: m
     db.refresh(db_goal)
     return db_goal
 
+@router.get("/goals/projections")
+def get_goal_projections(paths: int = 2000, horizon_years: int = 30, seed: Optional[int] = None, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    goals = db.query(models.Goal).filter(models.Goal.user_id == current_user.id).all()
+    plans = db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == current_user.id).all()
+    return projections.project_goals(
+        current_user, goals, plans,
+        paths=max(0, min(paths, 20000)),
+        horizon_months=max(1, min(horizon_years, 50)) * 12,
+        seed=seed,
+    )
+
 @router.put("/goals/{goal_id}", response_model=GoalResponse)
 def update_goal(goal_id: str, goal_update: GoalUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_goal = db.query(models.Goal).filter(models.Goal.id == goal_id, models.Goal.user_id == current_user.id).first()
@@ -119,6 +130,25 @@ def create_wishlist_item(item: WishlistItemCreate, db: Session = Depends(get_db)
     db.refresh(db_item)
     return db_item
 
+@router.get("/wishlist/affordability")
+def get_wishlist_affordability(horizon_days: int = affordability.DEFAULT_HORIZON_DAYS, buffer: float = 0.0, sequential: bool = False, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    items = db.query(models.WishlistItem).filter(models.WishlistItem.user_id == current_user.id).order_by(models.WishlistItem.addedAt).all()
+    return affordability.evaluate(db, current_user, items, horizon_days=max(1, min(horizon_days, 1095)), buffer=max(buffer, 0.0), sequential=sequential)
+
+@router.post("/wishlist/{item_id}/explain")
+async def explain_wishlist_item(item_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # The only wishlist route that calls the model; the numbers come from the affordability engine
+    db_item = db.query(models.WishlistItem).filter(models.WishlistItem.id == item_id, models.WishlistItem.user_id == current_user.id).first()
+    if not db_item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if not ai_service.get_api_key():
+        raise HTTPException(status_code=503, detail="AI explanations are not configured")
+    report = affordability.evaluate(db, current_user, [db_item])
+    context = {key: value for key, value in report.items() if key != "items"}
+    context["evaluation"] = report["items"][0]
+    explanation = await ai_service.analyze_purchase(f"Can I afford {db_item.name} for {db_item.cost}?", context)
+    return {"item_id": db_item.id, "evaluation": report["items"][0], "explanation": explanation}
+
 @router.delete("/wishlist/{item_id}")
 def delete_wishlist_item(item_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_item = db.query(models.WishlistItem).filter(models.WishlistItem.id == item_id, models.WishlistItem.user_id == current_user.id).first()
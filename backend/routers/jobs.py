@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+import models, schemas
+from database import get_db
+from jobs import job_queue
+from .auth import get_job_user
+
+router = APIRouter()
+
+def _get_job(db, job_id, user_id):
+    db_job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.user_id == user_id).first()
+    if not db_job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+@router.get("/jobs", response_model=List[schemas.Job])
+def read_jobs(limit: int = 20, db: Session = Depends(get_db), current_user: models.User = Depends(get_job_user)):
+    return db.query(models.Job).filter(models.Job.user_id == current_user.id).order_by(models.Job.createdAt.desc()).limit(limit).all()
+
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_job_user)):
+    return _get_job(db, job_id, current_user.id)
+
+@router.post("/jobs/{job_id}/cancel", response_model=schemas.Job)
+def cancel_job(job_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_job_user)):
+    db_job = _get_job(db, job_id, current_user.id)
+    if db_job.status in ("succeeded", "failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Job already {db_job.status}")
+    deleting = db_job.kind == "delete_account"
+    queued = db_job.status == "queued"
+    # Account deletion can only be cancelled before its first rows are gone
+    if job_queue.cancel(db, db_job, before_progress=deleting) is None:
+        detail = "Account deletion can no longer be cancelled" if deleting else "Job already finished"
+        raise HTTPException(status_code=409, detail=detail)
+    if deleting and queued and db_job.status == "cancelled":
+        # The handler never runs, so unlock here (a running one unlocks itself)
+        current_user.deletion_requested_at = None
+        db.commit()
+        db.refresh(db_job)
+    return db_job
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-import models, schemas
+from datetime import date, timedelta
+import models, occurrences, schemas, write_batcher
 from database import get_db
 from .auth import get_current_user
 import uuid
@@ -12,12 +13,28 @@ router = APIRouter()
 def read_recurring_plans(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     return db.query(models.RecurringPlan).filter(models.RecurringPlan.user_id == current_user.id).all()
 
+@router.get("/recurring_plans/occurrences", response_model=List[schemas.RecurringOccurrence])
+def read_occurrences(start: str = None, end: str = None, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Defaults to the next 30 days
+    try:
+        start_date = date.fromisoformat(start) if start else date.today()
+        end_date = date.fromisoformat(end) if end else start_date + timedelta(days=30)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end_date - start_date).days > 3660:
+        raise HTTPException(status_code=400, detail="Date range is limited to 10 years")
+    return occurrences.between(db, current_user.id, start_date, end_date)
+
 @router.post("/recurring_plans", response_model=schemas.RecurringPlan)
 def create_recurring_plan(plan: schemas.RecurringPlanCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_plan = models.RecurringPlan(**plan.dict(), user_id=current_user.id)
     if not db_plan.id:
         db_plan.id = str(uuid.uuid4())
-    db.add(db_plan)
+    if write_batcher.enabled:
+        return write_batcher.batcher.run(lambda batch_db: occurrences.add_plan(batch_db, db_plan), current_user.shard)
+    occurrences.add_plan(db, db_plan)
     db.commit()
     db.refresh(db_plan)
     return db_plan
@@ -27,6 +44,7 @@ def delete_recurring_plan(plan_id: str, db: Session = Depends(get_db), current_u
     db_plan = db.query(models.RecurringPlan).filter(models.RecurringPlan.id == plan_id, models.RecurringPlan.user_id == current_user.id).first()
     if not db_plan:
         raise HTTPException(status_code=404, detail="Plan not found")
+    occurrences.remove_plan(db, db_plan.id)
     db.delete(db_plan)
     db.commit()
     return {"ok": True}
@@ -41,6 +59,7 @@ def update_recurring_plan(plan_id: str, plan: schemas.RecurringPlanCreate, db: S
         if key != 'id':
             setattr(db_plan, key, value)
 
+    occurrences.refresh_plan(db, db_plan)
     db.commit()
     db.refresh(db_plan)
     return db_plan
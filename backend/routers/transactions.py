@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
-import models, schemas
+from typing import List, Optional
+import models, schemas, search, write_batcher, aggregates, balance_history, anomalies, fx
+from datetime import date, timedelta
 from database import get_db
 from .auth import get_current_user
 import uuid
@@ -13,12 +14,139 @@ def read_transactions(skip: int = 0, limit: int = 100, db: Session = Depends(get
     transactions = db.query(models.Transaction).filter(models.Transaction.user_id == current_user.id).offset(skip).limit(limit).all()
     return transactions
 
+# Sort keys accepted by /transactions/query; prefix with "-" for descending
+SORT_COLUMNS = {
+    "date": models.Transaction.date,
+    "amount": models.Transaction.amount,
+    "category": models.Transaction.category,
+    "merchant": models.Transaction.merchant,
+    "description": models.Transaction.description,
+}
+
+def _sort_clauses(sort):
+    clauses = []
+    for key in [k.strip() for k in sort.split(",") if k.strip()]:
+        column = SORT_COLUMNS.get(key.lstrip("-"))
+        if column is None:
+            raise HTTPException(status_code=400, detail=f"Cannot sort by '{key}'. Use: {', '.join(SORT_COLUMNS)}")
+        clauses.append(column.desc() if key.startswith("-") else column.asc())
+    # Stable paging when the sort keys tie
+    clauses.append(models.Transaction.id.asc())
+    return clauses
+
+@router.get("/transactions/query", response_model=schemas.TransactionQueryResult)
+def query_transactions(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[List[str]] = Query(None),
+    type: Optional[str] = None,
+    necessity: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    sort: str = "-date",
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    T = models.Transaction
+    filters = aggregates.TransactionFilters(start_date, end_date, category, type, necessity, min_amount, max_amount)
+    try:
+        base = filters.apply(db.query(T).filter(T.user_id == current_user.id))
+        # Totals cover every matching row, not just this page
+        by_category = aggregates.flow_totals(db, current_user.id, current_user.currency, group="category", filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = base.order_by(*_sort_clauses(sort)).offset(skip).limit(min(limit, 500)).all()
+
+    total = aggregates.overall(by_category, current_user.currency)
+    by_category.sort(key=lambda c: c.income_minor + c.expense_minor, reverse=True)
+    return {
+        "items": items,
+        "total": total.count,
+        "currency": total.currency,
+        "income": total.income,
+        "expense": total.expense,
+        "by_category": [{"category": c.key, "count": c.count, "income": c.income, "expense": c.expense} for c in by_category],
+    }
+
+@router.get("/transactions/summary", response_model=schemas.TransactionSummary)
+def summarize_transactions(
+    group: Optional[str] = "month",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[List[str]] = Query(None),
+    necessity: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    filters = aggregates.TransactionFilters(start_date, end_date, category, necessity=necessity)
+    try:
+        groups = aggregates.flow_totals(db, current_user.id, current_user.currency, group=group, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = aggregates.overall(groups, current_user.currency)
+    return {**total.as_dict(), "currency": total.currency, "groups": [g.as_dict() for g in groups]}
+
+@router.get("/transactions/balance_history", response_model=schemas.BalanceHistory)
+def read_balance_history(start_date: Optional[str] = None, end_date: Optional[str] = None, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    # Defaults to the last 90 days
+    try:
+        end = date.fromisoformat(end_date) if end_date else date.today()
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=89)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be YYYY-MM-DD")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if (end - start).days > 3660:
+        raise HTTPException(status_code=400, detail="Date range is limited to 10 years")
+    series = balance_history.daily_series(db, current_user, start, end)
+    return {
+        "currency": current_user.currency,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "points": [{"date": day.isoformat(), "balance": balance} for day, balance in series],
+    }
+
+@router.get("/transactions/search", response_model=schemas.TransactionSearchResults)
+def search_transactions(q: str, limit: int = 20, skip: int = 0, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    results = search.search_transactions(db, current_user.id, q, limit=min(limit, 100), skip=skip)
+    return {"query": q, "results": results}
+
+def _set_currency(db, db_transaction, home=None):
+    """Store the currency as NULL when it is the user's own; 400 when there are no rates for it."""
+    if not db_transaction.currency:
+        return
+    if home is None:
+        home = db.query(models.User.currency).filter(models.User.id == db_transaction.user_id).scalar()
+    try:
+        db_transaction.currency = fx.normalize(db_transaction.currency, home)
+    except fx.MissingRate as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _insert(db, db_transaction):
+    db.add(db_transaction)
+    # Streaming statistics and alerts commit with the transaction itself
+    anomalies.record(db, db_transaction)
+    return db_transaction
+
+def _create(db, db_transaction):
+    _set_currency(db, db_transaction)
+    return _insert(db, db_transaction)
+
+def _remove(db, db_transaction):
+    db.query(models.SpendingAlert).filter(models.SpendingAlert.transaction_id == db_transaction.id).delete(synchronize_session=False)
+    db.delete(db_transaction)
+
 @router.post("/transactions", response_model=schemas.Transaction)
 def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     db_transaction = models.Transaction(**transaction.dict(), user_id=current_user.id)
     if not db_transaction.id:
         db_transaction.id = str(uuid.uuid4())
-    db.add(db_transaction)
+    _set_currency(db, db_transaction, current_user.currency)
+    if write_batcher.enabled:
+        return write_batcher.batcher.run(lambda batch_db: _insert(batch_db, db_transaction), current_user.shard)
+    _insert(db, db_transaction)
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
@@ -28,7 +156,7 @@ def delete_transaction(transaction_id: str, db: Session = Depends(get_db), curre
     db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id, models.Transaction.user_id == current_user.id).first()
     if not db_transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    db.delete(db_transaction)
+    _remove(db, db_transaction)
     db.commit()
     return {"ok": True}
 
@@ -41,6 +169,7 @@ def update_transaction(transaction_id: str, transaction: schemas.TransactionCrea
     for key, value in transaction.dict().items():
         if key != 'id': # Don't update ID
             setattr(db_transaction, key, value)
+    _set_currency(db, db_transaction, current_user.currency)
 
     db.commit()
     db.refresh(db_transaction)
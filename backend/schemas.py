@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 # --- User Schemas ---
 class UserBase(BaseModel):
@@ -56,6 +56,7 @@ class TransactionBase(BaseModel):
     necessity: str = 'variable'
     date: str
     remarks: Optional[str] = None
+    currency: Optional[str] = None # ISO code; null when in the user's currency
 
 class TransactionCreate(TransactionBase):
     id: Optional[str] = None
@@ -65,6 +66,50 @@ class Transaction(TransactionBase):
     class Config:
         orm_mode = True
 
+class TransactionSearchHit(Transaction):
+    snippet: Optional[str] = None # HTML: description escaped, matched terms wrapped in <mark>
+    merchant_highlight: Optional[str] = None
+    rank: float = 0.0
+
+class TransactionSearchResults(BaseModel):
+    query: str
+    results: List[TransactionSearchHit]
+
+class CategoryAggregate(BaseModel):
+    category: Optional[str] = None
+    count: int
+    income: float
+    expense: float
+
+class TransactionQueryResult(BaseModel):
+    items: List[Transaction]
+    total: int # rows matching the filters, across all pages
+    currency: str
+    income: float
+    expense: float
+    by_category: List[CategoryAggregate]
+
+class FlowTotal(BaseModel):
+    key: Optional[str] = None
+    count: int
+    income: float
+    expense: float
+    net: float
+
+class TransactionSummary(FlowTotal):
+    currency: str
+    groups: List[FlowTotal]
+
+class BalancePoint(BaseModel):
+    date: str
+    balance: float
+
+class BalanceHistory(BaseModel):
+    currency: str
+    start: str
+    end: str
+    points: List[BalancePoint]
+
 class RecurringPlanBase(BaseModel):
     name: str
     amount: float
@@ -81,6 +126,13 @@ class RecurringPlan(RecurringPlanBase):
     class Config:
         orm_mode = True
 
+class RecurringOccurrence(BaseModel):
+    plan_id: str
+    date: str
+    name: str
+    amount: float
+    type: str
+
 class DebtBase(BaseModel):
     personName: str
     amount: float
@@ -96,6 +148,46 @@ class Debt(DebtBase):
     class Config:
         orm_mode = True
 
+class DebtBalance(BaseModel):
+    counterparty: str
+    personName: str
+    balance: float
+    openCount: int
+
+    class Config:
+        orm_mode = True
+
+class SpendingAlert(BaseModel):
+    id: str
+    transaction_id: Optional[str] = None
+    date: str
+    scope: str
+    key: str
+    amount: float
+    expected: float
+    zscore: float
+    message: str
+    seen: bool
+    createdAt: str
+
+    class Config:
+        orm_mode = True
+
+class SettlementEdge(BaseModel):
+    # `debtor` owes `creditor` this amount
+    debtor: str
+    creditor: str
+    amount: float
+
+class SettlementRequest(BaseModel):
+    members: Optional[List[str]] = None
+    edges: List[SettlementEdge] = []
+
+class Settlement(BaseModel):
+    currency: str
+    net: Dict[str, float]
+    transfers: List[SettlementEdge]
+
 class WishlistItemBase(BaseModel):
     name: str
     cost: float
@@ -108,3 +200,62 @@ class WishlistItem(WishlistItemBase):
     id: str
     class Config:
         orm_mode = True
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: float = 0.0
+    message: Optional[str] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+    cancelRequested: bool = False
+    createdAt: str
+    startedAt: Optional[str] = None
+    finishedAt: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class BatchOperation(BaseModel):
+    op: str # 'create', 'update' or 'delete'
+    resource: str # 'transactions', 'debts', 'recurring_plans', 'goals' or 'wishlist'
+    id: Optional[str] = None # required for update / delete; optional client-chosen id on create
+    data: Optional[Dict[str, Any]] = None
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+
+class BatchOperationResult(BaseModel):
+    op: str
+    resource: str
+    id: str
+    data: Optional[Dict[str, Any]] = None # the row after the operation; None for delete
+
+class BatchResult(BaseModel):
+    results: List[BatchOperationResult]
+    replayed: bool = False # True when served from a stored idempotency key
+
+class AIInsight(BaseModel):
+    kind: str
+    content: Optional[Any] = None # alert: sentence or None; tips: list of strings
+    computedAt: Optional[str] = None
+    stale: bool
+    refreshing: bool # a background refresh is scheduled
+
+class SpendingLeak(BaseModel):
+    category: str
+    amount: float # over the monthly average, or this month's total without history
+    suggestion: str
+
+class SubscriptionCandidate(BaseModel):
+    name: str
+    amount: float # latest payment
+    frequency: str
+    lastPaid: str
+    isVariable: bool
+
+class SpendingPatterns(BaseModel):
+    currency: str
+    leaks: List[SpendingLeak]
+    subscriptions: List[SubscriptionCandidate]
@@ -0,0 +1,122 @@
+"""
+Full-text transaction search.
+
+On SQLite the `transactions_fts` FTS5 index mirrors description, merchant, remarks
+and category of every transaction. It is an external-content table kept in sync
+by triggers, so every write path (routers, write batcher, bulk deletes) updates it
+without application code. user_id is indexed too, which lets a query restrict
+itself to one user inside the index instead of filtering matches afterwards.
+
+Results carry `snippet` / `merchant_highlight` HTML: the stored text escaped, with the
+matched terms wrapped in <mark>. Other databases (or SQLite builds without FTS5) fall
+back to a LIKE scan, without highlights.
+"""
+import html
+import re
+from sqlalchemy import text
+from money import from_minor
+
+FTS_TABLE = "transactions_fts"
+# Matches are ranked with bm25, weighting these columns (user_id is never matched)
+RANK_WEIGHTS = "0.0, 3.0, 2.0, 1.0, 1.0"
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        user_id, description, merchant, remarks, category,
+        content='transactions', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, user_id, description, merchant, remarks, category)
+        VALUES (new.rowid, new.user_id, new.description, new.merchant, new.remarks, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_ad AFTER DELETE ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, user_id, description, merchant, remarks, category)
+        VALUES ('delete', old.rowid, old.user_id, old.description, old.merchant, old.remarks, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_au AFTER UPDATE ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, user_id, description, merchant, remarks, category)
+        VALUES ('delete', old.rowid, old.user_id, old.description, old.merchant, old.remarks, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, user_id, description, merchant, remarks, category)
+        VALUES (new.rowid, new.user_id, new.description, new.merchant, new.remarks, new.category);
+    END""",
+]
+
+def _fts5_available(conn):
+    if conn.dialect.name != "sqlite":
+        return False
+    options = [row[0] for row in conn.execute(text("PRAGMA compile_options"))]
+    return "ENABLE_FTS5" in options
+
+def create_index(conn):
+    """Create the FTS table and triggers and index existing rows. Safe to re-run."""
+    if not _fts5_available(conn):
+        print("FTS5 not available; transaction search will use LIKE scans.")
+        return
+    for statement in FTS_DDL:
+        conn.execute(text(statement))
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+def has_index(db):
+    if db.bind.dialect.name != "sqlite":
+        return False
+    return db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first() is not None
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+def _match_expression(user_id, terms):
+    # Every term is a prefix match; the user_id phrase keeps the lookup inside one user's rows
+    text_terms = " ".join(f'"{term}"*' for term in terms)
+    return f'user_id : "{user_id}" AND {{description merchant remarks category}} : ({text_terms})'
+
+# FTS marks matches with these, so the user's text can be escaped before the <mark> tags go in
+OPEN, CLOSE = "\x02", "\x03"
+
+def _markup(highlighted):
+    """HTML for a snippet / highlight: the text escaped, matches wrapped in <mark>."""
+    if highlighted is None:
+        return None
+    return html.escape(highlighted).replace(OPEN, "<mark>").replace(CLOSE, "</mark>")
+
+TRANSACTION_COLUMNS = "t.id, t.date, t.amount, t.category, t.description, t.merchant, t.type, t.necessity, t.remarks, t.currency"
+
+def search_transactions(db, user_id, query, limit=20, skip=0):
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if has_index(db):
+        rows = db.execute(text(f"""
+            SELECT {TRANSACTION_COLUMNS},
+                   snippet({FTS_TABLE}, 1, :open, :close, '…', 12) AS snippet,
+                   highlight({FTS_TABLE}, 2, :open, :close) AS merchant_highlight,
+                   bm25({FTS_TABLE}, {RANK_WEIGHTS}) AS rank
+            FROM {FTS_TABLE}
+            JOIN transactions t ON t.rowid = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :match AND t.user_id = :user_id
+            ORDER BY rank
+            LIMIT :limit OFFSET :skip
+        """), {"match": _match_expression(user_id, terms), "user_id": user_id, "limit": limit, "skip": skip, "open": OPEN, "close": CLOSE})
+    else:
+        conditions = " AND ".join(
+            f"(lower(t.description) LIKE :p{i} OR lower(t.merchant) LIKE :p{i} OR lower(t.remarks) LIKE :p{i} OR lower(t.category) LIKE :p{i})"
+            for i in range(len(terms))
+        )
+        params = {f"p{i}": f"%{term}%" for i, term in enumerate(terms)}
+        rows = db.execute(text(f"""
+            SELECT {TRANSACTION_COLUMNS}, NULL AS snippet, NULL AS merchant_highlight, 0.0 AS rank
+            FROM transactions t
+            WHERE t.user_id = :user_id AND {conditions}
+            ORDER BY t.date DESC
+            LIMIT :limit OFFSET :skip
+        """), {"user_id": user_id, "limit": limit, "skip": skip, **params})
+
+    # Raw SQL bypasses the Money column type, so convert amounts here
+    return [
+        {**row._mapping, "amount": float(from_minor(row.amount)),
+         "snippet": _markup(row.snippet), "merchant_highlight": _markup(row.merchant_highlight)}
+        for row in rows
+    ]
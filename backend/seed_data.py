@@ -0,0 +1,254 @@
+"""
+Synthetic data generator.
+
+Fills the configured database (bufin.db by default, or BUFIN_DATABASE_URL) with
+N users and a realistic financial history for each of them:
+
+- expenses drawn from a Zipfian merchant distribution (a few merchants get most visits)
+- monthly salary and rent, both as recurring plans and as the matching ledger entries
+- subscriptions, split-expense debts, savings/investment goals and wishlist items
+
+Usage:
+    python seed_data.py --users 100 --months 12
+"""
+import argparse
+import calendar
+import random
+import uuid
+from datetime import date, timedelta
+
+import models, auth_utils, migrate_db
+from database import SessionLocal, ring
+
+DEFAULT_PASSWORD = "password123"
+
+# (merchant, category, necessity, typical amount)
+MERCHANTS = [
+    ("Swiggy", "Food", "variable", 350),
+    ("BigBasket", "Groceries", "variable", 1200),
+    ("Uber", "Transport", "variable", 250),
+    ("Zomato", "Food", "variable", 400),
+    ("Starbucks", "Food", "variable", 300),
+    ("Amazon", "Shopping", "variable", 1500),
+    ("DMart", "Groceries", "variable", 2000),
+    ("Indian Oil", "Transport", "variable", 1800),
+    ("PVR Cinemas", "Entertainment", "variable", 700),
+    ("Apollo Pharmacy", "Health", "variable", 600),
+    ("Myntra", "Shopping", "variable", 2200),
+    ("Chai Point", "Food", "variable", 80),
+    ("Ola", "Transport", "variable", 220),
+    ("Decathlon", "Shopping", "variable", 2500),
+    ("Cult.fit", "Health", "variable", 1000),
+    ("BookMyShow", "Entertainment", "variable", 500),
+    ("Croma", "Electronics", "variable", 5000),
+    ("IRCTC", "Travel", "variable", 1500),
+    ("MakeMyTrip", "Travel", "variable", 8000),
+    ("Local Kirana", "Groceries", "variable", 450),
+]
+
+SUBSCRIPTIONS = [
+    ("Netflix", "Entertainment", 649),
+    ("Spotify", "Entertainment", 119),
+    ("Jio Fiber", "Utilities", 999),
+    ("Electricity", "Utilities", 1800),
+    ("Gym Membership", "Health", 1500),
+]
+
+FRIENDS = ["Aarav", "Diya", "Kabir", "Meera", "Rohan", "Sana", "Vikram", "Zoya", "Ishaan", "Anaya"]
+
+GOALS = [
+    ("Emergency Fund", "savings", "ShieldCheck", 0.0),
+    ("New Laptop", "savings", "Laptop", 0.0),
+    ("Goa Trip", "savings", "Plane", 0.0),
+    ("Index Fund SIP", "investment", "TrendingUp", 12.0),
+    ("House Down Payment", "investment", "Home", 8.0),
+]
+
+WISHLIST = [("Noise Cancelling Headphones", 18000), ("Mechanical Keyboard", 7500), ("Air Fryer", 6500),
+            ("Smart Watch", 22000), ("Espresso Machine", 35000), ("Kindle", 14000)]
+
+
+def zipf_weights(n, s=1.1):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def last_working_day(year, month):
+    d = date(year, month, calendar.monthrange(year, month)[1])
+    while d.weekday() >= 5:
+        d -= timedelta(days=1)
+    return d
+
+
+def month_starts(end, months):
+    year, month = end.year, end.month
+    starts = []
+    for _ in range(months):
+        starts.append(date(year, month, 1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(starts))
+
+
+def generate_user(rng, index, hashed_password, today, months, tx_per_month):
+    user_id = str(uuid.uuid4())
+    salary = rng.choice([45000, 60000, 85000, 120000, 180000])
+    rent = round(salary * rng.uniform(0.2, 0.35), -2)
+    weights = zipf_weights(len(MERCHANTS))
+    balance = round(salary * rng.uniform(0.5, 3.0), 2)
+
+    user = {
+        "id": user_id,
+        "email": f"user{index}@example.com",
+        "hashed_password": hashed_password,
+        "full_name": f"Test User {index}",
+        "currency": "INR",
+        "monthly_income": float(salary),
+        "current_balance": balance,
+        "savings_goal": round(salary * 0.2, -2),
+        "financial_literacy": rng.choice(["beginner", "intermediate", "advanced"]),
+        "risk_tolerance": rng.choice(["low", "medium", "high"]),
+        "goals": "[]",
+    }
+
+    transactions = []
+
+    def add_tx(day, amount, category, description, merchant, type_, necessity, remarks=None):
+        transactions.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "date": day.isoformat(),
+            "amount": float(amount),
+            "category": category,
+            "description": description,
+            "merchant": merchant,
+            "type": type_,
+            "necessity": necessity,
+            "remarks": remarks,
+        })
+
+    subscriptions = rng.sample(SUBSCRIPTIONS, rng.randint(1, len(SUBSCRIPTIONS)))
+
+    for start in month_starts(today, months):
+        payday = last_working_day(start.year, start.month)
+        if payday <= today:
+            add_tx(payday, salary, "Salary", "Monthly Salary", "Employer", "income", "fixed")
+        add_tx(start, rent, "Rent", "Rent Payment", "Landlord", "expense", "fixed")
+        for name, category, amount in subscriptions:
+            day = start + timedelta(days=rng.randint(0, 27))
+            if day <= today:
+                add_tx(day, amount, category, f"{name} Bill", name, "expense", "fixed")
+
+        for _ in range(max(1, int(rng.gauss(tx_per_month, tx_per_month * 0.2)))):
+            day = start + timedelta(days=rng.randint(0, 27))
+            if day > today:
+                continue
+            merchant, category, necessity, typical = rng.choices(MERCHANTS, weights=weights)[0]
+            amount = round(max(20, rng.lognormvariate(0, 0.5) * typical), 2)
+            add_tx(day, amount, category, f"{merchant} {category}", merchant, "expense", necessity)
+
+    recurring_plans = [
+        {"id": str(uuid.uuid4()), "user_id": user_id, "name": "Salary", "amount": float(salary),
+         "type": "income", "frequency": "monthly", "expectedDate": "last-working", "endDate": None},
+        {"id": str(uuid.uuid4()), "user_id": user_id, "name": "Rent", "amount": float(rent),
+         "type": "expense", "frequency": "monthly", "expectedDate": "1", "endDate": None},
+    ]
+    for name, category, amount in subscriptions:
+        recurring_plans.append({
+            "id": str(uuid.uuid4()), "user_id": user_id, "name": name, "amount": float(amount),
+            "type": "expense", "frequency": "monthly", "expectedDate": str(rng.randint(1, 28)),
+            "endDate": None,
+        })
+
+    debts = []
+    for _ in range(rng.randint(0, 8)):
+        due = today + timedelta(days=rng.randint(-30, 60))
+        name = rng.choice(FRIENDS)
+        debts.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "personName": name,
+            # Bulk inserts skip Debt's validator, which normally sets this
+            "counterparty": models.counterparty_key(name),
+            "amount": float(rng.choice([100, 250, 300, 500, 1200, 2000])),
+            "direction": rng.choice(["receivable", "receivable", "payable"]),
+            "dueDate": due.isoformat() if rng.random() < 0.6 else None,
+            "status": "active" if rng.random() < 0.8 else "settled",
+        })
+
+    goals = []
+    for name, goal_type, icon, rate in rng.sample(GOALS, rng.randint(1, 3)):
+        target = round(salary * rng.uniform(1, 12), -3)
+        goals.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "name": name,
+            "targetAmount": float(target),
+            "currentAmount": round(target * rng.uniform(0, 0.6), 2),
+            "targetDate": (today + timedelta(days=rng.randint(90, 1500))).isoformat(),
+            "icon": icon,
+            "fundingSource": "manual",
+            "type": goal_type,
+            "projectedReturnRate": rate,
+        })
+
+    wishlist = []
+    for name, cost in rng.sample(WISHLIST, rng.randint(0, 3)):
+        wishlist.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "name": name,
+            "cost": float(cost),
+            "addedAt": (today - timedelta(days=rng.randint(0, 10))).isoformat(),
+        })
+
+    return {
+        models.User: [user],
+        models.Transaction: transactions,
+        models.RecurringPlan: recurring_plans,
+        models.Debt: debts,
+        models.Goal: goals,
+        models.WishlistItem: wishlist,
+    }
+
+
+def seed(users=10, months=12, tx_per_month=40, seed_value=42, start_index=0, today=None):
+    """Insert `users` synthetic users and return the number of rows written per table."""
+    rng = random.Random(seed_value)
+    today = today or date.today()
+    migrate_db.migrate()
+
+    # bcrypt is deliberately slow, so every synthetic user shares one hash
+    hashed_password = auth_utils.get_password_hash(DEFAULT_PASSWORD)
+    counts = {}
+
+    db = SessionLocal()
+    try:
+        for index in range(start_index, start_index + users):
+            rows = generate_user(rng, index, hashed_password, today, months, tx_per_month)
+            user = rows[models.User][0]
+            user["shard"] = ring.shard_for(user["id"])
+            db.info["shard"] = user["shard"]
+            for model, mappings in rows.items():
+                if mappings:
+                    db.bulk_insert_mappings(model, mappings)
+                counts[model.__tablename__] = counts.get(model.__tablename__, 0) + len(mappings)
+            db.commit()
+    finally:
+        db.close()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the BuFin database with synthetic users")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--months", type=int, default=12, help="Months of history per user")
+    parser.add_argument("--tx-per-month", type=int, default=40, help="Average discretionary expenses per month")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-index", type=int, default=0, help="First user index (emails are user<N>@example.com)")
+    args = parser.parse_args()
+
+    counts = seed(args.users, args.months, args.tx_per_month, args.seed, args.start_index)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    print(f"Login with user{args.start_index}@example.com / {DEFAULT_PASSWORD}")
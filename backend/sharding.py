@@ -0,0 +1,50 @@
+"""
+Consistent-hash placement of users on database shards.
+
+Every query filters on user_id, so each user's rows can live in their own database.
+Shards are configured with BUFIN_SHARDS as comma-separated `name=url` pairs, next to
+the primary database (BUFIN_DATABASE_URL), which is always the shard "default" and
+also holds the directory: `users.shard` records where each user's data lives. URLs
+can be separate SQLite files or Postgres databases / schemas
+(`...?options=-csearch_path%3Dshard_1`). The users table stays in the primary
+database, so foreign keys to it are not enforced on shards (SQLite does not enforce
+them by default; on Postgres shards drop those constraints).
+
+New users are placed on the ring; existing users stay where the directory says until
+`rebalance_shards.py` moves them, so adding a shard only moves the users whose ring
+position changed (roughly 1/N of them).
+"""
+import bisect
+import hashlib
+
+DEFAULT_SHARD = "default"
+# Virtual nodes per shard, which evens out how many users each shard gets
+VNODES = 64
+
+def parse_shards(spec):
+    """`"a=sqlite:///./a.db, b=postgresql://..."` -> `{"a": url, "b": url}`."""
+    shards = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, sep, url = entry.partition("=")
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"Invalid BUFIN_SHARDS entry '{entry}'; expected name=url")
+        if name.strip() == DEFAULT_SHARD:
+            raise ValueError(f"'{DEFAULT_SHARD}' is the primary database; set BUFIN_DATABASE_URL instead")
+        shards[name.strip()] = url.strip()
+    return shards
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    def __init__(self, shards, vnodes=VNODES):
+        self.shards = list(shards)
+        points = sorted((_hash(f"{shard}#{i}"), shard) for shard in self.shards for i in range(vnodes))
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id):
+        if len(self.shards) == 1:
+            return self.shards[0]
+        index = bisect.bisect(self._keys, _hash(user_id)) % len(self._keys)
+        return self._shards[index]
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import uuid
+
+# Point the app at a scratch database before anything imports database.py
+os.environ["BUFIN_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ["BUFIN_INSIGHTS_SCHEDULER"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+import main
+from database import SessionLocal
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+@pytest.fixture
+def signup(client):
+    """Create an account; returns (auth headers, email)."""
+    def _signup(password="pw"):
+        email = f"{uuid.uuid4().hex[:12]}@example.com"
+        r = client.post("/api/auth/signup", json={"email": email, "password": password, "full_name": "Test"})
+        assert r.status_code == 200, r.text
+        return {"Authorization": "Bearer " + r.json()["access_token"]}, email
+    return _signup
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
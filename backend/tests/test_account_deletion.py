@@ -0,0 +1,130 @@
+import uuid
+import pytest
+import jobs, models
+from database import SessionLocal
+from routers import auth
+
+class Ctx:
+    """Stands in for jobs.JobContext, with a hook run on each progress update."""
+    def __init__(self, user_id, on_progress=None):
+        self.user_id = user_id
+        self.cancel_requested = False
+        self.on_progress = on_progress or (lambda ctx: None)
+
+    def user_session(self):
+        return SessionLocal()
+
+    def progress(self, fraction, message=None):
+        self.on_progress(self)
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise jobs.JobCancelled()
+
+    def commit_to_finish(self, message=None):
+        self.check_cancelled()
+
+def _add_transactions(db, user_id, n):
+    for i in range(n):
+        db.add(models.Transaction(id=str(uuid.uuid4()), user_id=user_id, date="2026-01-01", amount=1.0,
+                                  category="Food", description=f"t{i}", type="expense", necessity="variable"))
+    db.commit()
+
+def _user(db, email):
+    db.expire_all()
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def _lock(db, user):
+    user.deletion_requested_at = "2026-01-01T00:00:00"
+    db.commit()
+
+def _count(db, user_id):
+    return db.query(models.Transaction).filter(models.Transaction.user_id == user_id).count()
+
+def _job(db, user, status="running"):
+    job = models.Job(id=str(uuid.uuid4()), user_id=user.id, kind="delete_account", params="{}",
+                     status=status, progress=0.0, cancelRequested=False, createdAt="2026-01-01T00:00:00")
+    db.add(job)
+    db.commit()
+    return job.id
+
+def test_locked_account_is_refused(client, signup, db):
+    headers, email = signup()
+    _lock(db, _user(db, email))
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    assert client.post("/api/auth/login", json={"email": email, "password": "pw"}).status_code == 403
+    # The deletion job can still be followed
+    assert client.get("/api/jobs", headers=headers).status_code == 200
+
+def test_cancel_before_deleting_unlocks_account(signup, db):
+    _, email = signup()
+    user = _user(db, email)
+    _add_transactions(db, user.id, 3)
+    _lock(db, user)
+    ctx = Ctx(user.id)
+    ctx.cancel_requested = True
+    with pytest.raises(jobs.JobCancelled):
+        auth.delete_account_job(ctx)
+    user = _user(db, email)
+    assert user.deletion_requested_at is None
+    assert _count(db, user.id) == 3
+
+def test_cancel_after_first_chunk_is_ignored(signup, db, monkeypatch):
+    monkeypatch.setattr(auth, "DELETE_CHUNK_SIZE", 2)
+    _, email = signup()
+    user = _user(db, email)
+    user_id = user.id
+    _add_transactions(db, user_id, 5)
+    _lock(db, user)
+
+    def cancel(ctx):
+        ctx.cancel_requested = True
+    result = auth.delete_account_job(Ctx(user_id, on_progress=cancel))
+    assert result["deleted"]["transactions"] == 5
+    assert _user(db, email) is None
+    assert _count(db, user_id) == 0
+
+def test_rows_written_during_the_job_are_swept(signup, db, monkeypatch):
+    monkeypatch.setattr(auth, "DELETE_CHUNK_SIZE", 2)
+    _, email = signup()
+    user = _user(db, email)
+    user_id = user.id
+    _add_transactions(db, user_id, 3)
+    _lock(db, user)
+
+    def late_write(ctx):
+        # A request that was authenticated before the lock commits another row
+        if not getattr(ctx, "wrote", False):
+            ctx.wrote = True
+            with SessionLocal() as other:
+                _add_transactions(other, user_id, 1)
+    result = auth.delete_account_job(Ctx(user_id, on_progress=late_write))
+    assert result["deleted"]["transactions"] == 4
+    assert _count(db, user_id) == 0
+
+def test_cancelling_queued_deletion_unlocks(client, signup, db):
+    headers, email = signup()
+    user = _user(db, email)
+    _lock(db, user)
+    job_id = _job(db, user, status="queued")
+    r = client.post(f"/api/jobs/{job_id}/cancel", headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["status"] == "cancelled"
+    assert _user(db, email).deletion_requested_at is None
+
+def test_cancel_after_the_job_commits_to_finish_is_refused(client, signup, db):
+    headers, email = signup()
+    user = _user(db, email)
+    _lock(db, user)
+    job_id = _job(db, user)
+    jobs.JobContext(job_id, user.id, {}, SessionLocal).commit_to_finish()
+    assert client.post(f"/api/jobs/{job_id}/cancel", headers=headers).status_code == 409
+
+def test_cancel_before_the_job_commits_to_finish_wins(client, signup, db):
+    headers, email = signup()
+    user = _user(db, email)
+    _lock(db, user)
+    job_id = _job(db, user)
+    assert client.post(f"/api/jobs/{job_id}/cancel", headers=headers).status_code == 200
+    with pytest.raises(jobs.JobCancelled):
+        jobs.JobContext(job_id, user.id, {}, SessionLocal).commit_to_finish()
@@ -0,0 +1,28 @@
+import json
+from types import SimpleNamespace
+import analytics, events
+
+def _user(user_id):
+    return SimpleNamespace(id=user_id, currency="INR")
+
+def test_frame_loaded_across_an_invalidation_is_not_cached(monkeypatch, client, db):
+    cache = analytics.FrameCache()
+    load = analytics._load
+
+    def load_then_change(db, user):
+        frame = load(db, user)
+        cache.invalidate(user.id)
+        return frame
+
+    monkeypatch.setattr(analytics, "_load", load_then_change)
+    cache.get(db, _user("analytics-race"))
+    assert "analytics-race" not in cache._frames
+
+def test_other_workers_commits_drop_the_frame(client, db):
+    user = _user("analytics-remote")
+    analytics.cache.get(db, user)
+    backend = events.RedisBackend.__new__(events.RedisBackend)
+    backend.broker = events.Broker()
+    message = {"user_id": user.id, "events": [{"resource": "transactions", "op": "created"}], "origin": "another-worker"}
+    backend._on_message({"data": json.dumps(message)})
+    assert user.id not in analytics.cache._frames
@@ -0,0 +1,47 @@
+import time
+import anomalies, models
+
+def _post(client, headers, amount, day="2026-03-01"):
+    r = client.post("/api/transactions", headers=headers, json={
+        "amount": amount, "category": "Food", "description": "Lunch", "merchant": "Cafe", "type": "expense", "date": day,
+    })
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def _stat(db, user_id):
+    db.expire_all()
+    return db.query(models.SpendingStat).filter(models.SpendingStat.id == f"{user_id}:category:Food").first()
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_edits_and_deletes_rebuild_statistics(client, signup, db, monkeypatch):
+    monkeypatch.setattr(anomalies, "REBUILD_DELAY_SECONDS", 0.05)
+    headers, email = signup()
+    user_id = db.query(models.User.id).filter(models.User.email == email).scalar()
+    first = _post(client, headers, 100)
+    second = _post(client, headers, 200)
+    assert _stat(db, user_id).mean == 150
+
+    r = client.put(f"/api/transactions/{second['id']}", headers=headers, json={**second, "amount": 400})
+    assert r.status_code == 200, r.text
+    assert _wait_for(lambda: _stat(db, user_id).mean == 250)
+
+    assert client.delete(f"/api/transactions/{first['id']}", headers=headers).status_code == 200
+    assert _wait_for(lambda: (_stat(db, user_id).n, _stat(db, user_id).mean) == (1, 400))
+
+def test_rebuild_matches_streaming(client, signup, db):
+    headers, email = signup()
+    user_id = db.query(models.User.id).filter(models.User.email == email).scalar()
+    for i, amount in enumerate([120, 80, 95, 300, 60]):
+        _post(client, headers, amount, day=f"2026-03-{i + 1:02d}")
+    streamed = {s.id: (s.n, round(s.mean, 6), round(s.ewma, 6)) for s in db.query(models.SpendingStat).filter(models.SpendingStat.user_id == user_id)}
+    anomalies.rebuild(db, user_id)
+    db.commit()
+    rebuilt = {s.id: (s.n, round(s.mean, 6), round(s.ewma, 6)) for s in db.query(models.SpendingStat).filter(models.SpendingStat.user_id == user_id)}
+    assert rebuilt == streamed
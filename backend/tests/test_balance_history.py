@@ -0,0 +1,97 @@
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from sqlalchemy import text
+import balance_history, fx, models
+
+# 1 EUR = 2 USD = 160 INR, so conversions are exact
+RATES = "date,currency,rate\n2020-01-01,EUR,0.5\n2020-01-01,INR,80\n"
+
+@pytest.fixture
+def user(db, signup, tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_text(RATES)
+    fx.load_file(path)
+    _, email = signup()
+    user = db.query(models.User).filter(models.User.email == email).first()
+    user.current_balance = 1000.0
+    db.commit()
+    return user
+
+def _add(db, user, day, amount, currency=None, type="expense"):
+    t = models.Transaction(id=str(uuid.uuid4()), user_id=user.id, date=day.isoformat(), amount=amount, category="Food",
+                           description="x", type=type, necessity="variable", currency=currency)
+    db.add(t)
+    db.commit()
+    return t
+
+def _expected(db, user, start, end):
+    """Balances replayed from every row, without checkpoints."""
+    rows = db.query(models.Transaction).filter(models.Transaction.user_id == user.id).all()
+    series = []
+    day = start
+    while day <= end:
+        total = Decimal(str(user.current_balance))
+        for t in rows:
+            if t.date[:10] <= day.isoformat():
+                amount = Decimal(str(fx.convert(t.amount, t.currency, t.date, user.currency)))
+                total += amount if t.type == "income" else -amount
+        series.append((day, total))
+        day += timedelta(days=1)
+    return series
+
+def _month_ago(months, day=10):
+    first = date.today().replace(day=1)
+    for _ in range(months):
+        first = (first - timedelta(days=1)).replace(day=1)
+    return first.replace(day=day)
+
+def _fx_months(db, user):
+    return [m for (m,) in db.execute(text("SELECT month FROM balance_fx_checkpoints WHERE user_id = :u ORDER BY month"), {"u": user.id})]
+
+def test_series_matches_full_replay(db, user):
+    _add(db, user, _month_ago(5), 300.0, type="income")
+    _add(db, user, _month_ago(4), 10.0, currency="EUR")
+    _add(db, user, _month_ago(3), 25.5)
+    _add(db, user, _month_ago(2), 2.25, currency="EUR", type="income")
+    start, end = _month_ago(2, day=1), date.today()
+    assert balance_history.daily_series(db, user, start, end) == _expected(db, user, start, end)
+    # Foreign history before the range is read from checkpoints
+    assert _fx_months(db, user)[0] == _month_ago(4).isoformat()[:7]
+
+def test_back_dated_changes_keep_checkpoints_exact(db, user):
+    _add(db, user, _month_ago(4), 10.0, currency="EUR")
+    _add(db, user, _month_ago(1), 50.0)
+    start, end = _month_ago(1, day=1), date.today()
+    balance_history.daily_series(db, user, start, end)
+    assert _fx_months(db, user)
+
+    # A back-dated foreign insert drops the converted checkpoints from its month on
+    late = _add(db, user, _month_ago(3), 4.0, currency="EUR")
+    assert all(m < _month_ago(3).isoformat()[:7] for m in _fx_months(db, user))
+    assert balance_history.daily_series(db, user, start, end) == _expected(db, user, start, end)
+
+    late.amount, late.date = 6.0, _month_ago(2).isoformat()
+    db.commit()
+    assert balance_history.daily_series(db, user, start, end) == _expected(db, user, start, end)
+
+    home = _add(db, user, _month_ago(3), 7.0)
+    db.delete(late)
+    db.commit()
+    assert balance_history.daily_series(db, user, start, end) == _expected(db, user, start, end)
+    db.delete(home)
+    db.commit()
+    assert balance_history.daily_series(db, user, start, end) == _expected(db, user, start, end)
+
+def test_new_rates_rebuild_converted_checkpoints(db, user, tmp_path):
+    _add(db, user, _month_ago(3), 10.0, currency="EUR")
+    start, end = _month_ago(1, day=1), date.today()
+    before = balance_history.daily_series(db, user, start, end)
+    path = tmp_path / "more.csv"
+    path.write_text("date,currency,rate\n2020-01-01,EUR,0.25\n")
+    fx.load_file(path)
+    after = balance_history.daily_series(db, user, start, end)
+    assert after == _expected(db, user, start, end)
+    # 10 EUR is now 3200 INR instead of 1600
+    assert before[0][1] - after[0][1] == 3200 - 1600
@@ -0,0 +1,53 @@
+import models
+
+def _operations(description="Lunch"):
+    return [
+        {"op": "create", "resource": "transactions", "data": {
+            "amount": 250, "category": "Food", "description": description, "type": "expense", "date": "2026-03-01"}},
+        {"op": "create", "resource": "debts", "data": {"personName": "Ravi", "amount": 500, "direction": "receivable"}},
+    ]
+
+def _count(db, model, user_id):
+    return db.query(model).filter(model.user_id == user_id).count()
+
+def test_retry_with_same_key_replays(client, signup, db):
+    headers, email = signup()
+    user_id = db.query(models.User.id).filter(models.User.email == email).scalar()
+    keyed = {**headers, "Idempotency-Key": "entry-1"}
+
+    first = client.post("/api/batch", headers=keyed, json={"operations": _operations()})
+    assert first.status_code == 200, first.text
+    assert first.json()["replayed"] is False
+
+    retry = client.post("/api/batch", headers=keyed, json={"operations": _operations()})
+    assert retry.status_code == 200, retry.text
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["replayed"] is True
+    assert [r["id"] for r in retry.json()["results"]] == [r["id"] for r in first.json()["results"]]
+    assert _count(db, models.Transaction, user_id) == 1
+    assert _count(db, models.Debt, user_id) == 1
+
+def test_same_key_for_another_request_is_rejected(client, signup):
+    headers, _ = signup()
+    keyed = {**headers, "Idempotency-Key": "entry-1"}
+    assert client.post("/api/batch", headers=keyed, json={"operations": _operations()}).status_code == 200
+    r = client.post("/api/batch", headers=keyed, json={"operations": _operations("Dinner")})
+    assert r.status_code == 422
+
+def test_keys_are_per_user(client, signup):
+    a, _ = signup()
+    b, _ = signup()
+    for headers in (a, b):
+        r = client.post("/api/batch", headers={**headers, "Idempotency-Key": "shared"}, json={"operations": _operations()})
+        assert r.status_code == 200 and r.json()["replayed"] is False
+
+def test_failed_batch_applies_nothing_and_can_be_retried(client, signup, db):
+    headers, email = signup()
+    user_id = db.query(models.User.id).filter(models.User.email == email).scalar()
+    keyed = {**headers, "Idempotency-Key": "entry-2"}
+    bad = _operations() + [{"op": "delete", "resource": "goals", "id": "missing"}]
+    assert client.post("/api/batch", headers=keyed, json={"operations": bad}).status_code == 404
+    assert _count(db, models.Transaction, user_id) == 0
+    # Nothing was stored for the key, so a corrected retry runs
+    r = client.post("/api/batch", headers=keyed, json={"operations": _operations()})
+    assert r.status_code == 200 and r.json()["replayed"] is False
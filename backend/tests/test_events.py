@@ -0,0 +1,34 @@
+import uuid
+import pytest
+import events, jobs, models
+from database import SessionLocal
+
+@pytest.fixture
+def published(monkeypatch):
+    """(user_id, event) pairs committed while the test runs."""
+    seen = []
+    monkeypatch.setattr(events, "_listeners", events._listeners + [lambda user_id, batch: seen.extend((user_id, e) for e in batch)])
+    return seen
+
+def _user(db, email):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def test_profile_changes_are_published_without_secrets(client, signup, db, published):
+    headers, email = signup()
+    user_id = _user(db, email).id
+    assert client.put("/api/auth/me", headers=headers, json={"current_balance": 250}).status_code == 200
+    profile = [e for uid, e in published if uid == user_id and e["resource"] == "profile"]
+    assert profile and profile[-1]["op"] == "updated"
+    assert profile[-1]["data"]["current_balance"] == 250
+    assert "hashed_password" not in profile[-1]["data"]
+
+def test_job_progress_is_published_to_its_owner(client, signup, db, published):
+    _, email = signup()
+    user_id = _user(db, email).id
+    job = models.Job(id=str(uuid.uuid4()), user_id=user_id, kind="export", params="{}", status="running",
+                     progress=0.0, cancelRequested=False, createdAt="2026-01-01T00:00:00")
+    db.add(job)
+    db.commit()
+    published.clear()
+    jobs.JobContext(job.id, user_id, {}, SessionLocal).progress(0.5, "Halfway")
+    assert [(uid, e["resource"], e["op"], e["data"]["progress"]) for uid, e in published] == [(user_id, "jobs", "updated", 0.5)]
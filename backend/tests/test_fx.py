@@ -0,0 +1,66 @@
+import uuid
+import pytest
+import fx, models
+
+# 1 EUR = 2 USD = 160 INR; no rates for JPY or XYZ
+RATES = "date,currency,rate\n2020-01-01,EUR,0.5\n2020-01-01,INR,80\n"
+
+@pytest.fixture(autouse=True)
+def rates(client, tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_text(RATES)
+    fx.load_file(path)
+
+def _user(db, email):
+    db.expire_all()
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def _post(client, headers, amount, currency=None):
+    return client.post("/api/transactions", headers=headers, json={
+        "amount": amount, "category": "Food", "description": "Lunch", "type": "expense", "date": "2026-03-01", "currency": currency,
+    })
+
+def _add_row(db, user, amount, currency):
+    # Stored directly: the routes no longer accept rows that cannot be converted
+    db.add(models.Transaction(id=str(uuid.uuid4()), user_id=user.id, date="2026-03-01", amount=amount, category="Food",
+                              description="x", type="expense", necessity="variable", currency=currency))
+    db.commit()
+
+def test_foreign_transaction_needs_rates_for_both_currencies(client, signup):
+    headers, _ = signup()
+    assert client.put("/api/auth/me", headers=headers, json={"currency": "JPY"}).status_code == 200
+    r = _post(client, headers, 10, "EUR")
+    assert r.status_code == 400
+    assert "JPY" in r.json()["detail"]
+
+def test_rows_without_rates_are_left_out_of_reads(client, signup, db):
+    headers, email = signup()
+    assert _post(client, headers, 20, "EUR").status_code == 200
+    _add_row(db, _user(db, email), 5, "XYZ")
+    summary = client.get("/api/transactions/summary", headers=headers, params={"group": "category"})
+    assert summary.status_code == 200
+    assert summary.json()["expense"] == 20 * 160
+    assert client.get("/api/transactions/balance_history", headers=headers).status_code == 200
+    assert client.get("/api/analytics/patterns", headers=headers).status_code == 200
+
+def test_changing_currency_converts_the_users_amounts(client, signup, db):
+    headers, email = signup()
+    client.put("/api/auth/me", headers=headers, json={"currency": "INR", "current_balance": 16000})
+    assert client.post("/api/goals", headers=headers, json={"name": "Trip", "targetAmount": 32000}).status_code == 200
+    assert _post(client, headers, 1600).status_code == 200
+
+    r = client.put("/api/auth/me", headers=headers, json={"currency": "EUR"})
+    assert r.status_code == 200, r.text
+    assert r.json()["current_balance"] == 100
+    assert client.get("/api/goals", headers=headers).json()[0]["targetAmount"] == 200
+    transaction = client.get("/api/transactions", headers=headers).json()[0]
+    assert (transaction["amount"], transaction["currency"]) == (1600, "INR")
+    assert client.get("/api/transactions/summary", headers=headers).json()["expense"] == 10
+    stat = db.query(models.SpendingStat).filter(models.SpendingStat.id == f"{_user(db, email).id}:category:Food").first()
+    assert stat.mean == 10
+
+def test_changing_currency_without_rates_is_refused_while_foreign_rows_exist(client, signup, db):
+    headers, email = signup()
+    assert _post(client, headers, 20, "EUR").status_code == 200
+    assert client.put("/api/auth/me", headers=headers, json={"currency": "JPY"}).status_code == 400
+    assert _user(db, email).currency == "INR"
@@ -0,0 +1,73 @@
+import json
+import pytest
+import ai_service, events, insights, models
+
+@pytest.fixture
+def user(db, signup, monkeypatch):
+    monkeypatch.setattr(ai_service, "get_api_key", lambda: "test")
+    headers, email = signup()
+    return headers, db.query(models.User).filter(models.User.email == email).first()
+
+def _stored(db, user_id, kind="alert"):
+    db.expire_all()
+    return db.query(models.AIInsight).filter(models.AIInsight.id == f"{user_id}:{kind}").first()
+
+def test_reads_do_not_write(client, db, user, monkeypatch):
+    headers, u = user
+    monkeypatch.setattr(insights.scheduler, "request", lambda *args, **kwargs: None)
+    r = client.get("/api/ai/alert", headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["content"] is None and r.json()["stale"] is True
+    assert _stored(db, u.id) is None
+    # The request is recorded by the scheduler in the background
+    insights.scheduler._flush_touches()
+    assert _stored(db, u.id).lastRequestedAt is not None
+
+def test_failed_generation_keeps_previous_result(db, user, monkeypatch):
+    _, u = user
+    async def ok(*args, **kwargs):
+        return "Spending is on track today"
+    async def failing(*args, **kwargs):
+        raise ai_service.GenerationFailed("quota")
+    retries = []
+    monkeypatch.setattr(insights.scheduler, "retry", lambda user_id, kind: retries.append((user_id, kind)))
+
+    monkeypatch.setattr(ai_service, "generate_spending_alert", ok)
+    insights.refresh(u.id, "alert")
+    stored = _stored(db, u.id)
+    computed_at = stored.computedAt
+    assert json.loads(stored.content) == "Spending is on track today"
+
+    monkeypatch.setattr(ai_service, "generate_spending_alert", failing)
+    insights.refresh(u.id, "alert")
+    stored = _stored(db, u.id)
+    assert json.loads(stored.content) == "Spending is on track today"
+    assert stored.computedAt == computed_at
+    assert retries == [(u.id, "alert")]
+
+def test_stale_reads_wait_for_the_retry(monkeypatch):
+    scheduler = insights.Scheduler()
+    monkeypatch.setattr(insights.time, "time", lambda: 1000.0)
+    scheduler.retry("u1", "alert")
+    scheduler.request("u1", "alert")
+    assert scheduler._due[("u1", "alert")] == 1000.0 + insights.RETRY_SECONDS
+    # A refresh already under way is not started twice
+    del scheduler._due[("u1", "alert")]
+    scheduler._running.add(("u1", "alert"))
+    scheduler.request("u1", "alert")
+    assert ("u1", "alert") not in scheduler._due and scheduler.is_pending("u1", "alert")
+    # Once it finishes, reads still wait out the retry delay
+    scheduler._done(("u1", "alert"))
+    scheduler.request("u1", "alert")
+    assert scheduler._due[("u1", "alert")] == 1000.0 + insights.RETRY_SECONDS
+
+def test_failing_listener_does_not_stop_others(db, user, monkeypatch):
+    _, u = user
+    seen = []
+    def broken(user_id, changes):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(events, "_listeners", [broken, lambda user_id, changes: seen.append(user_id)])
+    monkeypatch.setattr(events, "publish", lambda user_id, changes: seen.append(("published", user_id)))
+    db.add(models.Goal(id="g-" + u.id, user_id=u.id, name="Trip", targetAmount=100.0, currentAmount=0.0))
+    db.commit()
+    assert seen == [u.id, ("published", u.id)]
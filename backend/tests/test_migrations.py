@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine, inspect, text
+import migrate_db, search
+
+def _old_database(path):
+    """Tables as they were before amounts moved to integer minor units."""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR, hashed_password VARCHAR, full_name VARCHAR, currency VARCHAR, "
+            "monthly_income FLOAT, current_balance FLOAT, savings_goal FLOAT, financial_literacy VARCHAR, risk_tolerance VARCHAR, goals VARCHAR)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE transactions (id VARCHAR PRIMARY KEY, user_id VARCHAR REFERENCES users(id), date VARCHAR, amount FLOAT, "
+            "category VARCHAR, description VARCHAR, merchant VARCHAR, type VARCHAR, necessity VARCHAR, remarks VARCHAR)"
+        ))
+        conn.execute(text("INSERT INTO users VALUES ('u', 'a@example.com', 'h', 'A', 'INR', 1000.5, 20.25, 0, 'beginner', 'low', '[]')"))
+        conn.execute(text("INSERT INTO transactions VALUES ('t', 'u', '2026-01-05', 12.34, 'Food', 'Lunch', 'Cafe Mocha', 'expense', 'variable', NULL)"))
+    return engine
+
+def test_money_columns_become_integer(tmp_path):
+    engine = _old_database(tmp_path / "old.db")
+    migrate_db.migrate(engine)
+    with engine.connect() as conn:
+        for table, columns in migrate_db.MONEY_COLUMNS.items():
+            types = {c["name"]: str(c["type"]) for c in inspect(conn).get_columns(table)}
+            assert all(types[column] == "INTEGER" for column in columns), (table, types)
+        assert conn.execute(text("SELECT amount, typeof(amount) FROM transactions")).one() == (1234, "integer")
+        assert conn.execute(text("SELECT monthly_income, current_balance FROM users")).one() == (100050, 2025)
+        # Indexes and triggers survive the rebuild
+        names = set(conn.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'transactions'")).scalars())
+        assert {"ix_transactions_user_date", "balance_checkpoints_ai", "transactions_fts_ai"} <= names
+        hits = conn.execute(text(f"SELECT rowid FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH 'mocha'")).all()
+        assert len(hits) == 1
+
+def test_rebuild_is_idempotent(tmp_path):
+    engine = _old_database(tmp_path / "old.db")
+    migrate_db.migrate(engine)
+    with engine.begin() as conn:
+        before = conn.execute(text("SELECT sql FROM sqlite_master ORDER BY name")).all()
+        migrate_db.rebuild_money_columns_as_integer(conn)
+        assert conn.execute(text("SELECT sql FROM sqlite_master ORDER BY name")).all() == before
+
+def test_debts_are_keyed_in_python(tmp_path):
+    engine = _old_database(tmp_path / "old.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE debts (id VARCHAR PRIMARY KEY, user_id VARCHAR, personName VARCHAR, amount FLOAT, "
+            "direction VARCHAR, dueDate VARCHAR, status VARCHAR)"
+        ))
+        conn.execute(text("INSERT INTO debts VALUES ('d1', 'u', 'Élan', 10, 'receivable', NULL, 'active')"))
+        conn.execute(text("INSERT INTO debts VALUES ('d2', 'u', '\tÉLAN ', 5, 'payable', NULL, 'active')"))
+    migrate_db.migrate(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id, counterparty, balance, openCount FROM debt_balances")).all() == [("u:élan", "élan", 500, 2)]
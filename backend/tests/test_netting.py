@@ -0,0 +1,22 @@
+def _debt(client, headers, name, amount, direction="receivable"):
+    r = client.post("/api/debts", headers=headers, json={"personName": name, "amount": amount, "direction": direction})
+    assert r.status_code == 200, r.text
+
+def test_names_group_the_same_in_sql_and_python(client, signup):
+    headers, _ = signup()
+    _debt(client, headers, "Élan", 10)
+    _debt(client, headers, "\tÉLAN ", 4, "payable")
+    balances = client.get("/api/debts/balances", headers=headers).json()
+    assert [(b["counterparty"], b["balance"]) for b in balances] == [("élan", 6)]
+    assert client.get("/api/debts/balances/ÉLAN", headers=headers).json()["balance"] == 6
+    settlement = client.post("/api/debts/settlement", headers=headers, json={
+        "members": ["élan"], "edges": [{"debtor": " ÉLAN", "creditor": "Zoe", "amount": 1}],
+    }).json()
+    assert settlement["net"] == {"me": 6, "Élan": -7, "Zoe": 1}
+
+def test_a_counterparty_named_me_is_kept_apart(client, signup):
+    headers, _ = signup()
+    _debt(client, headers, "me", 10)
+    settlement = client.post("/api/debts/settlement", headers=headers, json={}).json()
+    assert settlement["net"] == {"me": 10, "me (2)": -10}
+    assert settlement["transfers"] == [{"debtor": "me (2)", "creditor": "me", "amount": 10}]
@@ -0,0 +1,49 @@
+from datetime import date
+from types import SimpleNamespace
+import numpy as np
+import occurrences, projections
+
+def test_monthly_clamps_to_short_months():
+    dates = occurrences.dates_between("31", None, date(2026, 1, 1), date(2026, 3, 31))
+    assert dates == [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31)]
+
+def test_monthly_last_working_day():
+    # 2026-05-31 is a Sunday
+    assert occurrences.dates_between("last-working", None, date(2026, 5, 1), date(2026, 5, 31)) == [date(2026, 5, 29)]
+
+def test_weekly_by_name_and_number():
+    start, end = date(2026, 3, 1), date(2026, 3, 31)
+    fridays = [date(2026, 3, 6), date(2026, 3, 13), date(2026, 3, 20), date(2026, 3, 27)]
+    assert occurrences.dates_between("friday", None, start, end, "weekly") == fridays
+    assert occurrences.dates_between("fri", None, start, end, "weekly") == fridays
+    assert occurrences.dates_between("5", None, start, end, "weekly") == fridays
+    assert occurrences.dates_between("2026-01-02", None, start, end, "weekly") == fridays
+
+def test_weekly_respects_end_date():
+    dates = occurrences.dates_between("1", "2026-03-16", date(2026, 3, 1), date(2026, 3, 31), "weekly")
+    assert dates == [date(2026, 3, 2), date(2026, 3, 9), date(2026, 3, 16)]
+
+def test_yearly():
+    start, end = date(2025, 1, 1), date(2026, 12, 31)
+    assert occurrences.dates_between("03-15", None, start, end, "yearly") == [date(2025, 3, 15), date(2026, 3, 15)]
+    assert occurrences.dates_between("2020-02-29", None, start, end, "yearly") == [date(2025, 2, 28), date(2026, 2, 28)]
+    assert occurrences.dates_between("10", None, start, end, "yearly") == [date(2025, 1, 10), date(2026, 1, 10)]
+
+def test_unknown_expected_date_has_no_occurrences():
+    assert occurrences.dates_between("someday", None, date(2026, 1, 1), date(2026, 12, 31), "weekly") == []
+    assert occurrences.dates_between("someday", None, date(2026, 1, 1), date(2026, 12, 31)) == []
+
+def _plan(**fields):
+    return SimpleNamespace(**{"amount": 100.0, "type": "expense", "frequency": "monthly", "expectedDate": "1", "endDate": None, **fields})
+
+def test_contribution_schedule_counts_occurrences_per_month():
+    user = SimpleNamespace(monthly_income=0, savings_goal=None)
+    plans = [
+        _plan(type="income", amount=10000.0),
+        _plan(frequency="weekly", expectedDate="monday"),
+        _plan(frequency="yearly", expectedDate="02-10", amount=1200.0),
+    ]
+    schedule = projections.contribution_schedule(user, plans, 3, date(2026, 1, 15))
+    # Mondays: 4 in January and February 2026, 5 in March
+    expected = np.array([10000 - 400, 10000 - 400 - 1200, 10000 - 500]) * projections.DEFAULT_SAVINGS_RATE
+    assert np.allclose(schedule, expected)
@@ -0,0 +1,63 @@
+import json
+from datetime import date
+import events, retrieval
+
+TODAY = date(2026, 10, 14)  # a Wednesday
+
+def period(message):
+    start, end, _, _, _ = retrieval.parse_filters(message, TODAY)
+    return start, end
+
+def test_week_phrases_need_whole_words():
+    assert period("what did I spend this week?") == (date(2026, 10, 12), TODAY)
+    assert period("plans for this weekend") == (None, None)
+    assert period("todays spending") == (None, None)
+
+def test_may_is_a_month_only_in_context():
+    assert period("may I spend 500 on shoes?") == (None, None)
+    assert period("how much can I save, maybe 10%?") == (None, None)
+    assert period("what did I spend in May") == (date(2026, 5, 1), date(2026, 5, 31))
+    assert period("groceries May 2025") == (date(2025, 5, 1), date(2025, 5, 31))
+
+def test_month_names_and_years():
+    assert period("rent in march") == (date(2026, 3, 1), date(2026, 3, 31))
+    assert period("spending in dec") == (date(2025, 12, 1), date(2025, 12, 31))
+    assert period("november 2024 bills") == (date(2024, 11, 1), date(2024, 11, 30))
+
+def test_amount_bounds_and_kinds():
+    _, _, minimum, maximum, kinds = retrieval.parse_filters("subscriptions over 1.5k but under rs 2,000", TODAY)
+    assert (minimum, maximum) == (1500, 2000)
+    assert "recurring_plans" in kinds
+
+def test_filters_matching_nothing_select_nothing():
+    index = retrieval.Index([
+        ("transactions", {"amount": 40.0, "description": "Coffee"}, "2026-10-10", "coffee"),
+        ("goals", {"name": "Trip", "targetAmount": 500.0}, None, "trip goal"),
+    ])
+    assert retrieval.select(index, "what did I spend over 10k", today=TODAY)[0] == {}
+    assert retrieval.select(index, "how am I doing", today=TODAY)[0] != {}
+
+def test_index_built_across_an_invalidation_is_not_cached(monkeypatch, client, db):
+    user_id = "retrieval-race"
+    load = retrieval._load
+
+    def load_then_change(db, uid):
+        index = load(db, uid)
+        # A commit lands while the index is being built
+        retrieval._invalidate(uid, [{"resource": "transactions", "op": "created"}])
+        return index
+
+    monkeypatch.setattr(retrieval, "_load", load_then_change)
+    retrieval.index_for(db, user_id)
+    assert user_id not in retrieval._cache
+
+def test_other_workers_commits_drop_the_index():
+    user_id = "retrieval-remote"
+    retrieval._cache[user_id] = retrieval.Index([])
+    backend = events.RedisBackend.__new__(events.RedisBackend)
+    backend.broker = events.Broker()
+    message = {"user_id": user_id, "events": [{"resource": "goals", "op": "updated"}]}
+    backend._on_message({"data": json.dumps(dict(message, origin=events.ORIGIN))})
+    assert user_id in retrieval._cache
+    backend._on_message({"data": json.dumps(dict(message, origin="another-worker"))})
+    assert user_id not in retrieval._cache
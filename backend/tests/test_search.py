@@ -0,0 +1,12 @@
+def test_highlights_escape_the_users_text(client, signup):
+    headers, _ = signup()
+    r = client.post("/api/transactions", headers=headers, json={
+        "amount": 5, "category": "Food", "description": "chai <img src=x onerror=alert(1)>", "merchant": "<b>Chai</b> & co",
+        "type": "expense", "date": "2026-03-01",
+    })
+    assert r.status_code == 200, r.text
+    result = client.get("/api/transactions/search", headers=headers, params={"q": "chai"}).json()["results"][0]
+    assert result["snippet"] == "<mark>chai</mark> &lt;img src=x onerror=alert(1)&gt;"
+    assert result["merchant_highlight"] == "&lt;b&gt;<mark>Chai</mark>&lt;/b&gt; &amp; co"
+    # The record itself is returned as stored
+    assert result["description"] == "chai <img src=x onerror=alert(1)>"
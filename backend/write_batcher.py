@@ -0,0 +1,121 @@
+"""
+Group commit for high-rate inserts.
+
+With BUFIN_WRITE_BATCHING=1 the create endpoints hand their mutation to a single
+writer thread instead of committing on the request's own session. The writer
+collects everything submitted within a short window (BUFIN_WRITE_BATCH_WINDOW_MS),
+applies it in one transaction and commits once, so concurrent inserts share one
+fsync and one acquisition of the SQLite write lock. Each caller blocks until its
+batch is committed and then gets its own result back. With several shards, a batch
+is committed as one transaction per shard.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from database import SessionLocal
+
+enabled = os.getenv("BUFIN_WRITE_BATCHING", "0") == "1"
+
+class WriteBatcher:
+    def __init__(self, session_factory=SessionLocal, window_ms=5.0, max_batch=256):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, apply, shard=None):
+        """Queue `apply(db)` on a session for `shard`; the returned future resolves to its result once committed."""
+        future = Future()
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="write-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append((apply, future, shard))
+            self._cond.notify()
+        return future
+
+    def run(self, apply, shard=None):
+        return self.submit(apply, shard).result()
+
+    def add(self, obj, shard=None):
+        def apply(db):
+            db.add(obj)
+            return obj
+        return self.run(apply, shard)
+
+    def stop(self):
+        # Flushes whatever is still queued before the thread exits
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Give concurrent requests a few milliseconds to join this batch
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            by_shard = {}
+            for apply, future, shard in batch:
+                by_shard.setdefault(shard, []).append((apply, future))
+            for shard, items in by_shard.items():
+                self._commit(items, shard)
+
+    def _commit(self, batch, shard=None):
+        db = self.session_factory(expire_on_commit=False, info={"shard": shard})
+        try:
+            applied = []
+            for apply, future in batch:
+                try:
+                    applied.append((future, apply(db)))
+                except Exception as e:
+                    future.set_exception(e)
+            try:
+                db.commit()
+            except Exception:
+                db.rollback()
+                # One bad row (e.g. a duplicate id) must not fail its neighbours:
+                # retry each mutation in its own transaction.
+                for apply, future in batch:
+                    if not future.done():
+                        self._commit_one(apply, future, shard)
+                return
+            for future, result in applied:
+                future.set_result(result)
+        finally:
+            db.close()
+
+    def _commit_one(self, apply, future, shard=None):
+        db = self.session_factory(expire_on_commit=False, info={"shard": shard})
+        try:
+            result = apply(db)
+            db.commit()
+            future.set_result(result)
+        except Exception as e:
+            db.rollback()
+            future.set_exception(e)
+        finally:
+            db.close()
+
+batcher = WriteBatcher(
+    window_ms=float(os.getenv("BUFIN_WRITE_BATCH_WINDOW_MS", "5")),
+    max_batch=int(os.getenv("BUFIN_WRITE_BATCH_MAX", "256")),
+)
@@ -1,7 +1,8 @@
 
-import React, { useMemo, useState } from 'react';
+import React, { useEffect, useMemo, useState } from 'react';
 import { useFinancial } from '../context/FinancialContext';
 import { detectLeaks, findSubscriptions } from '../lib/analysis';
+import { api } from '../lib/api';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Button } from './ui/button';
 import { AlertTriangle, Repeat, Lightbulb, Plus, X, Check, Pencil, Trash2 } from 'lucide-react';
@@ -13,8 +14,21 @@ import remarkGfm from 'remark-gfm';
 const InsightsDashboard = () => {
     const { transactions, recurringPlans, balance, ignoredMerchants, ignoreMerchant, deleteRecurringPlan } = useFinancial();
 
-    const leaks = useMemo(() => detectLeaks(transactions), [transactions]);
-    const rawSubscriptions = useMemo(() => findSubscriptions(transactions, recurringPlans), [transactions, recurringPlans]);
+    // Computed by the server from its cached columnar data; local analysis is the fallback
+    const [serverPatterns, setServerPatterns] = useState(null);
+    useEffect(() => {
+        let cancelled = false;
+        api.getSpendingPatterns()
+            .then(patterns => { if (!cancelled) setServerPatterns(patterns); })
+            .catch(() => { if (!cancelled) setServerPatterns(null); });
+        return () => { cancelled = true; };
+    }, [transactions, recurringPlans]);
+
+    const leaks = useMemo(() => serverPatterns ? serverPatterns.leaks : detectLeaks(transactions), [serverPatterns, transactions]);
+    const rawSubscriptions = useMemo(
+        () => serverPatterns ? serverPatterns.subscriptions : findSubscriptions(transactions, recurringPlans),
+        [serverPatterns, transactions, recurringPlans]
+    );
 
     // Filter out ignored merchants
     const subscriptions = useMemo(() => {
@@ -7,7 +7,7 @@ import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Sparkles, Loader2 } from 'lucide-react';
 
 const NaturalLanguageInput = ({ onManualEntry }) => {
-    const { addTransaction, addRecurringPlan, addDebt } = useFinancial();
+    const { applyBatch } = useFinancial();
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState('');
@@ -22,41 +22,73 @@ const NaturalLanguageInput = ({ onManualEntry }) => {
         try {
             const results = await classifyTransaction(input);
 
-            // Handle array of actions
+            // Handle array of actions: everything from one entry is saved together, or not at all
             const actions = Array.isArray(results) ? results : [results];
+            const operations = [];
 
             for (const action of actions) {
                 if (action.action === 'transaction') {
-                    addTransaction({
-                        amount: action.amount,
-                        category: action.category,
-                        description: action.title || action.merchant || 'Transaction', // Title is the main display
-                        merchant: action.merchant,
-                        type: action.type || 'expense',
-                        date: action.date || new Date().toISOString(),
-                        necessity: 'variable', // Default for quick add
-                        remarks: action.remarks || ''
+                    operations.push({
+                        op: 'create',
+                        resource: 'transactions',
+                        data: {
+                            amount: parseFloat(action.amount),
+                            category: action.category,
+                            description: action.title || action.merchant || 'Transaction', // Title is the main display
+                            merchant: action.merchant,
+                            type: action.type || 'expense',
+                            date: action.date || new Date().toISOString(),
+                            necessity: 'variable', // Default for quick add
+                            remarks: action.remarks || ''
+                        }
                     });
                 } else if (action.action === 'recurring') {
-                    addRecurringPlan({
-                        name: action.name,
-                        amount: parseFloat(action.amount) || 0,
-                        type: action.type,
-                        frequency: action.frequency || 'monthly',
-                        expectedDate: String(action.expectedDate || '1'),
-                        endDate: action.endDate || null
+                    operations.push({
+                        op: 'create',
+                        resource: 'recurring_plans',
+                        data: {
+                            name: action.name,
+                            amount: parseFloat(action.amount) || 0,
+                            type: action.type,
+                            frequency: action.frequency || 'monthly',
+                            expectedDate: String(action.expectedDate || '1'),
+                            endDate: action.endDate || null
+                        }
                     });
                 } else if (action.action === 'debt') {
-                    addDebt({
-                        personName: action.personName,
-                        amount: action.amount,
-                        direction: action.direction,
-                        dueDate: action.dueDate || '',
-                        status: 'active'
+                    operations.push({
+                        op: 'create',
+                        resource: 'debts',
+                        data: {
+                            personName: action.personName,
+                            amount: parseFloat(action.amount),
+                            direction: action.direction,
+                            dueDate: action.dueDate || '',
+                            status: 'active'
+                        }
                     });
+                    // Borrowing (I Owe) -> Income (Cash In), as addDebt does
+                    if (action.direction === 'payable') {
+                        operations.push({
+                            op: 'create',
+                            resource: 'transactions',
+                            data: {
+                                amount: parseFloat(action.amount),
+                                category: 'Income',
+                                description: `Borrowed from ${action.personName}`,
+                                type: 'income',
+                                date: new Date().toISOString(),
+                                necessity: 'variable'
+                            }
+                        });
+                    }
                 }
             }
 
+            if (operations.length > 0) {
+                await applyBatch(operations);
+            }
+
             setInput('');
         } catch (err) {
             console.error(err);
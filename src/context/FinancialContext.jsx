@@ -4,6 +4,12 @@ import { useAuth } from './AuthContext';
 
 const FinancialContext = createContext();
 
+// Replace the item with the same id, or add it (transactions are listed newest first)
+const upsertById = (list, item, prepend = false) =>
+  list.some(existing => existing.id === item.id)
+    ? list.map(existing => existing.id === item.id ? { ...existing, ...item } : existing)
+    : prepend ? [item, ...list] : [...list, item];
+
 export const useFinancial = () => {
   const context = useContext(FinancialContext);
   if (!context) {
@@ -13,7 +19,7 @@ export const useFinancial = () => {
 };
 
 export const FinancialProvider = ({ children }) => {
-  const { user } = useAuth();
+  const { user, refreshUser } = useAuth();
   // State
   const [transactions, setTransactions] = useState([]);
   const [recurringPlans, setRecurringPlans] = useState([]);
@@ -50,46 +56,78 @@ export const FinancialProvider = ({ children }) => {
   };
 
   // Initial Fetch
+  const fetchData = async () => {
+    try {
+      const [txs, plans, dbt, wish, goals] = await Promise.all([
+        api.getTransactions(),
+        api.getRecurringPlans(),
+        api.getDebts(),
+        api.getWishlist(),
+        api.getGoals()
+      ]);
+      setTransactions(txs);
+      setRecurringPlans(plans);
+      setDebts(dbt);
+      setWishlist(wish);
+      setSavingsGoals(goals);
+    } catch (error) {
+      console.error("Failed to fetch initial data:", error);
+    }
+  };
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const [txs, plans, dbt, wish, goals] = await Promise.all([
-          api.getTransactions(),
-          api.getRecurringPlans(),
-          api.getDebts(),
-          api.getWishlist(),
-          api.getGoals()
-        ]);
-        setTransactions(txs);
-        setRecurringPlans(plans);
-        setDebts(dbt);
-        setWishlist(wish);
-        setSavingsGoals(goals);
-      } catch (error) {
-        console.error("Failed to fetch initial data:", error);
-      }
-    };
     fetchData();
   }, []);
 
+  // Live updates from other tabs and devices. Applying an event is idempotent, so our
+  // own changes arriving back are harmless.
+  const setters = {
+    transactions: setTransactions,
+    recurring_plans: setRecurringPlans,
+    debts: setDebts,
+    wishlist: setWishlist,
+    goals: setSavingsGoals,
+  };
+
+  useEffect(() => {
+    if (!user) return;
+    return api.subscribeEvents((event) => {
+      if (event.resource === 'profile') {
+        refreshUser();
+        return;
+      }
+      const setList = setters[event.resource];
+      if (event.op === 'resync' || (setList && event.op === 'invalidated')) {
+        fetchData();
+      } else if (setList && event.op === 'deleted') {
+        setList(prev => prev.filter(item => item.id !== event.id));
+      } else if (setList) {
+        setList(prev => upsertById(prev, event.data, event.resource === 'transactions'));
+      }
+    });
+  }, [user?.id]);
+
   // Actions
+  // AI Duplicate Detection: a repeat of a recent transaction suggests making it a recurring plan
+  const suggestIfDuplicate = (transaction) => {
+    const isDuplicate = transactions.some(t =>
+      t.amount === parseFloat(transaction.amount) &&
+      (t.merchant === transaction.merchant || t.description === transaction.description) &&
+      t.type === transaction.type &&
+      new Date(t.date) > new Date(Date.now() - 30 * 24 * 60 * 60 * 1000) // Last 30 days
+    );
+
+    if (isDuplicate) {
+      setRecurringSuggestion({
+        name: transaction.merchant || transaction.description,
+        amount: parseFloat(transaction.amount),
+        type: transaction.type
+      });
+    }
+  };
+
   const addTransaction = async (transaction) => {
     try {
-      // AI Duplicate Detection
-      const isDuplicate = transactions.some(t =>
-        t.amount === parseFloat(transaction.amount) &&
-        (t.merchant === transaction.merchant || t.description === transaction.description) &&
-        t.type === transaction.type &&
-        new Date(t.date) > new Date(Date.now() - 30 * 24 * 60 * 60 * 1000) // Last 30 days
-      );
-
-      if (isDuplicate) {
-        setRecurringSuggestion({
-          name: transaction.merchant || transaction.description,
-          amount: parseFloat(transaction.amount),
-          type: transaction.type
-        });
-      }
+      suggestIfDuplicate(transaction);
 
       const newTx = await api.createTransaction({
         ...transaction,
@@ -97,7 +135,7 @@ export const FinancialProvider = ({ children }) => {
         necessity: transaction.necessity || 'variable',
         remarks: transaction.remarks || ''
       });
-      setTransactions(prev => [newTx, ...prev]);
+      setTransactions(prev => [newTx, ...prev.filter(t => t.id !== newTx.id)]);
 
       // If duplicate, maybe we can trigger a "suggestion" state?
       // For now, I'll leave the hook here.
@@ -141,7 +179,7 @@ export const FinancialProvider = ({ children }) => {
   const addRecurringPlan = async (plan) => {
     try {
       const newPlan = await api.createRecurringPlan(plan);
-      setRecurringPlans(prev => [...prev, newPlan]);
+      setRecurringPlans(prev => upsertById(prev, newPlan));
     } catch (error) {
       console.error("Failed to add recurring plan:", error);
     }
@@ -168,7 +206,7 @@ export const FinancialProvider = ({ children }) => {
   const addDebt = async (debt) => {
     try {
       const newDebt = await api.createDebt(debt);
-      setDebts(prev => [...prev, newDebt]);
+      setDebts(prev => upsertById(prev, newDebt));
 
       // 1. Borrowing (I Owe) -> Income (Cash In)
       if (debt.direction === 'payable') {
@@ -192,6 +230,26 @@ export const FinancialProvider = ({ children }) => {
     }
   };
 
+  // Several changes in one request and one DB transaction, e.g. everything from one AI Quick Add entry.
+  // operations: [{ op: 'create' | 'update' | 'delete', resource, id?, data? }]
+  const applyBatch = async (operations) => {
+    const { results } = await api.applyBatch(operations);
+    for (const operation of operations) {
+      if (operation.op === 'create' && operation.resource === 'transactions') {
+        suggestIfDuplicate(operation.data);
+      }
+    }
+    for (const result of results) {
+      const setList = setters[result.resource];
+      if (result.op === 'delete') {
+        setList(prev => prev.filter(item => item.id !== result.id));
+      } else {
+        setList(prev => upsertById(prev, result.data, result.resource === 'transactions'));
+      }
+    }
+    return results;
+  };
+
   const updateDebt = async (id, updatedDebt) => {
     try {
       const updated = await api.updateDebt(id, updatedDebt);
@@ -254,7 +312,7 @@ export const FinancialProvider = ({ children }) => {
         ...item,
         addedAt: new Date().toISOString()
       });
-      setWishlist(prev => [...prev, newItem]);
+      setWishlist(prev => upsertById(prev, newItem));
     } catch (error) {
       console.error("Failed to add wishlist item:", error);
     }
@@ -273,7 +331,7 @@ export const FinancialProvider = ({ children }) => {
   const addSavingsGoal = async (goal) => {
     try {
       const newGoal = await api.createGoal(goal);
-      setSavingsGoals(prev => [...prev, newGoal]);
+      setSavingsGoals(prev => upsertById(prev, newGoal));
     } catch (error) {
       console.error("Failed to add savings goal:", error);
     }
@@ -396,6 +454,7 @@ export const FinancialProvider = ({ children }) => {
       addRecurringPlan,
       debts,
       addDebt,
+      applyBatch,
       updateDebt,
       deleteDebt,
       repayDebt,
@@ -78,6 +78,98 @@ export const api = {
         if (!response.ok) throw new Error('Failed to fetch transactions');
         return response.json();
     },
+    queryTransactions: async (filters = {}) => {
+        // filters: { start_date, end_date, category: [...], type, necessity, min_amount, max_amount, sort, skip, limit }
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams();
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value === undefined || value === null || value === '') return;
+            if (Array.isArray(value)) value.forEach(v => params.append(key, v));
+            else params.set(key, value);
+        });
+        const response = await fetch(`${API_URL}/transactions/query?${params}`, { headers });
+        if (!response.ok) throw new Error('Failed to query transactions');
+        return response.json();
+    },
+    getTransactionSummary: async (group = 'month', filters = {}) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams({ group, ...filters });
+        const response = await fetch(`${API_URL}/transactions/summary?${params}`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch transaction summary');
+        return response.json();
+    },
+    getBalanceHistory: async (startDate, endDate) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams({ start_date: startDate, end_date: endDate });
+        const response = await fetch(`${API_URL}/transactions/balance_history?${params}`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch balance history');
+        return response.json();
+    },
+    // Pushes change events ({ resource, op, id, data }) for the signed-in user; returns an unsubscribe function.
+    // Reconnects with backoff and reports { op: 'resync' } after a reconnect, since events may have been missed.
+    subscribeEvents: (onEvent) => {
+        let socket = null;
+        let retryDelay = 1000;
+        let stopped = false;
+        const connect = (reconnecting) => {
+            const token = localStorage.getItem('token');
+            if (!token || stopped) return;
+            socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/events?token=${encodeURIComponent(token)}`);
+            socket.onopen = () => {
+                retryDelay = 1000;
+                if (reconnecting) onEvent({ op: 'resync' });
+            };
+            socket.onmessage = (message) => {
+                const event = JSON.parse(message.data);
+                if (event.op !== 'ping') onEvent(event);
+            };
+            socket.onclose = () => {
+                if (stopped) return;
+                setTimeout(() => connect(true), retryDelay);
+                retryDelay = Math.min(retryDelay * 2, 30000);
+            };
+        };
+        connect(false);
+        return () => {
+            stopped = true;
+            if (socket) socket.close();
+        };
+    },
+    getAlerts: async (unseenOnly = false) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/alerts?unseen_only=${unseenOnly}`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch alerts');
+        return response.json();
+    },
+    getSpendingPatterns: async () => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/analytics/patterns`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch spending patterns');
+        return response.json();
+    },
+    markAlertSeen: async (id) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/alerts/${id}/seen`, {
+            method: 'POST',
+            headers
+        });
+        if (!response.ok) throw new Error('Failed to mark alert as seen');
+        return response.json();
+    },
+    searchTransactions: async (query, limit = 20) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams({ q: query, limit });
+        const response = await fetch(`${API_URL}/transactions/search?${params}`, { headers });
+        if (!response.ok) throw new Error('Failed to search transactions');
+        return response.json();
+    },
     createTransaction: async (transaction) => {
         const token = localStorage.getItem('token');
         const headers = {
@@ -92,6 +184,29 @@ export const api = {
         if (!response.ok) throw new Error('Failed to create transaction');
         return response.json();
     },
+    // Applies create/update/delete operations atomically. Network errors and 5xx responses are
+    // retried with the same Idempotency-Key, so an operation is never applied twice.
+    applyBatch: async (operations, idempotencyKey = crypto.randomUUID(), attempts = 3) => {
+        const token = localStorage.getItem('token');
+        const headers = {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey,
+            ...(token ? { 'Authorization': `Bearer ${token}` } : {})
+        };
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(`${API_URL}/batch`, {
+                    method: 'POST',
+                    headers,
+                    body: JSON.stringify({ operations }),
+                });
+                if (response.status < 500 || attempt >= attempts) return handleResponse(response);
+            } catch (error) {
+                if (attempt >= attempts) throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+        }
+    },
     updateTransaction: async (id, transaction) => {
         const token = localStorage.getItem('token');
         const headers = {
@@ -125,6 +240,14 @@ export const api = {
         if (!response.ok) throw new Error('Failed to fetch recurring plans');
         return response.json();
     },
+    getRecurringOccurrences: async (start, end) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams({ start, end });
+        const response = await fetch(`${API_URL}/recurring_plans/occurrences?${params}`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch recurring occurrences');
+        return response.json();
+    },
     createRecurringPlan: async (plan) => {
         const token = localStorage.getItem('token');
         const headers = {
@@ -177,6 +300,27 @@ export const api = {
         if (!response.ok) throw new Error('Failed to fetch debts');
         return response.json();
     },
+    getDebtBalances: async () => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/debts/balances`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch debt balances');
+        return response.json();
+    },
+    getDebtSettlement: async (members = null, edges = []) => {
+        const token = localStorage.getItem('token');
+        const headers = {
+            'Content-Type': 'application/json',
+            ...(token ? { 'Authorization': `Bearer ${token}` } : {})
+        };
+        const response = await fetch(`${API_URL}/debts/settlement`, {
+            method: 'POST',
+            headers,
+            body: JSON.stringify({ members, edges }),
+        });
+        if (!response.ok) throw new Error('Failed to compute debt settlement');
+        return response.json();
+    },
     createDebt: async (debt) => {
         const token = localStorage.getItem('token');
         const headers = {
@@ -224,6 +368,14 @@ export const api = {
         if (!response.ok) throw new Error('Failed to fetch goals');
         return response.json();
     },
+    getGoalProjections: async (paths = 2000, horizonYears = 30) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams({ paths, horizon_years: horizonYears });
+        const response = await fetch(`${API_URL}/goals/projections?${params}`, { headers });
+        if (!response.ok) throw new Error('Failed to fetch goal projections');
+        return response.json();
+    },
     createGoal: async (goal) => {
         const token = localStorage.getItem('token');
         const headers = {
@@ -271,6 +423,23 @@ export const api = {
         if (!response.ok) throw new Error('Failed to fetch wishlist');
         return response.json();
     },
+    getWishlistAffordability: async (sequential = false) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/wishlist/affordability?sequential=${sequential}`, { headers });
+        if (!response.ok) throw new Error('Failed to evaluate wishlist');
+        return response.json();
+    },
+    explainWishlistItem: async (id) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/wishlist/${id}/explain`, {
+            method: 'POST',
+            headers
+        });
+        if (!response.ok) throw new Error('Failed to explain wishlist item');
+        return response.json();
+    },
     createWishlistItem: async (item) => {
         const token = localStorage.getItem('token');
         const headers = {
@@ -296,6 +465,17 @@ export const api = {
         return response.json();
     },
 
+    // Export
+    exportData: async (format = 'ndjson', entities = null) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const params = new URLSearchParams({ format });
+        if (entities) params.set('entities', entities);
+        const response = await fetch(`${API_URL}/export?${params}`, { headers });
+        if (!response.ok) throw new Error('Export failed');
+        return response.blob();
+    },
+
     // AI
     classifyTransaction: async (text) => {
         const response = await fetch(`${API_URL}/ai/classify`, {
@@ -315,6 +495,14 @@ export const api = {
         if (!response.ok) throw new Error('AI analysis failed');
         return response.json();
     },
+    // Precomputed alert / tips: { kind, content, computedAt, stale, refreshing }
+    getInsight: async (kind) => {
+        const token = localStorage.getItem('token');
+        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+        const response = await fetch(`${API_URL}/ai/${kind}`, { headers });
+        if (!response.ok) throw new Error(`Failed to fetch ${kind}`);
+        return response.json();
+    },
     generateSpendingAlert: async (transactions, balance, recurringPlans) => {
         const response = await fetch(`${API_URL}/ai/alert`, {
             method: 'POST',
@@ -334,9 +522,11 @@ export const api = {
         return response.json();
     },
     coachChat: async (message, mode, context) => {
+        // Signed in, the server picks the context relevant to the message itself
+        const token = localStorage.getItem('token');
         const response = await fetch(`${API_URL}/coach/chat`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', ...(token ? { 'Authorization': `Bearer ${token}` } : {}) },
             body: JSON.stringify({ message, mode, context }),
         });
         if (!response.ok) throw new Error('Coach chat failed');
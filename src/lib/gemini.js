@@ -1,8 +1,20 @@
 import { api } from './api';
 
+// The server computes alerts and tips in the background; on the very first request there
+// is nothing stored yet, so wait briefly for the refresh it schedules.
+const readInsight = async (kind, attempts = 5) => {
+    for (let attempt = 1; ; attempt++) {
+        const insight = await api.getInsight(kind);
+        if (insight.content !== null || !insight.refreshing || attempt >= attempts) return insight.content;
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+};
+
 export const generateFinancialTips = async (transactions, balance) => {
     try {
-        return await api.generateFinancialTips(transactions, balance);
+        const tips = await readInsight('tips');
+        if (!Array.isArray(tips)) throw new Error('Tips not available yet');
+        return tips;
     } catch (error) {
         console.error("Error generating tips:", error);
         return ["Track your daily expenses to identify leaks.", "Try to save 20% of your income.", "Review your subscriptions monthly."];
@@ -30,7 +42,7 @@ export const analyzePurchase = async (query, financialContext) => {
 
 export const generateSpendingAlert = async (transactions, balance, recurringPlans) => {
     try {
-        return await api.generateSpendingAlert(transactions, balance, recurringPlans);
+        return await readInsight('alert');
     } catch (error) {
         console.error("Alert generation failed", error);
         return null;